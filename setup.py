@@ -87,6 +87,7 @@ setup(
             'superflore-gen-ebuilds = superflore.generators.ebuild:main',
             'superflore-gen-oe-recipes = superflore.generators.bitbake:main',
             'superflore-check-ebuilds = superflore.test_integration.gentoo:main',
+            'superflore-snapshot = superflore.snapshot:main',
         ]
     }
 )
@@ -12,30 +12,127 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from collections.abc import MutableMapping
+import fcntl
 import os
 import pickle
+import sqlite3
+import threading
 
 from superflore.utils import info
 
+SQLITE_HEADER = b'SQLite format 3\x00'
+# keys are looked up by their pickled form, which must not change
+KEY_PROTOCOL = 3
+
+
+class SqliteCache(MutableMapping):
+    """
+    A dict kept in an SQLite database: each entry is committed as soon
+    as it is set, and several threads or processes can share the file.
+    """
+    def __init__(self, filename):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(
+            filename, timeout=60, isolation_level=None,
+            check_same_thread=False
+        )
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS cache '
+            '(key BLOB PRIMARY KEY, value BLOB NOT NULL)'
+        )
+
+    @staticmethod
+    def _key(key):
+        return pickle.dumps(key, protocol=KEY_PROTOCOL)
+
+    def __getitem__(self, key):
+        with self.lock:
+            row = self.db.execute(
+                'SELECT value FROM cache WHERE key = ?', (self._key(key),)
+            ).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return pickle.loads(row[0])
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            self.db.execute(
+                'INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)',
+                (self._key(key), pickle.dumps(value))
+            )
+
+    def __delitem__(self, key):
+        with self.lock:
+            cursor = self.db.execute(
+                'DELETE FROM cache WHERE key = ?', (self._key(key),))
+        if cursor.rowcount == 0:
+            raise KeyError(key)
+
+    def __iter__(self):
+        with self.lock:
+            rows = self.db.execute('SELECT key FROM cache').fetchall()
+        return iter([pickle.loads(row[0]) for row in rows])
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+
+    def update_all(self, entries):
+        """Set all of the entries in a single transaction"""
+        with self.lock:
+            self.db.execute('BEGIN')
+            self.db.executemany(
+                'INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)',
+                [(self._key(k), pickle.dumps(v)) for k, v in entries.items()]
+            )
+            self.db.execute('COMMIT')
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
 
 class CacheManager:
     def __init__(self, filename):
         self.filename = filename
         self.cache = dict()
 
+    def _migrate_pickle(self):
+        """Replace a cache file written by older versions by a database"""
+        with open(self.filename, 'rb') as cache_file:
+            if cache_file.read(len(SQLITE_HEADER)) == SQLITE_HEADER:
+                return
+            cache_file.seek(0)
+            if not cache_file.read(1):
+                # an empty file, nothing to migrate
+                os.remove(self.filename)
+                return
+            cache_file.seek(0)
+            entries = pickle.load(cache_file)
+        info("Migrating cached file '%s' to SQLite" % self.filename)
+        tmp_filename = '%s.%d.tmp' % (self.filename, os.getpid())
+        tmp_cache = SqliteCache(tmp_filename)
+        tmp_cache.update_all(entries)
+        tmp_cache.db.execute('PRAGMA journal_mode=DELETE')
+        tmp_cache.close()
+        os.replace(tmp_filename, self.filename)
+
     def __enter__(self):
-        # load the initial cache, if it exists
-        if self.filename and os.path.isfile(self.filename):
+        # open the cache database, creating it if it doesn't exist yet
+        if self.filename:
             info("Loading cached file '%s'" % self.filename)
-            self.cache_file = open(self.filename, 'rb')
-            self.cache = pickle.load(self.cache_file)
-            self.cache_file.close()
+            # keep concurrent runs from migrating the same file at once
+            with open(self.filename + '.lock', 'w') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                if os.path.isfile(self.filename):
+                    self._migrate_pickle()
+                self.cache = SqliteCache(self.filename)
         return self.cache
 
     def __exit__(self, *args):
-        # save the cache, if it exists
+        # every entry is already saved, just close the database
         if self.filename:
-            info("Saving cached file '%s'" % self.filename)
-            self.cache_file = open(self.filename, 'wb')
-            pickle.dump(self.cache, self.cache_file)
-            self.cache_file.close()
+            info("Closing cached file '%s'" % self.filename)
+            self.cache.close()
@@ -0,0 +1,114 @@
+# Copyright 2020 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+
+from superflore.output_writer import get_output_writer
+from superflore.utils import info
+
+
+class Checkpoint(object):
+    """
+    Journal of the packages a generation run has finished with, one JSON
+    object per line, written as each package is done.
+
+    When resuming, the journal of the interrupted run is read back so that
+    its results can be replayed instead of generating the packages again.
+    Otherwise, the journal is started afresh.
+    """
+    def __init__(
+        self, filename, resume=False, get_data=None, restore_data=None
+    ):
+        self.filename = filename
+        self.resume = resume
+        # callables supplied by the generator:
+        #  get_data(current) -> data to keep for a generated package
+        #  restore_data(data) -> restore it when the package is replayed
+        self.get_data = get_data
+        self.restore_data = restore_data
+        self.entries = dict()
+        self.journal = None
+        # (write futures, line) of the entries held back until the files
+        # of their package are on disk
+        self.pending = list()
+
+    def __enter__(self):
+        if self.resume and os.path.isfile(self.filename):
+            with open(self.filename, 'r') as journal:
+                for line in journal:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # the run died while writing this line
+                        continue
+                    self.entries[(entry['distro'], entry['pkg'])] = entry
+            info("Resuming from checkpoint '%s' (%d packages done)" % (
+                self.filename, len(self.entries)))
+            self.journal = open(self.filename, 'a')
+        else:
+            self.journal = open(self.filename, 'w')
+        return self
+
+    def __exit__(self, *args):
+        self._write_pending(flush=True)
+        self.journal.close()
+
+    def _write_pending(self, flush=False):
+        if flush:
+            get_output_writer().flush()
+        while self.pending and all(
+            future.done() for future in self.pending[0][0]
+        ):
+            written, line = self.pending.pop(0)
+            # a package whose files couldn't be written isn't done
+            if not any(future.exception() for future in written):
+                self.journal.write(line)
+        self.journal.flush()
+
+    def get(self, distro, pkg, version):
+        """
+        Return the entry of pkg written by the interrupted run, if it was
+        generated from the same version.
+        """
+        entry = self.entries.get((distro.name, pkg))
+        if entry and entry['version'] == version:
+            return entry
+        return None
+
+    def add(
+        self, distro, pkg, version, result, current=None, written=(),
+        **fields
+    ):
+        """
+        Record that pkg is done; result is one of the replay results. The
+        entry is written once the write futures of its files (see
+        OutputWriter.write()) are done, and dropped if any of them failed.
+        """
+        entry = dict(fields)
+        entry.update({
+            'distro': distro.name,
+            'pkg': pkg,
+            'version': version,
+            'result': result,
+        })
+        if current and self.get_data:
+            entry['data'] = self.get_data(current)
+        self.pending.append((
+            list(written), json.dumps(entry, sort_keys=True) + '\n'))
+        self._write_pending()
+
+    def restore(self, entry):
+        if self.restore_data and entry.get('data') is not None:
+            self.restore_data(entry['data'])
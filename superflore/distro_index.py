@@ -0,0 +1,104 @@
+# Copyright 2020 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+
+from rosdistro.dependency_walker import DependencyWalker
+from rosinstall_generator.distro import get_package_names
+
+dependency_types = [
+    'buildtool', 'build', 'build_export', 'buildtool_export',
+    'exec', 'run', 'test'
+]
+
+# DependencyIndex instances, keyed by distro name and condition context
+dependency_indexes = dict()
+dependency_indexes_lock = threading.Lock()
+# PackageIndex instances, keyed by distro name
+package_indexes = dict()
+package_indexes_lock = threading.Lock()
+
+
+class PackageIndex(object):
+    """
+    The packages of a distro: the released and unreleased package names
+    as frozensets, and tables from each released package to its
+    repository name and release version.
+    """
+    def __init__(self, distro):
+        self.distro = distro
+        released, unreleased = get_package_names(distro)
+        self.released = frozenset(released)
+        self.unreleased = frozenset(unreleased)
+        self.repositories = dict()
+        self.versions = dict()
+        for pkg_name in released:
+            repo_name = distro.release_packages[pkg_name].repository_name
+            repo = distro.repositories[repo_name].release_repository
+            self.repositories[pkg_name] = repo_name
+            self.versions[pkg_name] = repo.version
+
+    def __contains__(self, pkg_name):
+        return pkg_name in self.released
+
+    def __len__(self):
+        return len(self.released)
+
+
+def get_package_index(distro):
+    """Return the PackageIndex shared by everything using the distro"""
+    with package_indexes_lock:
+        index = package_indexes.get(distro.name)
+        if not index or index.distro is not distro:
+            package_indexes[distro.name] = PackageIndex(distro)
+        return package_indexes[distro.name]
+
+
+class DependencyIndex(object):
+    """
+    The dependencies of every package of a distro, of every type.
+
+    A single DependencyWalker serves the whole distro, so each
+    package.xml is parsed, and its conditions evaluated, only once. All
+    dependency types of a package are indexed the first time one of them
+    is asked for.
+    """
+    def __init__(self, distro, evaluate_condition_context=None):
+        self.distro = distro
+        self.walker = DependencyWalker(
+            distro, evaluate_condition_context=evaluate_condition_context)
+        self.depends = dict()
+        self.lock = threading.Lock()
+
+    def get_depends(self, pkg_name, dep_type):
+        """Return the frozenset of dependencies of type dep_type"""
+        with self.lock:
+            if pkg_name not in self.depends:
+                self.depends[pkg_name] = {
+                    t: frozenset(self.walker.get_depends(pkg_name, t))
+                    for t in dependency_types
+                }
+            return self.depends[pkg_name][dep_type]
+
+
+def get_dependency_index(distro, evaluate_condition_context=None):
+    """Return the DependencyIndex shared by everything using the distro"""
+    key = (distro.name, tuple(sorted(
+        (evaluate_condition_context or dict()).items())))
+    with dependency_indexes_lock:
+        index = dependency_indexes.get(key)
+        if not index or index.distro is not distro:
+            dependency_indexes[key] = DependencyIndex(
+                distro, evaluate_condition_context)
+        return dependency_indexes[key]
@@ -0,0 +1,128 @@
+# Copyright 2020 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import json
+import os
+
+from superflore.distro_index import dependency_types
+from superflore.distro_index import get_dependency_index
+from superflore.distro_index import get_package_index
+from superflore.exceptions import UnresolvedDependency
+from superflore.utils import get_superflore_version
+from superflore.utils import info
+from superflore.utils import resolve_dep
+
+
+class FingerprintStore(object):
+    """
+    Fingerprints of the inputs each package was last generated from:
+    its release version, package.xml, dependencies and what their rosdep
+    keys resolve to, and the superflore version.
+
+    When the fingerprint of a package matches the stored one, its
+    installer doesn't need to be generated again. The fingerprints are
+    kept in a JSON file between runs, together with any data the
+    generator needs to restore for the packages it skips.
+    """
+    def __init__(
+        self, filename, os_name, incremental=False,
+        evaluate_condition_context=None, get_extra_inputs=None,
+        get_data=None, restore_data=None
+    ):
+        self.filename = filename
+        self.os_name = os_name
+        self.incremental = incremental
+        self.evaluate_condition_context = evaluate_condition_context
+        # callables supplied by the generator:
+        #  get_extra_inputs(distro, pkg) -> other inputs of the installer
+        #  get_data(current) -> data to keep for a generated package
+        #  restore_data(data) -> restore it when the package is skipped
+        self.get_extra_inputs = get_extra_inputs
+        self.get_data = get_data
+        self.restore_data = restore_data
+        self.fingerprints = dict()
+
+    def __enter__(self):
+        if self.filename and os.path.isfile(self.filename):
+            info("Loading fingerprints from '%s'" % self.filename)
+            with open(self.filename, 'r') as fingerprint_file:
+                self.fingerprints = json.load(fingerprint_file)
+        return self
+
+    def __exit__(self, *args):
+        if self.filename:
+            info("Saving fingerprints to '%s'" % self.filename)
+            tmp_filename = self.filename + '.tmp'
+            with open(tmp_filename, 'w') as fingerprint_file:
+                json.dump(self.fingerprints, fingerprint_file, sort_keys=True)
+            os.replace(tmp_filename, self.filename)
+
+    def get_fingerprint(self, distro, pkg):
+        index = get_dependency_index(
+            distro, self.evaluate_condition_context)
+        pkg_index = get_package_index(distro)
+        pkg_xml = distro.get_release_package_xml(pkg) or ''
+        if isinstance(pkg_xml, str):
+            pkg_xml = pkg_xml.encode()
+        inputs = {
+            'version': pkg_index.versions[pkg],
+            'package_xml': hashlib.sha256(pkg_xml).hexdigest(),
+            'superflore': get_superflore_version(),
+            'depends': dict(),
+            'resolved': dict(),
+        }
+        for dep_type in dependency_types:
+            deps = sorted(index.get_depends(pkg, dep_type))
+            inputs['depends'][dep_type] = deps
+            for dep in deps:
+                if dep in pkg_index or dep in inputs['resolved']:
+                    continue
+                try:
+                    inputs['resolved'][dep] = sorted(
+                        resolve_dep(dep, self.os_name, distro.name)[0])
+                except UnresolvedDependency:
+                    inputs['resolved'][dep] = None
+        if self.get_extra_inputs:
+            inputs['extra'] = self.get_extra_inputs(distro, pkg)
+        text = json.dumps(inputs, sort_keys=True)
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def is_current(self, distro, pkg):
+        """
+        Return True if pkg was generated from the same inputs last time.
+        When it was, the data stored for it is restored.
+        """
+        entry = self.fingerprints.get(distro.name, dict()).get(pkg)
+        if not entry:
+            return False
+        if entry['fingerprint'] != self.get_fingerprint(distro, pkg):
+            return False
+        if self.restore_data and entry.get('data') is not None:
+            self.restore_data(entry['data'])
+        return True
+
+    def record(self, distro, pkg, current):
+        """Remember the inputs pkg was just generated from"""
+        entry = {'fingerprint': self.get_fingerprint(distro, pkg)}
+        if self.get_data:
+            entry['data'] = self.get_data(current)
+        self.fingerprints.setdefault(distro.name, dict())[pkg] = entry
+
+    def forget(self, distro, pkg):
+        """Make sure pkg gets generated again next time"""
+        self.fingerprints.get(distro.name, dict()).pop(pkg, None)
+
+    def get_packages(self, distro):
+        return set(self.fingerprints.get(distro.name, dict()).keys())
@@ -12,8 +12,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from rosinstall_generator.distro import get_package_names
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from superflore.distro_index import get_package_index
 from superflore.exceptions import UnknownBuildType
+from superflore.package_xml import prefetch_package_xmls
+from superflore.pipeline import Pipeline
+from superflore.timing import timed
 from superflore.utils import err
 from superflore.utils import get_pkg_version
 from superflore.utils import info
@@ -21,6 +27,38 @@ from superflore.utils import ok
 from superflore.utils import warn
 
 
+def _gen_pkg_results(pkgs, jobs, stages, gen_pkg_func, overlay, *args):
+    """
+    Yield a callable returning the result of gen_pkg_func for each package.
+
+    With more than one job, the packages are generated concurrently, but
+    the results are still handed back in the order of pkgs, so that the
+    caller sees the same sequence as a serial run. When the generator
+    splits gen_pkg_func into stages, they run as a pipeline in which only
+    the stages marked as parallel get more than one worker.
+    """
+    if jobs <= 1:
+        for i, pkg in pkgs:
+            yield i, pkg, partial(gen_pkg_func, overlay, pkg, *args)
+        return
+    if stages:
+        pipeline = Pipeline(
+            [(func, jobs if parallel else 1) for func, parallel in stages],
+            queue_depth=4 * jobs
+        )
+        results = pipeline.run((overlay, pkg) + args for _, pkg in pkgs)
+        for (i, pkg), get_result in zip(pkgs, results):
+            yield i, pkg, get_result
+        return
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [
+            (i, pkg, executor.submit(gen_pkg_func, overlay, pkg, *args))
+            for i, pkg in pkgs
+        ]
+        for i, pkg, future in futures:
+            yield i, pkg, future.result
+
+
 def generate_installers(
     distro,                  # ros distro
     overlay,                 # repo instance
@@ -30,8 +68,8 @@ def generate_installers(
     **kwargs                 # any additional keyword arguments
 ):
     distro_name = distro.name
-    pkg_names = get_package_names(distro)
-    total = float(len(pkg_names[0]))
+    pkg_index = get_package_index(distro)
+    total = float(len(pkg_index))
     borkd_pkgs = dict()
     changes = []
     installers = []
@@ -39,25 +77,76 @@ def generate_installers(
     succeeded = 0
     failed = 0
     what_generating = 'recipe' if kwargs.get('is_oe', False) else 'ebuild'
+    jobs = kwargs.get('jobs', 1) or 1
+    fingerprints = kwargs.get('fingerprints')
+    checkpoint = kwargs.get('checkpoint')
+    # (pkg, installer, change, write futures) of the generated packages
+    generated = []
 
     info("Generating %ss for distro '%s'" % (what_generating, distro_name))
-    for i, pkg in enumerate(sorted(pkg_names[0])):
+    if jobs > 1:
+        info('Using %d parallel jobs' % jobs)
+    pkgs = []
+    for i, pkg in enumerate(sorted(pkg_index.released)):
         if 'skip_keys' in kwargs and pkg in kwargs['skip_keys']:
             warn("Package '%s' is in skip-keys list, skipping..." % pkg)
             continue
+        entry = None
+        if checkpoint:
+            entry = checkpoint.get(
+                distro, pkg, get_pkg_version(distro, pkg, **kwargs))
+        if entry:
+            # finished by the run being resumed
+            checkpoint.restore(entry)
+            if entry['result'] == 'unresolved':
+                borkd_pkgs[pkg] = entry['unresolved']
+                failed = failed + 1
+                continue
+            succeeded += 1
+            if entry['result'] == 'generated':
+                if entry['change']:
+                    changes.append(entry['change'])
+                installers.append(pkg)
+            continue
+        if fingerprints and fingerprints.incremental and \
+                fingerprints.is_current(distro, pkg):
+            ok("Package '%s' is unchanged since the last run, skipping..."
+               % pkg)
+            succeeded += 1
+            continue
+        pkgs.append((i, pkg))
+    if kwargs.get('fetch_jobs'):
+        with timed('prefetch'):
+            prefetch_package_xmls(
+                distro, [pkg for _, pkg in pkgs], kwargs['fetch_jobs']
+            )
+    if kwargs.get('preresolve'):
+        with timed('preresolve'):
+            kwargs['preresolve'](distro, [pkg for _, pkg in pkgs])
+    results = _gen_pkg_results(
+        pkgs, jobs, kwargs.get('stages'), gen_pkg_func,
+        overlay, distro, preserve_existing, *args
+    )
+    for i, pkg, get_result in results:
         version = get_pkg_version(distro, pkg, **kwargs)
         percent = '%.1f' % (100 * (float(i) / total))
+        if fingerprints:
+            fingerprints.forget(distro, pkg)
         try:
-            current, current_info, installer_name = gen_pkg_func(
-                overlay, pkg, distro, preserve_existing, *args
-            )
+            current, current_info, installer_name = get_result()
             if not current:
                 if current_info:
                     # we are missing dependencies
                     borkd_pkgs[pkg] = current_info
+                    if checkpoint:
+                        checkpoint.add(
+                            distro, pkg, version, 'unresolved',
+                            unresolved=list(current_info))
                 elif preserve_existing:
                     # don't replace the installer
                     succeeded += 1
+                    if checkpoint:
+                        checkpoint.add(distro, pkg, version, 'skipped')
                     continue
                 failed_msg = "{0}%: Failed to generate".format(percent)
                 failed_msg += " %s for package '%s'!" % (what_generating, pkg)
@@ -68,15 +157,27 @@ def generate_installers(
                 what_generating
             ok('{0}%: {1} \'{2}\'.'.format(percent, success_msg, pkg))
             succeeded += 1
+            change = None
             if not current_info:
-                changes.append('{0} {1}'.format(installer_name, version))
+                change = '{0} {1}'.format(installer_name, version)
             elif current_info != version:
-                changes.append(
-                    '{0} {1} --> {2}'.format(
-                        installer_name, current_info, version
-                    )
+                change = '{0} {1} --> {2}'.format(
+                    installer_name, current_info, version
                 )
-            installers.append(pkg)
+            if change:
+                changes.append(change)
+            # installers which came out the same are left alone
+            changed = getattr(current, 'changed', True)
+            if changed:
+                installers.append(pkg)
+            # the files of the installer are written in the background
+            written = getattr(current, 'written', None) or []
+            if checkpoint:
+                checkpoint.add(
+                    distro, pkg, version,
+                    'generated' if changed else 'unchanged', current,
+                    written=written, change=change)
+            generated.append((pkg, current, change, written))
         except UnknownBuildType as ub:
             err(
                 "{0}%: Unknown Build type '{1}' for package '{2}'".format(
@@ -89,6 +190,20 @@ def generate_installers(
             err("{0}%: {1} for package {2}!".format(percent, failed_msg, pkg))
             bad_installers.append(pkg)
             failed = failed + 1
+    # a package whose files couldn't be written failed after all, and
+    # its fingerprint is only recorded once its files are on disk
+    for pkg, current, change, written in generated:
+        if any(future.exception() for future in written):
+            err("Failed to write the %s of package '%s'!" % (
+                what_generating, pkg))
+            succeeded -= 1
+            failed += 1
+            if pkg in installers:
+                installers.remove(pkg)
+            if change:
+                changes.remove(change)
+        elif fingerprints:
+            fingerprints.record(distro, pkg, current)
     results = 'Generated {0} / {1}'.format(succeeded, failed + succeeded)
     results += ' for distro {0}'.format(distro_name)
     info("------ {0} ------\n".format(results))
@@ -12,96 +12,95 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+
 from catkin_pkg.package import InvalidPackage
-from rosdistro.dependency_walker import DependencyWalker
 from rosdistro.manifest_provider import get_release_tag
 from rosdistro.rosdistro import RosPackage
 from rosinstall_generator.distro import _generate_rosinstall
-from rosinstall_generator.distro import get_package_names
+from superflore.distro_index import get_dependency_index
+from superflore.distro_index import get_package_index
 from superflore.exceptions import NoPkgXml
 from superflore.generators.bitbake.yocto_recipe import yoctoRecipe
+from superflore.output_writer import get_output_writer
+from superflore.package_xml import get_package_xml
+from superflore.pipeline import Done
+from superflore.pipeline import run_stages
+from superflore.resolvability import preresolve
+from superflore.timing import timed
+from superflore.timing import timed_stage
 from superflore.utils import err
 from superflore.utils import get_pkg_version
+from superflore.utils import info
 from superflore.utils import make_dir
 from superflore.utils import ok
-from superflore.utils import retry_on_exception
 from superflore.utils import warn
 
 org = "Open Source Robotics Foundation"
+# the types of dependencies which end up in a recipe
+recipe_dependency_types = [
+    'buildtool', 'build', 'build_export', 'buildtool_export', 'exec', 'test'
+]
 
 
-def regenerate_pkg(
+def preresolve_dependencies(rosdistro, pkgs):
+    """
+    Resolve the rosdep keys of the recipes of pkgs up front. Recipes are
+    still generated for packages with unresolvable keys, referring to
+    them as ROS_UNRESOLVED_DEP-*.
+    """
+    return preresolve(
+        rosdistro, 'openembedded', pkgs, recipe_dependency_types,
+        yoctoRecipe._get_condition_context(rosdistro.name))
+
+
+@timed_stage('fetch')
+def _fetch_pkg(
     overlay, pkg, rosdistro, preserve_existing, srcrev_cache,
     skip_keys
 ):
-    pkg_names = get_package_names(rosdistro)[0]
-    if pkg not in pkg_names:
+    """
+    First stage of regenerate_pkg: find out what is in the repository and
+    gather everything needed for the recipe of pkg.
+    """
+    pkg_index = get_package_index(rosdistro)
+    if pkg not in pkg_index:
         yoctoRecipe.not_generated_recipes.add(pkg)
         raise RuntimeError("Unknown package '%s' available packages"
                            " in selected distro: %s" %
-                           (pkg, get_package_names(rosdistro)))
+                           (pkg, sorted(pkg_index.released)))
     try:
         version = get_pkg_version(rosdistro, pkg, is_oe=True)
     except KeyError as ke:
         yoctoRecipe.not_generated_recipes.add(pkg)
         raise ke
-    repo_dir = overlay.repo.repo_dir
     component_name = yoctoRecipe.convert_to_oe_name(
         rosdistro.release_packages[pkg].repository_name)
     recipe = yoctoRecipe.convert_to_oe_name(pkg)
-    # check for an existing recipe which was removed by clean_ros_recipe_dirs
-    prefix = 'meta-ros{0}-{1}/generated-recipes/*/{2}_*.bb'.format(
-        yoctoRecipe._get_ros_version(rosdistro.name),
-        rosdistro.name,
-        recipe
-    )
-    existing = overlay.repo.git.status('--porcelain', '--', prefix)
-    if existing:
-        # The git status --porcelain output will look like this:
-        # D  meta-ros2-eloquent/generated-recipes/variants/ros-base_0.8.3-1.bb
-        # we want just the path with filename
-        if len(existing.split('\n')) > 1:
-            warn('More than 1 recipe was output by "git status --porcelain '
-                 'meta-ros{0}-{1}/generated-recipes/*/{2}_*.bb": "{3}"'
-                 .format(
-                     yoctoRecipe._get_ros_version(rosdistro.name),
-                     rosdistro.name,
-                     recipe,
-                     existing))
-        if existing.split()[0] != 'D':
-            err('Unexpected output from "git status --porcelain '
-                'meta-ros{0}-{1}/generated-recipes/*/{2}_*.bb": "{3}"'
-                .format(
-                    yoctoRecipe._get_ros_version(rosdistro.name),
-                    rosdistro.name,
-                    recipe,
-                    existing))
-
-        existing = existing.split()[1]
-    else:
-        # If it isn't shown in git status, it could still exist as normal
-        # unchanged file when --only option is being used
-        import glob
-        existing = glob.glob('{0}/{1}'.format(repo_dir, prefix))
-        if existing:
-            if len(existing) > 1:
-                err('More than 1 recipe was output by "git status '
-                    '--porcelain '
-                    'meta-ros{0}-{1}/generated-recipes/*/{2}_*.bb": "{3}"'
-                    .format(
-                        yoctoRecipe._get_ros_version(rosdistro.name),
-                        rosdistro.name,
-                        recipe,
-                        existing))
-            existing = existing[0]
+    # check for an existing recipe, which clean_ros_recipe_dirs may have
+    # removed already
+    entries = overlay.get_recipe_inventory(rosdistro.name).get(recipe)
+    if len(entries) > 1:
+        warn('More than 1 recipe was found for package {0}: "{1}"'.format(
+            pkg, ' '.join(path for path, _ in entries)))
+    existing, existing_status = entries[0] if entries else (None, None)
+    if existing_status == 'modified':
+        err('Unexpected status of recipe {0} in "git status '
+            '--porcelain"'.format(existing))
 
     previous_version = None
     if preserve_existing and existing:
         ok("recipe for package '%s' up to date, skipping..." % pkg)
         yoctoRecipe.not_generated_recipes.add(pkg)
-        return None, [], None
+        return Done((None, [], None))
     elif existing:
-        overlay.repo.remove_file(existing, True)
+        # recipes removed by clean_ros_recipe_dirs are gone from git already,
+        # and a recipe with the same path is only rewritten if it changed
+        recipe_path = '{0}/{1}/{2}_{3}.bb'.format(
+            overlay.get_recipe_inventory(rosdistro.name).recipes_dir,
+            component_name, recipe, version)
+        if existing_status != 'deleted' and existing != recipe_path:
+            overlay.repo.queue_removal(existing, True)
         idx_version = existing.rfind('_') + len('_')
         previous_version = existing[idx_version:].rstrip('.bb')
     try:
@@ -111,21 +110,54 @@ def regenerate_pkg(
     except InvalidPackage as e:
         err('Invalid package: ' + str(e))
         yoctoRecipe.not_generated_recipes.add(pkg)
-        return None, [], None
+        return Done((None, [], None))
     except Exception as e:
         err('Failed generating recipe for {}! {}'.format(pkg, str(e)))
         yoctoRecipe.not_generated_recipes.add(pkg)
-        return None, [], None
+        return Done((None, [], None))
+    return {
+        'overlay': overlay,
+        'pkg': pkg,
+        'rosdistro': rosdistro,
+        'version': version,
+        'previous_version': previous_version,
+        'component_name': component_name,
+        'recipe': recipe,
+        'current': current,
+    }
+
+
+@timed_stage('render')
+def _render_pkg(job):
+    """
+    Second stage of regenerate_pkg: render the recipe. Rendering leaves
+    the aggregates of yoctoRecipe alone, so it runs in parallel, and what
+    the recipe contributes to them is added here.
+    """
+    pkg = job['pkg']
     try:
-        recipe_text = current.recipe_text()
+        job['recipe_text'], contribution = job['current'].render()
+        job['current'].recipe.add_contribution(contribution)
     except NoPkgXml as nopkg:
         err("Could not fetch pkg! {}".format(str(nopkg)))
         yoctoRecipe.not_generated_recipes.add(pkg)
-        return None, [], None
+        return Done((None, [], None))
     except KeyError as ke:
         err("Failed to parse data for package {}! {}".format(pkg, str(ke)))
         yoctoRecipe.not_generated_recipes.add(pkg)
-        return None, [], None
+        return Done((None, [], None))
+    return job
+
+
+@timed_stage('write')
+def _write_pkg(job):
+    """Last stage of regenerate_pkg: write the recipe"""
+    pkg = job['pkg']
+    rosdistro = job['rosdistro']
+    repo_dir = job['overlay'].repo.repo_dir
+    component_name = job['component_name']
+    recipe = job['recipe']
+    version = job['version']
     make_dir(
         "{0}/meta-ros{1}-{2}/generated-recipes/{3}".format(
             repo_dir,
@@ -145,43 +177,70 @@ def regenerate_pkg(
             recipe,
             version
         )
-    try:
-        with open('{0}'.format(recipe_file_name), "w") as recipe_file:
-            ok('Writing recipe {0}'.format(recipe_file_name))
-            recipe_file.write(recipe_text)
-            yoctoRecipe.generated_components.add(component_name)
-            yoctoRecipe.generated_recipes[recipe] = (version, component_name)
-    except Exception:
-        err("Failed to write recipe to disk!")
-        yoctoRecipe.not_generated_recipes.add(pkg)
-        return None, [], None
-    return current, previous_version, recipe
+    writer = get_output_writer()
+    current = job['current']
+    current.changed = not writer.is_unchanged(
+        recipe_file_name, job['recipe_text'])
+    if current.changed:
+        ok('Writing recipe {0}'.format(recipe_file_name))
+
+        def _check_written(written):
+            if written.exception():
+                yoctoRecipe.not_generated_recipes.add(pkg)
+
+        # written in the background, see generate_installers()
+        written = writer.write(recipe_file_name, job['recipe_text'])
+        written.add_done_callback(_check_written)
+        current.written = [written]
+    else:
+        info('Recipe {0} is unchanged'.format(recipe_file_name))
+    current.recipe.add_generated(recipe, version)
+    return current, job['previous_version'], recipe
+
+
+# the stages of regenerate_pkg, and whether each may run in parallel
+regenerate_pkg_stages = [
+    (_fetch_pkg, True),
+    (_render_pkg, True),
+    (_write_pkg, False),
+]
+
+
+def regenerate_pkg(
+    overlay, pkg, rosdistro, preserve_existing, srcrev_cache,
+    skip_keys
+):
+    return run_stages(
+        [func for func, _ in regenerate_pkg_stages],
+        overlay, pkg, rosdistro, preserve_existing, srcrev_cache, skip_keys
+    )
 
 
 def _gen_recipe_for_package(
     rosdistro, pkg_name, pkg, repo, ros_pkg,
     pkg_rosinstall, srcrev_cache, skip_keys
 ):
-    pkg_names = get_package_names(rosdistro)
-    pkg_dep_walker = DependencyWalker(
-        rosdistro,
-        evaluate_condition_context=yoctoRecipe._get_condition_context(
-            rosdistro.name))
-    pkg_buildtool_deps = pkg_dep_walker.get_depends(pkg_name, "buildtool")
-    pkg_build_deps = pkg_dep_walker.get_depends(pkg_name, "build")
-    pkg_build_export_deps = pkg_dep_walker.get_depends(
-        pkg_name, "build_export")
-    pkg_buildtool_export_deps = pkg_dep_walker.get_depends(
-        pkg_name, "buildtool_export")
-    pkg_exec_deps = pkg_dep_walker.get_depends(pkg_name, "exec")
-    pkg_test_deps = pkg_dep_walker.get_depends(pkg_name, "test")
+    pkg_index = get_package_index(rosdistro)
+    with timed('dependencies'):
+        pkg_dep_index = get_dependency_index(
+            rosdistro,
+            yoctoRecipe._get_condition_context(rosdistro.name))
+        pkg_buildtool_deps = pkg_dep_index.get_depends(
+            pkg_name, "buildtool")
+        pkg_build_deps = pkg_dep_index.get_depends(pkg_name, "build")
+        pkg_build_export_deps = pkg_dep_index.get_depends(
+            pkg_name, "build_export")
+        pkg_buildtool_export_deps = pkg_dep_index.get_depends(
+            pkg_name, "buildtool_export")
+        pkg_exec_deps = pkg_dep_index.get_depends(pkg_name, "exec")
+        pkg_test_deps = pkg_dep_index.get_depends(pkg_name, "test")
     src_uri = pkg_rosinstall[0]['tar']['uri']
 
     # parse through package xml
     err_msg = 'Failed to fetch metadata for package {}'.format(pkg_name)
-    pkg_xml = retry_on_exception(ros_pkg.get_package_xml, rosdistro.name,
-                                 retry_msg='Could not get package xml!',
-                                 error_msg=err_msg)
+    pkg_xml = get_package_xml(rosdistro, pkg_name,
+                              retry_msg='Could not get package xml!',
+                              error_msg=err_msg)
 
     pkg_recipe = yoctoRecipe(
         pkg.repository_name,
@@ -195,31 +254,53 @@ def _gen_recipe_for_package(
     )
     # add build dependencies
     for bdep in pkg_build_deps:
-        pkg_recipe.add_build_depend(bdep, bdep in pkg_names[0])
+        pkg_recipe.add_build_depend(bdep, bdep in pkg_index)
 
     # add build tool dependencies
     for btdep in pkg_buildtool_deps:
-        pkg_recipe.add_buildtool_depend(btdep, btdep in pkg_names[0])
+        pkg_recipe.add_buildtool_depend(btdep, btdep in pkg_index)
 
     # add export dependencies
     for edep in pkg_build_export_deps:
-        pkg_recipe.add_export_depend(edep, edep in pkg_names[0])
+        pkg_recipe.add_export_depend(edep, edep in pkg_index)
 
     # add buildtool export dependencies
     for btedep in pkg_buildtool_export_deps:
-        pkg_recipe.add_buildtool_export_depend(btedep, btedep in pkg_names[0])
+        pkg_recipe.add_buildtool_export_depend(btedep, btedep in pkg_index)
 
     # add exec dependencies
     for xdep in pkg_exec_deps:
-        pkg_recipe.add_run_depend(xdep, xdep in pkg_names[0])
+        pkg_recipe.add_run_depend(xdep, xdep in pkg_index)
 
     # add test dependencies
     for tdep in pkg_test_deps:
-        pkg_recipe.add_test_depend(tdep, tdep in pkg_names[0])
+        pkg_recipe.add_test_depend(tdep, tdep in pkg_index)
 
     return pkg_recipe
 
 
+def get_fingerprint_inputs(overlay, rosdistro, pkg, skip_keys):
+    """
+    Inputs of the recipe of pkg besides the ones every generator shares:
+    the skip keys, and whether the recipe is still in the repository.
+    """
+    component_name = yoctoRecipe.convert_to_oe_name(
+        rosdistro.release_packages[pkg].repository_name)
+    recipe_file_name = '{0}/meta-ros{1}-{2}/generated-recipes/{3}/' \
+        '{4}_{5}.bb'.format(
+            overlay.repo.repo_dir,
+            yoctoRecipe._get_ros_version(rosdistro.name),
+            rosdistro.name,
+            component_name,
+            yoctoRecipe.convert_to_oe_name(pkg),
+            get_pkg_version(rosdistro, pkg, is_oe=True)
+        )
+    return {
+        'recipe': os.path.isfile(recipe_file_name),
+        'skip_keys': sorted(skip_keys),
+    }
+
+
 class oe_recipe(object):
     def __init__(
         self, rosdistro, pkg_name, srcrev_cache, skip_keys
@@ -236,6 +317,13 @@ class oe_recipe(object):
             rosdistro, pkg_name, pkg, repo, ros_pkg, pkg_rosinstall,
             srcrev_cache, skip_keys
         )
+        # whether writing the recipe changed the repository
+        self.changed = True
+        # the futures of the files handed over to the output writer
+        self.written = []
 
     def recipe_text(self):
         return self.recipe.get_recipe_text(org)
+
+    def render(self):
+        return self.recipe.render(org)
@@ -12,24 +12,95 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import glob
+import os
+import threading
+
 from superflore.generators.bitbake.yocto_recipe import yoctoRecipe
+from superflore.output_writer import flush_output
 from superflore.repo_instance import RepoInstance
+from superflore.timing import timed
 from superflore.utils import info
 
 
+class RecipeInventory(object):
+    """
+    The recipes found under the generated-recipes directory of a distro,
+    gathered with a single git status and a single walk of the directory:
+    a table from each recipe name to the paths of its recipe files
+    (relative to the repository) and their status, which is 'deleted'
+    when git has the file staged for removal (e.g. by
+    clean_ros_recipe_dirs), 'unchanged' when it is on disk as committed,
+    or else 'modified'.
+    """
+    def __init__(self, repo, distro):
+        self.distro = distro
+        self.recipes_dir = 'meta-ros{0}-{1}/generated-recipes'.format(
+            yoctoRecipe._get_ros_version(distro), distro)
+        self.recipes = dict()
+        listed = set()
+        status = repo.git.status(
+            '--porcelain', '--untracked-files=all', '--', self.recipes_dir)
+        for line in status.split('\n'):
+            if not line:
+                continue
+            # e.g. "D  meta-ros2-eloquent/generated-recipes/variants/
+            # ros-base_0.8.3-1.bb", or "R  old -> new" for renames
+            path = line[3:].split(' -> ')[-1]
+            listed.add(path)
+            # deleted from the index, or only from the working tree while
+            # the removal is queued by RepoInstance.queue_removal()
+            self._add(path, 'deleted' if 'D' in line[:2] else 'modified')
+        for dirpath, _, filenames in sorted(
+                os.walk(os.path.join(repo.repo_dir, self.recipes_dir))):
+            dirpath = os.path.relpath(dirpath, repo.repo_dir)
+            for filename in sorted(filenames):
+                path = os.path.join(dirpath, filename)
+                if path not in listed:
+                    self._add(path, 'unchanged')
+
+    def _add(self, path, status):
+        filename = os.path.basename(path)
+        if filename.endswith('.bb') and '_' in filename:
+            recipe = filename.rsplit('_', 1)[0]
+            self.recipes.setdefault(recipe, list()).append((path, status))
+
+    def get(self, recipe):
+        """
+        Return the list of (path, status) of the files of recipe, with
+        the ones git status reported first, or an empty list if it's
+        missing.
+        """
+        return self.recipes.get(recipe, list())
+
+
 class RosMeta(object):
     def __init__(
         self, dir, do_clone, branch, org='ros', repo='meta-ros',
-        from_branch='', branch_name=''
+        from_branch='', branch_name='', clone_depth=None, clone_filter=None,
+        sparse_distros=None, mirror=None
     ):
+        sparse_paths = None
+        if sparse_distros is not None:
+            sparse_paths = [
+                'meta-ros{0}-{1}'.format(
+                    yoctoRecipe._get_ros_version(distro), distro)
+                for distro in sparse_distros
+            ]
         self.repo = RepoInstance(
-            org, repo, dir, do_clone, from_branch=from_branch)
+            org, repo, dir, do_clone, from_branch=from_branch,
+            clone_depth=clone_depth, clone_filter=clone_filter,
+            sparse_paths=sparse_paths, mirror=mirror)
         self.branch_name = branch
+        # RecipeInventory instances, keyed by distro name
+        self.inventories = dict()
+        self.inventories_lock = threading.Lock()
         if branch:
             info('Creating new branch {0}...'.format(self.branch_name))
             self.repo.create_branch(self.branch_name)
 
-    def clean_ros_recipe_dirs(self, distro):
+    @timed('git')
+    def clean_ros_recipe_dirs(self, distro, keep_recipes=False):
         # superflore-change-summary.txt is no longer being generated since:
         # https://github.com/ros-infrastructure/superflore/pull/273
         # but remove it here to make sure it gets deleted when new distro
@@ -42,12 +113,56 @@ class RosMeta(object):
                 'meta-ros{0}-{1}/files/{1}/generated/'\
                 'superflore-change-summary.txt '.format(
                     yoctoRecipe._get_ros_version(distro), distro)
+        if keep_recipes:
+            files = files.split(' ', 1)[1]
         info(
             'Cleaning up:\n{0}'
             .format(files))
         self.repo.git.rm('-rf', '--ignore-unmatch', files.split())
 
+    def get_recipe_inventory(self, distro, refresh=False):
+        """
+        Return the RecipeInventory of distro, taken the first time it's
+        asked for (or again with refresh).
+        """
+        with self.inventories_lock:
+            if refresh or distro not in self.inventories:
+                with self.repo.lock, timed('git'):
+                    self.inventories[distro] = RecipeInventory(
+                        self.repo, distro)
+            return self.inventories[distro]
+
+    def remove_stale_recipes(self, distro, generated_recipes):
+        """
+        Remove the recipes under generated-recipes that aren't among the
+        generated_recipes (recipe name -> (version, component)).
+        """
+        # waiting for the files to be written isn't git time
+        flush_output()
+        self._remove_stale_recipes(distro, generated_recipes)
+
+    @timed('git')
+    def _remove_stale_recipes(self, distro, generated_recipes):
+        recipes_dir = '{0}/meta-ros{1}-{2}/generated-recipes'.format(
+            self.repo.repo_dir, yoctoRecipe._get_ros_version(distro), distro)
+        expected = set(
+            '{0}/{1}/{2}_{3}.bb'.format(
+                recipes_dir, component, recipe, version)
+            for recipe, (version, component) in generated_recipes.items()
+        )
+        for recipe_file in sorted(glob.glob('%s/*/*.bb' % recipes_dir)):
+            if recipe_file not in expected:
+                info('Removing stale recipe {0}'.format(recipe_file))
+                self.repo.queue_removal(recipe_file, True)
+        self.repo.flush_removals()
+
     def commit_changes(self, distro, commit_msg):
+        flush_output()
+        self._commit_changes(distro, commit_msg)
+
+    @timed('git')
+    def _commit_changes(self, distro, commit_msg):
+        self.repo.flush_removals()
         info('Commit changes...')
         if self.repo.git.status('--porcelain') == '':
             info('Nothing changed; no commit done')
@@ -62,9 +177,17 @@ class RosMeta(object):
         self.repo.pull_request(message, title, branch=distro)
 
     def get_file_revision_logs(self, *file_path):
+        # counting the commits needs the history a shallow clone left out
+        self.repo.unshallow()
         return self.repo.git.log('--oneline', '--', *file_path)
 
     def add_generated_files(self, distro):
+        flush_output()
+        self._add_generated_files(distro)
+
+    @timed('git')
+    def _add_generated_files(self, distro):
+        self.repo.flush_removals()
         info('Adding changes...')
         self.repo.git.add('meta-ros{0}-{1}/generated-recipes'.format(
             yoctoRecipe._get_ros_version(distro), distro))
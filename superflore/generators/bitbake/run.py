@@ -12,19 +12,32 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import atexit
 import os
 import sys
 
 from rosinstall_generator.distro import get_distro
 from rosinstall_generator.distro import get_package_names
 from superflore.CacheManager import CacheManager
+from superflore.checkpoint import Checkpoint
+from superflore.fingerprint import FingerprintStore
 from superflore.generate_installers import generate_installers
+from superflore.generators.bitbake.gen_packages import get_fingerprint_inputs
+from superflore.generators.bitbake.gen_packages import preresolve_dependencies
 from superflore.generators.bitbake.gen_packages import regenerate_pkg
+from superflore.generators.bitbake.gen_packages import regenerate_pkg_stages
 from superflore.generators.bitbake.ros_meta import RosMeta
 from superflore.generators.bitbake.yocto_recipe import yoctoRecipe
+from superflore.package_xml import PackageXmlStore
+from superflore.package_xml import prefetch_package_xmls
+from superflore.package_xml import set_package_xml_store
 from superflore.parser import get_parser
 from superflore.repo_instance import RepoInstance
+from superflore.repo_instance import RepoMirror
+from superflore.snapshot import use_snapshot
 from superflore.TempfileManager import TempfileManager
+from superflore.timing import enable_timing
+from superflore.timing import write_timing_report
 from superflore.utils import clean_up
 from superflore.utils import err
 from superflore.utils import file_pr
@@ -33,6 +46,9 @@ from superflore.utils import get_pr_text
 from superflore.utils import get_utcnow_timestamp_str
 from superflore.utils import info
 from superflore.utils import load_pr
+from superflore.utils import log_license_aliases
+from superflore.utils import log_resolution_stats
+from superflore.utils import make_dir
 from superflore.utils import ok
 from superflore.utils import save_pr
 from superflore.utils import url_to_repo_org
@@ -54,6 +70,19 @@ def main():
     args = parser.parse_args(sys.argv[1:])
     pr_comment = args.pr_comment
     skip_keys = set(args.skip_keys) if args.skip_keys else set()
+    if args.incremental and not args.cache_dir:
+        parser.error('Invalid args! --incremental requires --cache-dir')
+    if args.resume and not args.output_repository_path:
+        parser.error(
+            'Invalid args! --resume requires --output-repository-path')
+    if args.timing_report:
+        enable_timing()
+        atexit.register(write_timing_report, args.timing_report)
+    atexit.register(log_resolution_stats)
+    atexit.register(log_license_aliases)
+    if args.snapshot:
+        # before anything loads the rosdistro index
+        use_snapshot(args.snapshot)
     if args.pr_only:
         if args.dry_run:
             parser.error('Invalid args! cannot dry-run and file PR')
@@ -79,10 +108,18 @@ def main():
     now = os.getenv(
         'SUPERFLORE_GENERATION_DATETIME',
         get_utcnow_timestamp_str())
+    if args.cache_dir and not args.snapshot:
+        set_package_xml_store(
+            PackageXmlStore(os.path.join(args.cache_dir, 'package-xml')))
     repo_org = 'ros'
     repo_name = 'meta-ros'
     if args.upstream_repo:
         repo_org, repo_name = url_to_repo_org(args.upstream_repo)
+    mirror = None
+    if args.cache_dir and not args.output_repository_path:
+        # check the repository out of a mirror kept between runs
+        mirror = RepoMirror(os.path.join(
+            args.cache_dir, 'mirrors', repo_org, '{0}.git'.format(repo_name)))
     # open cached tar file if it exists
     with TempfileManager(args.output_repository_path) as _repo:
         if not args.output_repository_path:
@@ -97,6 +134,11 @@ def main():
             org=repo_org,
             repo=repo_name,
             from_branch=args.upstream_branch,
+            clone_depth=args.clone_depth,
+            clone_filter=args.clone_filter,
+            sparse_distros=(selected_targets if args.sparse_checkout
+                            else None),
+            mirror=mirror,
         )
         if not args.only:
             pr_comment = pr_comment or (
@@ -118,6 +160,11 @@ def main():
         with CacheManager(srcrev_filename) as srcrev_cache:
             if args.only:
                 distro = get_distro(args.ros_distro)
+                prefetch_package_xmls(
+                    distro,
+                    [pkg for pkg in args.only if pkg not in skip_keys],
+                    args.fetch_jobs
+                )
                 for pkg in args.only:
                     if pkg in skip_keys:
                         warn("Package '%s' is in skip-keys list, skipping..."
@@ -161,22 +208,66 @@ def main():
                 ok('Successfully synchronized repositories!')
                 sys.exit(0)
 
-            overlay.clean_ros_recipe_dirs(args.ros_distro)
+            fingerprint_file = None
+            if args.cache_dir:
+                make_dir(args.cache_dir)
+                fingerprint_file = os.path.join(
+                    args.cache_dir, 'openembedded-fingerprints.json')
+            # when resuming, the interrupted run cleaned up already and the
+            # recipes it generated are part of this run. In incremental mode,
+            # recipes of unchanged packages are kept; the ones of removed
+            # packages are cleaned up once generation is done.
+            if not args.resume:
+                overlay.clean_ros_recipe_dirs(
+                    args.ros_distro, keep_recipes=args.incremental)
+            checkpoint_file = os.path.join(
+                overlay.repo.repo.git_dir, 'superflore-checkpoint.jsonl')
             for adistro in selected_targets:
                 yoctoRecipe.reset()
                 distro = get_distro(adistro)
+                # the existing recipes of every package, listed at once
+                overlay.get_recipe_inventory(adistro, refresh=True)
 
-                distro_installers, _, distro_changes =\
-                    generate_installers(
-                        distro,
-                        overlay,
-                        regenerate_pkg,
-                        preserve_existing,
-                        srcrev_cache,
-                        skip_keys,
-                        skip_keys=skip_keys,
-                        is_oe=True,
-                    )
+                with FingerprintStore(
+                    fingerprint_file,
+                    'openembedded',
+                    incremental=args.incremental,
+                    evaluate_condition_context=(
+                        yoctoRecipe._get_condition_context(adistro)),
+                    get_extra_inputs=lambda distro, pkg: (
+                        get_fingerprint_inputs(
+                            overlay, distro, pkg, skip_keys)),
+                    get_data=lambda current: (
+                        current.recipe.get_contribution()),
+                    restore_data=yoctoRecipe.merge_contribution,
+                ) as fingerprints, Checkpoint(
+                    checkpoint_file,
+                    args.resume,
+                    get_data=lambda current: (
+                        current.recipe.get_contribution()),
+                    restore_data=yoctoRecipe.merge_contribution,
+                ) as checkpoint:
+                    distro_installers, _, distro_changes =\
+                        generate_installers(
+                            distro,
+                            overlay,
+                            regenerate_pkg,
+                            preserve_existing,
+                            srcrev_cache,
+                            skip_keys,
+                            skip_keys=skip_keys,
+                            is_oe=True,
+                            jobs=args.jobs,
+                            stages=regenerate_pkg_stages,
+                            fetch_jobs=args.fetch_jobs,
+                            fingerprints=(
+                                fingerprints if fingerprint_file else None),
+                            checkpoint=checkpoint,
+                            preresolve=preresolve_dependencies,
+                        )
+                if args.incremental:
+                    overlay.remove_stale_recipes(
+                        args.ros_distro, yoctoRecipe.generated_recipes)
                 total_changes[adistro] = distro_changes
                 total_installers[adistro] = distro_installers
                 yoctoRecipe.generate_ros_distro_inc(
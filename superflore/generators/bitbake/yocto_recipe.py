@@ -26,13 +26,17 @@
 from collections import defaultdict
 import hashlib
 from subprocess import DEVNULL, PIPE, Popen
+import threading
 
 from superflore.exceptions import NoPkgXml
 from superflore.exceptions import UnresolvedDependency
 from superflore.PackageMetadata import PackageMetadata
+from superflore.rosdep_support import get_distro_type
+from superflore.snapshot import get_snapshot_tags
+from superflore.timing import timed
 from superflore.utils import err
-from superflore.utils import get_distros
 from superflore.utils import get_license
+from superflore.utils import get_licenses
 from superflore.utils import get_pkg_version
 from superflore.utils import get_superflore_version
 from superflore.utils import info
@@ -59,14 +63,26 @@ class yoctoRecipe(object):
     not_generated_recipes = set()
     platform_deps = set()
     max_component_name = 0
+    # guards the class-level aggregates above when recipes are generated
+    # by parallel jobs
+    aggregates_lock = threading.RLock()
+    # the tags of each release repository, listed once with git ls-remote
+    tag_index = dict()
+    tag_index_lock = threading.Lock()
+    # the condition context of each distro
+    condition_contexts = dict()
 
     def __init__(
         self, component_name, num_pkgs, pkg_name, pkg_xml, rosdistro, src_uri,
         srcrev_cache, skip_keys
     ):
         self.component = component_name
-        yoctoRecipe.max_component_name = max(
-            yoctoRecipe.max_component_name, len(component_name))
+        # what this recipe adds to the class-level aggregates, so that it
+        # can be added back when the recipe isn't regenerated
+        self.contribution = {'max_component_name': len(component_name)}
+        with yoctoRecipe.aggregates_lock:
+            yoctoRecipe.max_component_name = max(
+                yoctoRecipe.max_component_name, len(component_name))
         self.oe_component = yoctoRecipe.convert_to_oe_name(component_name)
         self.num_pkgs = num_pkgs
         self.name = pkg_name
@@ -127,19 +143,19 @@ class yoctoRecipe(object):
         self.skip_keys = skip_keys
 
     def get_license_line(self):
-        self.license_line = ''
-        self.license_md5 = ''
-        i = 0
+        self.license_line, self.license_md5 = self._find_license_line()
+
+    def _find_license_line(self):
+        """Return the number and md5 of the license line of package.xml"""
         if not self.pkg_xml:
             raise NoPkgXml('No package xml file!')
-        for line in str(self.pkg_xml, 'utf-8').split('\n'):
-            i += 1
+        lines = str(self.pkg_xml, 'utf-8').split('\n')
+        for i, line in enumerate(lines, 1):
             if 'license' in line:
-                self.license_line = str(i)
                 md5 = hashlib.md5()
                 md5.update((line + '\n').encode())
-                self.license_md5 = md5.hexdigest()
-                break
+                return str(i), md5.hexdigest()
+        return '', ''
 
     def get_repo_src_uri(self):
         """
@@ -183,24 +199,48 @@ class yoctoRecipe(object):
         return '{0}/{1}/{2}/{3}'.format(
             dirs[3], dirs[4], dirs[5], dirs[6]).replace('.tar.gz', '')
 
+    @staticmethod
+    def get_repo_tags(repo_url):
+        """
+        Return a dict mapping each tag ref of the repository to its hash.
+
+        The release repositories hold the tags of all of their packages,
+        so the whole list is fetched once and shared by every package.
+        When running from a snapshot, the tags recorded in it are used.
+        """
+        from git.cmd import Git
+
+        snapshot_tags = get_snapshot_tags(repo_url)
+        if snapshot_tags is not None:
+            return snapshot_tags
+        with yoctoRecipe.tag_index_lock:
+            entry = yoctoRecipe.tag_index.setdefault(
+                repo_url, {'lock': threading.Lock(), 'tags': None})
+        with entry['lock']:
+            if entry['tags'] is None:
+                tags = dict()
+                with timed('ls_remote'):
+                    refs = Git().execute(
+                        ["git", "ls-remote", "--tags", repo_url])
+                for ref in refs.split('\n'):
+                    if ref:
+                        srcrev, tag = ref.split('\t')
+                        tags[tag] = srcrev
+                entry['tags'] = tags
+        return entry['tags']
+
     def get_srcrev(self):
-        # e.g. git ls-remote https://github.com/ros2-gbp/ament_lint-release \
-        #                    release/bouncy/ament_cmake_copyright/0.5.2-0
+        # e.g. git ls-remote --tags \
+        #     https://github.com/ros2-gbp/ament_lint-release
         # 48bf1aa1cb083a884fbc8520ced00523255aeaed \
         #     refs/tags/release/bouncy/ament_cmake_copyright/0.5.2-0
         # from https://github.com/ros2-gbp/ament_lint-release/archive/ \
         #     release/bouncy/ament_cmake_copyright/0.5.2-0.tar.gz
-        from git.cmd import Git
-
-        g = Git()
-        for ref in g.execute(["git",
-                              "ls-remote",
-                              "https://%s" % self.get_repo_src_uri(),
-                              "refs/tags/%s" % self.get_repo_tag_name()
-                              ]).split('\n'):
-            srcrev, tag = ref.split('\t')
-            if tag == "refs/tags/%s" % self.get_repo_tag_name():
-                return srcrev
+        tags = yoctoRecipe.get_repo_tags(
+            "https://%s" % self.get_repo_src_uri())
+        tag = "refs/tags/%s" % self.get_repo_tag_name()
+        if tag in tags:
+            return tags[tag]
         err("Cannot map refs/tags/%s to srcrev in https://%s repository with "
             "git ls-remote" % (self.get_repo_tag_name(),
                                self.get_repo_src_uri()))
@@ -339,7 +379,15 @@ class yoctoRecipe(object):
         return assignment + expression
 
     def get_dependencies(
-            self, internal_depends, external_depends, is_native=False):
+            self, internal_depends, external_depends, is_native=False,
+            contribution=None):
+        """
+        Return the recipe names of the dependencies, and the ones among them
+        which are platform packages. What the rosdep keys resolved to is
+        recorded in contribution.
+        """
+        if contribution is None:
+            contribution = dict()
         dependencies = set()
         system_dependencies = set()
         union_deps = internal_depends | external_depends
@@ -354,13 +402,13 @@ class yoctoRecipe(object):
             try:
                 results = resolve_dep(dep, 'openembedded', self.distro)[0]
                 if not results:
-                    yoctoRecipe.rosdep_cache[dep] = []
+                    self._contribute_rosdep(contribution, dep, [])
                     continue
                 for res in results:
                     recipe = self.convert_to_oe_name(res, is_native)
                     dependencies.add(recipe)
                     system_dependencies.add(recipe)
-                    yoctoRecipe.rosdep_cache[dep].add(res)
+                    self._contribute_rosdep(contribution, dep, [res])
                     info('External dependency add: ' + recipe)
             except UnresolvedDependency:
                 oe_dep = self.convert_to_oe_name(dep, is_native)
@@ -372,23 +420,108 @@ class yoctoRecipe(object):
                 rosdep_dep = self.convert_to_oe_name(dep, False)
                 rosdep_name = UNRESOLVED_DEP_REF_PREFIX\
                     + rosdep_dep + '}'
-                yoctoRecipe.rosdep_cache[dep].add(rosdep_name)
+                self._contribute_rosdep(contribution, dep, [rosdep_name])
                 info('Unresolved external dependency add: ' + recipe)
 
         return dependencies, system_dependencies
 
+    @staticmethod
+    def _contribute(contribution, aggregate, items):
+        contribution.setdefault(aggregate, set()).update(items)
+
+    @staticmethod
+    def _contribute_rosdep(contribution, dep, results):
+        rosdep_cache = contribution.setdefault('rosdep_cache', dict())
+        rosdep_cache.setdefault(dep, set()).update(results)
+
+    def add_generated(self, recipe, version):
+        """Record that the recipe file was written"""
+        with yoctoRecipe.aggregates_lock:
+            yoctoRecipe.generated_recipes[recipe] = (
+                version, self.oe_component)
+            yoctoRecipe.generated_components.add(self.oe_component)
+            self._contribute(
+                self.contribution, 'generated_components',
+                [self.oe_component])
+            self.contribution['generated_recipes'] = {
+                recipe: [version, self.oe_component]}
+
+    def get_contribution(self):
+        """
+        Return what this recipe added to the class-level aggregates, in a
+        form that can be saved as JSON and passed to merge_contribution().
+        """
+        contribution = dict()
+        for key, value in self.contribution.items():
+            if key == 'rosdep_cache':
+                value = {
+                    dep: sorted(results) for dep, results in value.items()
+                }
+            elif isinstance(value, set):
+                value = sorted(value)
+            contribution[key] = value
+        return contribution
+
+    def add_contribution(self, contribution):
+        """
+        Add what render() returned for this recipe to the class-level
+        aggregates.
+        """
+        for key, value in contribution.items():
+            if key == 'rosdep_cache':
+                for dep, results in value.items():
+                    self._contribute_rosdep(self.contribution, dep, results)
+            else:
+                self._contribute(self.contribution, key, value)
+        yoctoRecipe.merge_contribution(contribution)
+
+    @staticmethod
+    def merge_contribution(contribution):
+        """Add what a recipe generated by an earlier run contributed"""
+        with yoctoRecipe.aggregates_lock:
+            for dep, results in contribution.get('rosdep_cache', {}).items():
+                if not results:
+                    yoctoRecipe.rosdep_cache[dep] = []
+                else:
+                    yoctoRecipe.rosdep_cache[dep].update(results)
+            for recipe, (version, component) in contribution.get(
+                    'generated_recipes', {}).items():
+                yoctoRecipe.generated_recipes[recipe] = (version, component)
+            for aggregate in [
+                'generated_components', 'generated_native_recipes',
+                'generated_test_deps', 'generated_non_test_deps',
+                'platform_deps'
+            ]:
+                getattr(yoctoRecipe, aggregate).update(
+                    contribution.get(aggregate, []))
+            yoctoRecipe.max_component_name = max(
+                yoctoRecipe.max_component_name,
+                contribution.get('max_component_name', 0))
+
     def get_recipe_text(self, distributor):
         """
         Generate the Yocto Recipe, given the distributor line
         and the license text.
         """
+        text, contribution = self.render(distributor)
+        self.add_contribution(contribution)
+        return text
+
+    def render(self, distributor):
+        """
+        Return the text of the recipe and what it contributes to the
+        class-level aggregates, to be passed to add_contribution(). Neither
+        the recipe nor the aggregates are changed, so recipes can be
+        rendered by any thread.
+        """
+        contribution = dict()
         ret = "# Generated by superflore -- DO NOT EDIT\n#\n"
         ret += "# Copyright " + distributor + "\n\n"
         ret += self.get_top_inherit_line()
         # description
         if self.description:
-            self.description = self.description.replace('\n', ' ')
-            ret += 'DESCRIPTION = "' + self.description + '"\n'
+            description = self.description.replace('\n', ' ')
+            ret += 'DESCRIPTION = "' + description + '"\n'
         else:
             ret += 'DESCRIPTION = "None"\n'
         # author
@@ -400,59 +533,64 @@ class yoctoRecipe(object):
         # section
         ret += 'SECTION = "devel"\n'
         # license
-        self.get_license_line()
+        license_line, license_md5 = self._find_license_line()
         if isinstance(self.license, str):
             oe_lic = get_license(self.license)
             if oe_lic != self.license:
                 ret += '# Original license in package.xml:\n'
                 ret += '#         "' + self.license + '"\n'
         elif isinstance(self.license, list):
-            oe_lic = ' & '.join([get_license(lic) for lic in self.license])
+            oe_lic = ' & '.join(get_licenses(self.license))
             if oe_lic != ' & '.join(self.license):
                 ret += '# Original license in package.xml, joined with '
                 ret += '"&" when multiple license tags were used:\n'
                 ret += '#         "' + ' & '.join(self.license) + '"\n'
         ret += 'LICENSE = "' + oe_lic + '"\n'
         ret += 'LIC_FILES_CHKSUM = "file://package.xml;beginline='
-        ret += str(self.license_line)
+        ret += license_line
         ret += ';endline='
-        ret += str(self.license_line)
+        ret += license_line
         ret += ';md5='
-        ret += str(self.license_md5)
+        ret += license_md5
         ret += '"\n\n'
         ret += 'ROS_CN = "' + self.component + '"\n'
         ret += 'ROS_BPN = "' + self.name + '"\n\n'
         # depends
         deps, sys_deps = self.get_dependencies(
-            self.depends, self.depends_external)
-        yoctoRecipe.platform_deps |= sys_deps
+            self.depends, self.depends_external, contribution=contribution)
+        self._contribute(contribution, 'platform_deps', sys_deps)
         buildtool_native_deps, sys_deps = self.get_dependencies(
             self.buildtool_depends,
             self.buildtool_depends_external,
-            is_native=True
+            is_native=True,
+            contribution=contribution
         )
         native_deps = set(buildtool_native_deps)
-        yoctoRecipe.platform_deps |= sys_deps
+        self._contribute(contribution, 'platform_deps', sys_deps)
         export_deps, sys_deps = self.get_dependencies(
-            self.export_depends, self.export_depends_external)
-        yoctoRecipe.platform_deps |= sys_deps
+            self.export_depends, self.export_depends_external,
+            contribution=contribution)
+        self._contribute(contribution, 'platform_deps', sys_deps)
         buildtool_export_native_deps, sys_deps = self.get_dependencies(
             self.buildtool_export_depends,
             self.buildtool_export_depends_external,
-            is_native=True
+            is_native=True,
+            contribution=contribution
         )
         native_deps |= buildtool_export_native_deps
-        yoctoRecipe.platform_deps |= sys_deps
-        yoctoRecipe.generated_native_recipes |= native_deps
+        self._contribute(contribution, 'platform_deps', sys_deps)
+        self._contribute(
+            contribution, 'generated_native_recipes', native_deps)
         exec_deps, sys_deps = self.get_dependencies(
-            self.rdepends, self.rdepends_external)
-        yoctoRecipe.platform_deps |= sys_deps
-        test_deps, sys_deps = self.get_dependencies(self.tdepends,
-                                                    self.tdepends_external)
-        yoctoRecipe.platform_deps |= sys_deps
-        yoctoRecipe.generated_non_test_deps |= deps | export_deps | \
-            native_deps | exec_deps
-        yoctoRecipe.generated_test_deps |= test_deps
+            self.rdepends, self.rdepends_external, contribution=contribution)
+        self._contribute(contribution, 'platform_deps', sys_deps)
+        test_deps, sys_deps = self.get_dependencies(
+            self.tdepends, self.tdepends_external, contribution=contribution)
+        self._contribute(contribution, 'platform_deps', sys_deps)
+        self._contribute(
+            contribution, 'generated_non_test_deps',
+            deps | export_deps | native_deps | exec_deps)
+        self._contribute(contribution, 'generated_test_deps', test_deps)
         ret += yoctoRecipe.generate_multiline_variable(
             'ROS_BUILD_DEPENDS', deps) + '\n'
         ret += yoctoRecipe.generate_multiline_variable(
@@ -463,12 +601,17 @@ class yoctoRecipe(object):
             ament_cmake_native_deps, sys_deps = self.get_dependencies(
                 self.export_depends,
                 self.export_depends_external,
-                is_native=True
+                is_native=True,
+                contribution=contribution
             )
             buildtool_export_native_deps |= ament_cmake_native_deps
-            yoctoRecipe.generated_non_test_deps |= ament_cmake_native_deps
-            yoctoRecipe.generated_native_recipes |= ament_cmake_native_deps
-            yoctoRecipe.platform_deps |= sys_deps
+            self._contribute(
+                contribution, 'generated_non_test_deps',
+                ament_cmake_native_deps)
+            self._contribute(
+                contribution, 'generated_native_recipes',
+                ament_cmake_native_deps)
+            self._contribute(contribution, 'platform_deps', sys_deps)
         else:
             ret += yoctoRecipe.generate_multiline_variable(
                 'ROS_EXPORT_DEPENDS', export_deps) + '\n'
@@ -499,13 +642,12 @@ class yoctoRecipe(object):
         ret += 'ROS_BUILD_TYPE = "' + self.build_type + '"\n'
         # Inherits
         ret += '\n' + self.get_bottom_inherit_line()
-        return ret
+        return ret, contribution
 
     @staticmethod
     def _get_ros_version(distro):
-        distros = get_distros()
-        return 2 if distro not in distros \
-            else int(distros[distro]['distribution_type'][len('ros'):])
+        distro_type = get_distro_type(distro)
+        return 2 if not distro_type else int(distro_type[len('ros'):])
 
     @staticmethod
     def _get_ros_python_version(distro):
@@ -513,13 +655,16 @@ class yoctoRecipe(object):
 
     @staticmethod
     def _get_condition_context(distro):
-        context = dict()
-        context["ROS_OS_OVERRIDE"] = "openembedded"
-        context["ROS_DISTRO"] = distro
-        context["ROS_VERSION"] = str(yoctoRecipe._get_ros_version(distro))
-        context["ROS_PYTHON_VERSION"] = str(
-            yoctoRecipe._get_ros_python_version(distro))
-        return context
+        if distro not in yoctoRecipe.condition_contexts:
+            context = dict()
+            context["ROS_OS_OVERRIDE"] = "openembedded"
+            context["ROS_DISTRO"] = distro
+            context["ROS_VERSION"] = str(
+                yoctoRecipe._get_ros_version(distro))
+            context["ROS_PYTHON_VERSION"] = str(
+                yoctoRecipe._get_ros_python_version(distro))
+            yoctoRecipe.condition_contexts[distro] = context
+        return dict(yoctoRecipe.condition_contexts[distro])
 
     @staticmethod
     def generate_superflore_datetime_inc(basepath, dist, now):
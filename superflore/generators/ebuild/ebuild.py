@@ -17,6 +17,7 @@ from time import gmtime, strftime
 from superflore.exceptions import UnknownBuildType
 from superflore.exceptions import UnresolvedDependency
 from superflore.utils import get_license
+from superflore.utils import get_licenses
 from superflore.utils import resolve_dep
 from superflore.utils import sanitize_string
 from superflore.utils import trim_string
@@ -28,6 +29,49 @@ depend_only_pkgs = [
     'virtual/pkgconfig'
 ]
 
+# the fixed parts of the ebuild text
+_python_compat_py2_py3 = 'PYTHON_COMPAT=( python{2_7,3_5,3_6} )\n\n'
+_python_compat_py3 = 'PYTHON_COMPAT=( python{3_5,3_6} )\n\n'
+_python_compat_py2 = 'PYTHON_COMPAT=( python2_7 )\n\n'
+_header_template = (
+    'DESCRIPTION="{description}"\n'
+    'HOMEPAGE="{homepage}"\n'
+    'SRC_URI="{src_uri} -> ${{PN}}-{distro}-release-${{PV}}.tar.gz"\n\n'
+)
+_ros_distro_template = (
+    'ROS_DISTRO="{distro}"\n'
+    'ROS_PREFIX="opt/ros/${{ROS_DISTRO}}"\n'
+)
+_src_prepare = (
+    '\nsrc_prepare() {\n'
+    '\tcd ${P}\n'
+    '\tEPATCH_SOURCE="${FILESDIR}" EPATCH_SUFFIX="patch" \\\n'
+    '\tEPATCH_FORCE="yes" epatch\n'
+)
+_opencv3_src_configure = (
+    '\nsrc_configure() {\n'
+    "\tfilter-flags '-march=*' '-mcpu=*' '-mtune=*'\n"
+    '\tif [[ $(gcc-major-version) -gt 4 ]]; then\n'
+    '\t\tlocal mycmakeargs=(\n'
+    '\t\t\t-DWITH_CUDA=OFF\n'
+    '\t\t)\n'
+    '\t\tewarn "Cuda does not support GCC > 4, so cuda has been disabled."\n'
+    '\tfi\n'
+    '\tros-cmake_src_configure\n'
+    '}\n'
+)
+_stage_src_configure = (
+    '\nsrc_configure() {\n'
+    "\tfilter-flags '-std=*'\n"
+    '\tros-cmake_src_configure\n'
+    '}\n'
+)
+
+
+def _tabs(text):
+    # the ebuild is indented with tabs, even where a value had spaces
+    return text.replace('    ', '\t')
+
 
 class ebuild_keyword(object):
     def __init__(self, arch, stable):
@@ -134,136 +178,118 @@ class Ebuild(object):
         """
         Generate the ebuild in text, given the distributor line
         and the license text.
+
+        The ebuild is left untouched, so rendering it again gives the same
+        text. Only the unresolved dependencies of the last rendering are
+        kept, for get_unresolved().
         """
+        parts = list()
         # EAPI=<eapi>
-        ret = self.get_license_line(distributor, license_text)
-        ret += self.get_eapi_line()
+        parts.append(_tabs(self.get_license_line(distributor, license_text)))
+        parts.append(self.get_eapi_line())
         if self.python_3 and not self.is_ros2:
             # enable python 2.7 and python 3.5
-            ret += self.get_python_compat(['2_7', '3_5', '3_6'])
+            parts.append(_python_compat_py2_py3)
         elif self.python_3:
             # only use 3.5, 3.6 for ROS 2
-            ret += self.get_python_compat(['3_5', '3_6'])
+            parts.append(_python_compat_py3)
         else:
             # fallback to python 2.7
-            ret += self.get_python_compat(['2_7'])
+            parts.append(_python_compat_py2)
         # inherits
-        ret += self.get_inherit_line()
+        parts.append(self.get_inherit_line())
         # description, homepage, src_uri
-        self.description =\
-            sanitize_string(self.description, self.illegal_desc_chars)
-        self.description = trim_string(self.description)
-        ret += "DESCRIPTION=\"" + self.description + "\"\n"
-        ret += "HOMEPAGE=\"" + self.homepage + "\"\n"
-        self.src_uri = self.src_uri.replace(self.name, '${PN}')
-        ret += "SRC_URI=\"" + self.src_uri
-        ret += " -> ${PN}-" + self.distro + "-release-${PV}.tar.gz\"\n\n"
-        # license -- only add if valid
-        if len(self.upstream_license) == 1:
-            self.upstream_license = [
-                lic.replace(', ', ' ') for lic in self.upstream_license
-            ]
-            split = self.upstream_license[0].split(',')
-            if len(split) > 1:
-                # they did something like "BSD,GPL,blah"
-                ret += 'LICENSE="( '
-                ret += ' '.join([get_license(lic.strip()) for lic in split])
-                ret += ' )"\n'
-            else:
-                ret += "LICENSE=\""
-                ret += get_license(self.upstream_license[0]) + "\"\n\n"
-        else:
-            ret += "LICENSE=\"( "
-            ret += ' '.join(
-                [get_license(ul) for ul in self.upstream_license]
-            )
-            ret += " )\"\n"
+        description = trim_string(
+            sanitize_string(self.description, self.illegal_desc_chars))
+        src_uri = self.src_uri.replace(self.name, '${PN}')
+        parts.append(_tabs(_header_template.format(
+            description=description, homepage=self.homepage,
+            src_uri=src_uri, distro=self.distro)))
+        parts.append(self._get_license_line())
         # iterate through the keywords, adding to the KEYWORDS line.
-        ret += "KEYWORDS=\""
-        ret += ' '.join([key.to_string() for key in self.keys])
-        ret += "\"\n"
+        parts.append('KEYWORDS="')
+        parts.append(' '.join([key.to_string() for key in self.keys]))
+        parts.append('"\n')
         if len(self.tdepends) or len(self.tdepends_external):
-            ret += 'IUSE="test"\n'
+            parts.append('IUSE="test"\n')
+        unresolved = list()
+        # external run dependencies which only go in DEPEND
+        depend_only = list()
         # RDEPEND
-        ret += "RDEPEND=\"\n"
+        parts.append('RDEPEND="\n')
         for rdep in sorted(self.rdepends):
-            ret += "    " + "ros-" + self.distro + "/" + rdep + "\n"
+            parts.append('\tros-{0}/{1}\n'.format(self.distro, rdep))
         # internal test dependencies
         for tdep in sorted(self.tdepends):
-            ret += "    " + "test? ( ros-" + self.distro + "/" + tdep + " )\n"
+            parts.append('\ttest? ( ros-{0}/{1} )\n'.format(self.distro, tdep))
         for rdep in sorted(self.rdepends_external):
             try:
                 for res in resolve_dep(rdep, 'gentoo', self.distro)[0]:
                     if res in depend_only_pkgs:
-                        self.depends_external.append(rdep)
+                        depend_only.append(rdep)
                         break
                     else:
-                        ret += "    " + res + "\n"
+                        parts.append('\t{0}\n'.format(res))
             except UnresolvedDependency:
-                self.unresolved_deps.append(rdep)
+                unresolved.append(rdep)
         # external test dependencies
         for tdep in sorted(self.tdepends_external):
             try:
                 for res in resolve_dep(tdep, 'gentoo', self.distro)[0]:
-                    ret += "    test? ( " + res + " )\n"
+                    parts.append('\ttest? ( {0} )\n'.format(res))
             except UnresolvedDependency:
-                self.unresolved_deps.append(tdep)
-        ret += "\"\n"
+                unresolved.append(tdep)
+        parts.append('"\n')
         # DEPEND
-        ret += "DEPEND=\"${RDEPEND}\n"
+        parts.append('DEPEND="${RDEPEND}\n')
         for bdep in sorted(self.depends):
-            ret += "    " + 'ros-{0}/{1}\n'.format(self.distro, bdep)
-        for bdep in sorted(self.depends_external):
+            parts.append('\tros-{0}/{1}\n'.format(self.distro, bdep))
+        for bdep in sorted(self.depends_external + depend_only):
             try:
                 for res in resolve_dep(bdep, 'gentoo', self.distro)[0]:
-                    ret += "    " + res + "\n"
+                    parts.append('\t{0}\n'.format(res))
             except UnresolvedDependency:
-                self.unresolved_deps.append(bdep)
-        ret += "\"\n\n"
+                unresolved.append(bdep)
+        parts.append('"\n\n')
 
         # SLOT
-        ret += "SLOT=\"0\"\n"
+        parts.append('SLOT="0"\n')
         # CMAKE_BUILD_TYPE
         if self.name == "catkin":
-            ret += "BUILD_BINARY=\"0\"\n"
-        ret += "ROS_DISTRO=\"{0}\"\n".format(self.distro)
-        ret += "ROS_PREFIX=\"opt/ros/${ROS_DISTRO}\"\n"
+            parts.append('BUILD_BINARY="0"\n')
+        parts.append(_ros_distro_template.format(distro=self.distro))
 
         # Patch source if needed.
         if self.has_patches:
             # TODO(allenh1): explicitly list patches
-            ret += "\nsrc_prepare() {\n"
-            ret += "    cd ${P}\n"
-            ret += "    EPATCH_SOURCE=\"${FILESDIR}\""
-            ret += " EPATCH_SUFFIX=\"patch\" \\\n"
-            ret += "    EPATCH_FORCE=\"yes\" epatch\n"
+            parts.append(_src_prepare)
             if self.build_type in ['catkin', 'cmake']:
-                ret += "    ros-cmake_src_prepare\n"
-            ret += "}\n"
+                parts.append('\tros-cmake_src_prepare\n')
+            parts.append('}\n')
 
         # source configuration
         if self.name == 'opencv3':
-            ret += "\nsrc_configure() {\n"
-            ret += "    filter-flags '-march=*' '-mcpu=*' '-mtune=*'\n"
-            ret += "    if [[ $(gcc-major-version) -gt 4 ]]; then\n"
-            ret += "        local mycmakeargs=(\n"
-            ret += "            -DWITH_CUDA=OFF\n"
-            ret += "        )\n"
-            ret += '        ewarn "Cuda does not support GCC > 4, so cuda'
-            ret += ' has been disabled."\n'
-            ret += "    fi\n"
-            ret += "    ros-cmake_src_configure\n"
-            ret += "}\n"
+            parts.append(_opencv3_src_configure)
         elif self.name == 'stage':
-            ret += "\nsrc_configure() {\n"
-            ret += "    filter-flags '-std=*'\n"
-            ret += "    ros-cmake_src_configure\n"
-            ret += "}\n"
+            parts.append(_stage_src_configure)
 
-        if len(self.unresolved_deps) > 0:
+        self.unresolved_deps = unresolved
+        if len(unresolved) > 0:
             raise UnresolvedDependency("failed to satisfy dependencies!")
 
-        return ret.replace('    ', '\t')
+        return ''.join(parts)
+
+    def _get_license_line(self):
+        # license -- only add if valid
+        if len(self.upstream_license) == 1:
+            split = self.upstream_license[0].replace(', ', ' ').split(',')
+            if len(split) > 1:
+                # they did something like "BSD,GPL,blah"
+                licenses = get_licenses(lic.strip() for lic in split)
+                return _tabs('LICENSE="( ' + ' '.join(licenses) + ' )"\n')
+            return _tabs('LICENSE="' + get_license(split[0]) + '"\n\n')
+        licenses = get_licenses(self.upstream_license)
+        return _tabs('LICENSE="( ' + ' '.join(licenses) + ' )"\n')
 
     def get_unresolved(self):
         return self.unresolved_deps
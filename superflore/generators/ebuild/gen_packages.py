@@ -12,24 +12,31 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import glob
 import os
 
-from rosdistro.dependency_walker import DependencyWalker
 from rosdistro.manifest_provider import get_release_tag
 from rosdistro.rosdistro import RosPackage
 from rosinstall_generator.distro import _generate_rosinstall
-from rosinstall_generator.distro import get_package_names
+from superflore.distro_index import get_dependency_index
+from superflore.distro_index import get_package_index
 from superflore.exceptions import UnresolvedDependency
 from superflore.generators.ebuild.ebuild import Ebuild
 from superflore.generators.ebuild.metadata_xml import metadata_xml
+from superflore.output_writer import get_output_writer
+from superflore.package_xml import get_package_xml
 from superflore.PackageMetadata import PackageMetadata
+from superflore.pipeline import Done
+from superflore.pipeline import run_stages
+from superflore.resolvability import get_unresolvable
+from superflore.resolvability import preresolve
+from superflore.rosdep_support import get_distro_type
+from superflore.timing import timed
+from superflore.timing import timed_stage
 from superflore.utils import err
-from superflore.utils import get_distros
 from superflore.utils import get_pkg_version
+from superflore.utils import info
 from superflore.utils import make_dir
 from superflore.utils import ok
-from superflore.utils import retry_on_exception
 from superflore.utils import warn
 
 # TODO(allenh1): This is a blacklist of things that
@@ -42,82 +49,187 @@ no_python3 = ['tf']
 org = "Open Source Robotics Foundation"
 org_license = "BSD"
 
+# the types of dependencies which end up in an ebuild
+ebuild_dependency_types = ['buildtool', 'build', 'run', 'test']
 
-def regenerate_pkg(overlay, pkg, distro, preserve_existing=False):
+
+def preresolve_dependencies(distro, pkgs):
+    """Resolve the rosdep keys of the ebuilds of pkgs up front"""
+    return preresolve(distro, 'gentoo', pkgs, ebuild_dependency_types)
+
+
+def get_fingerprint_inputs(overlay, distro, pkg):
+    """
+    Inputs of the ebuild of pkg besides the ones every generator shares:
+    the patches in the overlay, and whether the ebuild is still there.
+    """
+    pkg_dir = '{0}/ros-{1}/{2}'.format(overlay.repo.repo_dir, distro.name, pkg)
+    ebuild_name = '{0}/{1}-{2}.ebuild'.format(
+        pkg_dir, pkg, get_pkg_version(distro, pkg))
+    # the patches are left alone by the generator, so they are taken from
+    # the inventory; the ebuild may have been written since
+    entry = overlay.get_inventory(distro).get(pkg)
+    return {
+        'ebuild': os.path.isfile(ebuild_name),
+        'has_patches': entry.has_patches,
+        'patches': [os.path.basename(f) for f in entry.patches],
+    }
+
+
+def _remove_existing(overlay, existing, manifest_file, keep=None):
+    """
+    Remove the existing ebuilds of a package, except keep, and its
+    Manifest, if given, so that it gets regenerated.
+    """
+    for ebuild_file in existing:
+        if ebuild_file != keep:
+            overlay.repo.queue_removal(ebuild_file)
+    if manifest_file:
+        overlay.repo.queue_removal(manifest_file)
+
+
+@timed_stage('fetch')
+def _fetch_pkg(overlay, pkg, distro, preserve_existing=False):
+    """
+    First stage of regenerate_pkg: find out what is in the overlay and
+    gather everything needed for the ebuild of pkg.
+    """
     version = get_pkg_version(distro, pkg)
     ebuild_name =\
         '/ros-{0}/{1}/{1}-{2}.ebuild'.format(distro.name, pkg, version)
     ebuild_name = overlay.repo.repo_dir + ebuild_name
-    patch_path = '/ros-{}/{}/files'.format(distro.name, pkg)
-    patch_path = overlay.repo.repo_dir + patch_path
-    is_ros2 = get_distros()[distro.name]['distribution_type'] == 'ros2'
-    has_patches = os.path.exists(patch_path)
-    pkg_names = get_package_names(distro)[0]
-    patches = None
-    if os.path.exists(patch_path):
-        patches = [
-            f for f in glob.glob('%s/*.patch' % patch_path)
-        ]
-    if pkg not in pkg_names:
+    is_ros2 = get_distro_type(distro.name) == 'ros2'
+    pkg_index = get_package_index(distro)
+    if pkg not in pkg_index:
         raise RuntimeError("Unknown package '%s'" % (pkg))
-    # otherwise, remove a (potentially) existing ebuild.
+    # what the overlay holds for the package, from a single scan of it
+    entry = overlay.get_inventory(distro).get(pkg)
+    has_patches = entry.has_patches
+    patches = entry.patches if has_patches else None
+    # otherwise, the (potentially) existing ebuild is replaced, unless
+    # the new one turns out to be the same
     prefix = '{0}/ros-{1}/{2}/'.format(overlay.repo.repo_dir, distro.name, pkg)
-    existing = glob.glob('%s*.ebuild' % prefix)
+    existing = entry.ebuilds
+    manifest_file = None
+    if entry.manifest:
+        manifest_file = '{0}/ros-{1}/{2}/Manifest'.format(
+            overlay.repo.repo_dir, distro.name, pkg
+        )
     previous_version = None
-    if preserve_existing and os.path.isfile(ebuild_name):
+    if preserve_existing and ebuild_name in existing:
         ok("ebuild for package '%s' up to date, skipping..." % pkg)
-        return None, [], None
+        return Done((None, [], None))
     elif existing:
-        overlay.repo.remove_file(existing[0])
         previous_version = existing[0].lstrip(prefix).rstrip('.ebuild')
-        manifest_file = '{0}/ros-{1}/{2}/Manifest'.format(
-            overlay.repo.repo_dir, distro.name, pkg
-        )
-        overlay.repo.remove_file(manifest_file)
+    unresolved = get_unresolvable(distro, 'gentoo', pkg)
+    if unresolved:
+        # known to fail, don't bother rendering the ebuild
+        _remove_existing(overlay, existing, manifest_file)
+        dep_err = 'Failed to resolve required dependencies for'
+        err("{0} package {1}!".format(dep_err, pkg))
+        for dep in unresolved:
+            err(" unresolved: \"{}\"".format(dep))
+        return Done((None, unresolved, None))
     try:
         current = gentoo_ebuild(distro, pkg, has_patches)
         current.ebuild.name = pkg
         current.ebuild.patches = patches
         current.ebuild.is_ros2 = is_ros2
     except Exception as e:
+        _remove_existing(overlay, existing, manifest_file)
         err('Failed to generate ebuild for package {}!'.format(pkg))
         raise e
+    return {
+        'overlay': overlay,
+        'pkg': pkg,
+        'distro': distro,
+        'version': version,
+        'previous_version': previous_version,
+        'existing': existing,
+        'manifest_file': manifest_file,
+        'current': current,
+    }
+
+
+@timed_stage('render')
+def _render_pkg(job):
+    """Second stage of regenerate_pkg: render the ebuild and metadata.xml"""
+    current = job['current']
     try:
-        ebuild_text = current.ebuild_text()
-        metadata_text = current.metadata_text()
+        job['ebuild_text'] = current.ebuild_text()
+        job['metadata_text'] = current.metadata_text()
     except UnresolvedDependency:
+        _remove_existing(
+            job['overlay'], job['existing'], job['manifest_file'])
         dep_err = 'Failed to resolve required dependencies for'
-        err("{0} package {1}!".format(dep_err, pkg))
+        err("{0} package {1}!".format(dep_err, job['pkg']))
         unresolved = current.ebuild.get_unresolved()
         for dep in unresolved:
             err(" unresolved: \"{}\"".format(dep))
-        return None, current.ebuild.get_unresolved(), None
+        return Done((None, current.ebuild.get_unresolved(), None))
     except KeyError as ke:
-        err("Failed to parse data for package {}!".format(pkg))
+        _remove_existing(
+            job['overlay'], job['existing'], job['manifest_file'])
+        err("Failed to parse data for package {}!".format(job['pkg']))
         raise ke
+    return job
+
+
+@timed_stage('write')
+def _write_pkg(job):
+    """Last stage of regenerate_pkg: write the ebuild and metadata.xml"""
+    overlay = job['overlay']
+    distro = job['distro']
+    pkg = job['pkg']
     make_dir(
         "{}/ros-{}/{}".format(overlay.repo.repo_dir, distro.name, pkg)
     )
     success_msg = 'Successfully generated ebuild for package'
     ok('{0} \'{1}\'.'.format(success_msg, pkg))
 
-    try:
-        ebuild_file = '{0}/ros-{1}/{2}/{2}-{3}.ebuild'.format(
-            overlay.repo.repo_dir,
-            distro.name, pkg, version
-        )
-        ebuild_file = open(ebuild_file, "w")
-        metadata_file = '{0}/ros-{1}/{2}/metadata.xml'.format(
-            overlay.repo.repo_dir,
-            distro.name, pkg
-        )
-        metadata_file = open(metadata_file, "w")
-        ebuild_file.write(ebuild_text)
-        metadata_file.write(metadata_text)
-    except Exception as e:
-        err("Failed to write ebuild/metadata to disk!")
-        raise e
-    return current, previous_version, pkg
+    writer = get_output_writer()
+    ebuild_file = '{0}/ros-{1}/{2}/{2}-{3}.ebuild'.format(
+        overlay.repo.repo_dir,
+        distro.name, pkg, job['version']
+    )
+    metadata_file = '{0}/ros-{1}/{2}/metadata.xml'.format(
+        overlay.repo.repo_dir,
+        distro.name, pkg
+    )
+    current = job['current']
+    # removing other versions of the ebuild changes the Manifest as well
+    current.changed = not (
+        job['existing'] == [ebuild_file] and
+        writer.is_unchanged(ebuild_file, job['ebuild_text']) and
+        writer.is_unchanged(metadata_file, job['metadata_text'])
+    )
+    if not current.changed:
+        # leave the files and the Manifest alone
+        info("ebuild for package '%s' is unchanged" % pkg)
+        return current, job['previous_version'], pkg
+    _remove_existing(
+        overlay, job['existing'], job['manifest_file'], keep=ebuild_file)
+    # written in the background, see generate_installers()
+    current.written = [
+        writer.write(ebuild_file, job['ebuild_text']),
+        writer.write(metadata_file, job['metadata_text']),
+    ]
+    return current, job['previous_version'], pkg
+
+
+# the stages of regenerate_pkg, and whether each may run in parallel
+regenerate_pkg_stages = [
+    (_fetch_pkg, True),
+    (_render_pkg, False),
+    (_write_pkg, False),
+]
+
+
+def regenerate_pkg(overlay, pkg, distro, preserve_existing=False):
+    return run_stages(
+        [func for func, _ in regenerate_pkg_stages],
+        overlay, pkg, distro, preserve_existing
+    )
 
 
 def _gen_metadata_for_package(
@@ -125,7 +237,7 @@ def _gen_metadata_for_package(
 ):
     pkg_metadata_xml = metadata_xml()
     try:
-        pkg_xml = retry_on_exception(ros_pkg.get_package_xml, distro.name)
+        pkg_xml = get_package_xml(distro, pkg_name)
     except Exception:
         warn("fetch metadata for package {}".format(pkg_name))
         return pkg_metadata_xml
@@ -145,31 +257,32 @@ def _gen_ebuild_for_package(
 
     pkg_ebuild.distro = distro.name
     pkg_ebuild.src_uri = pkg_rosinstall[0]['tar']['uri']
-    pkg_names = get_package_names(distro)
-    pkg_dep_walker = DependencyWalker(distro)
+    pkg_index = get_package_index(distro)
+    with timed('dependencies'):
+        pkg_dep_index = get_dependency_index(distro)
 
-    pkg_buildtool_deps = pkg_dep_walker.get_depends(pkg_name, "buildtool")
-    pkg_build_deps = pkg_dep_walker.get_depends(pkg_name, "build")
-    pkg_run_deps = pkg_dep_walker.get_depends(pkg_name, "run")
-    pkg_test_deps = pkg_dep_walker.get_depends(pkg_name, "test")
+        pkg_buildtool_deps = pkg_dep_index.get_depends(pkg_name, "buildtool")
+        pkg_build_deps = pkg_dep_index.get_depends(pkg_name, "build")
+        pkg_run_deps = pkg_dep_index.get_depends(pkg_name, "run")
+        pkg_test_deps = pkg_dep_index.get_depends(pkg_name, "test")
 
     pkg_keywords = ['x86', 'amd64', 'arm', 'arm64']
 
     # add run dependencies
     for rdep in pkg_run_deps:
-        pkg_ebuild.add_run_depend(rdep, rdep in pkg_names[0])
+        pkg_ebuild.add_run_depend(rdep, rdep in pkg_index)
 
     # add build dependencies
     for bdep in pkg_build_deps:
-        pkg_ebuild.add_build_depend(bdep, bdep in pkg_names[0])
+        pkg_ebuild.add_build_depend(bdep, bdep in pkg_index)
 
     # add build tool dependencies
     for tdep in pkg_buildtool_deps:
-        pkg_ebuild.add_build_depend(tdep, tdep in pkg_names[0])
+        pkg_ebuild.add_build_depend(tdep, tdep in pkg_index)
 
     # add test dependencies
     for test_dep in pkg_test_deps:
-        pkg_ebuild.add_test_depend(test_dep, test_dep in pkg_names[0])
+        pkg_ebuild.add_test_depend(test_dep, test_dep in pkg_index)
 
     # add keywords
     for key in pkg_keywords:
@@ -177,7 +290,7 @@ def _gen_ebuild_for_package(
 
     # parse through package xml
     try:
-        pkg_xml = retry_on_exception(ros_pkg.get_package_xml, distro.name)
+        pkg_xml = get_package_xml(distro, pkg_name)
     except Exception:
         warn("fetch metadata for package {}".format(pkg_name))
         return pkg_ebuild
@@ -206,6 +319,10 @@ class gentoo_ebuild(object):
             _gen_ebuild_for_package(distro, pkg_name,
                                     pkg, repo, ros_pkg, pkg_rosinstall)
         self.ebuild.has_patches = has_patches
+        # whether writing the ebuild changed the overlay
+        self.changed = True
+        # the futures of the files handed over to the output writer
+        self.written = []
 
         if pkg_name in no_python3:
             self.ebuild.python_3 = False
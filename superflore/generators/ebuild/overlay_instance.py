@@ -13,31 +13,125 @@
 # limitations under the License.
 
 import os
+import threading
 import time
 
 import docker
+from superflore.distro_index import get_package_index
 from superflore.docker import Docker
+from superflore.output_writer import flush_output
 from superflore.repo_instance import RepoInstance
+from superflore.timing import timed
 from superflore.utils import info
 from superflore.utils import rand_ascii_str
+from superflore.utils import warn
+
+
+class OverlayPackage(object):
+    """
+    What the overlay holds for a package: the paths of its ebuilds,
+    whether it has a Manifest and a files directory, and the paths of
+    the patches in the latter.
+    """
+    def __init__(self):
+        self.ebuilds = list()
+        self.manifest = False
+        self.has_patches = False
+        self.patches = list()
+
+
+class OverlayInventory(object):
+    """
+    The packages under ros-<distro>/ of the overlay, gathered with a single
+    scan of the directory: a table from each package name to its
+    OverlayPackage, and the sorted list of the stale packages, which are
+    no longer part of the distro.
+    """
+    def __init__(self, repo_dir, distro):
+        self.distro = distro
+        self.packages = dict()
+        distro_dir = '{0}/ros-{1}'.format(repo_dir, distro.name)
+        if os.path.isdir(distro_dir):
+            for pkg_entry in os.scandir(distro_dir):
+                if pkg_entry.is_dir():
+                    self.packages[pkg_entry.name] = self._scan_package(
+                        '{0}/{1}'.format(distro_dir, pkg_entry.name))
+        pkg_index = get_package_index(distro)
+        self.stale = sorted(
+            pkg for pkg in self.packages if pkg not in pkg_index)
+
+    @staticmethod
+    def _scan_package(pkg_dir):
+        pkg = OverlayPackage()
+        for entry in os.scandir(pkg_dir):
+            if entry.name.endswith('.ebuild'):
+                pkg.ebuilds.append('{0}/{1}'.format(pkg_dir, entry.name))
+            elif entry.name == 'Manifest':
+                pkg.manifest = True
+            elif entry.name == 'files':
+                pkg.has_patches = True
+                if entry.is_dir():
+                    pkg.patches = sorted(
+                        '{0}/files/{1}'.format(pkg_dir, patch.name)
+                        for patch in os.scandir(entry.path)
+                        if patch.name.endswith('.patch')
+                    )
+        pkg.ebuilds.sort()
+        return pkg
+
+    def get(self, pkg):
+        """Return the OverlayPackage of pkg, empty if it isn't there"""
+        return self.packages.get(pkg) or OverlayPackage()
 
 
 class RosOverlay(object):
     def __init__(
         self, repo_dir, do_clone, org='ros', repo='ros-overlay',
-        from_branch='', new_branch=True
+        from_branch='', new_branch=True, clone_depth=None, clone_filter=None,
+        sparse_distros=None, mirror=None
     ):
+        sparse_paths = None
+        if sparse_distros is not None:
+            # repoman needs the overlay's metadata next to the ebuilds
+            sparse_paths = ['eclass', 'metadata', 'profiles'] + [
+                'ros-{0}'.format(distro) for distro in sparse_distros
+            ]
         self.repo = RepoInstance(
             org, repo, repo_dir=repo_dir, do_clone=do_clone,
-            from_branch=from_branch)
+            from_branch=from_branch, clone_depth=clone_depth,
+            clone_filter=clone_filter, sparse_paths=sparse_paths,
+            mirror=mirror)
         if new_branch:
             self.branch_name = 'gentoo-bot-%s' % rand_ascii_str()
             info('Creating new branch {0}...'.format(self.branch_name))
             self.repo.create_branch(self.branch_name)
         else:
             self.branch_name = None
+        # OverlayInventory instances, keyed by distro name
+        self.inventories = dict()
+        self.inventories_lock = threading.Lock()
+
+    def get_inventory(self, distro, refresh=False):
+        """
+        Return the OverlayInventory of distro, taken the first time it's
+        asked for (or again with refresh).
+        """
+        with self.inventories_lock:
+            inventory = self.inventories.get(distro.name)
+            if refresh or not inventory or inventory.distro is not distro:
+                with timed('inventory'):
+                    self.inventories[distro.name] = OverlayInventory(
+                        self.repo.repo_dir, distro)
+            return self.inventories[distro.name]
 
     def commit_changes(self, distro):
+        # waiting for the files to be written isn't git time
+        flush_output()
+        self._commit_changes(distro)
+
+    @timed('git')
+    def _commit_changes(self, distro):
+        self.repo.flush_removals()
         info('Adding changes...')
         self.repo.git.add(self.repo.repo_dir)
         if self.repo.git.status('--porcelain') == '':
@@ -61,6 +155,16 @@ class RosOverlay(object):
 
     def regenerate_manifests(
         self, regen_dict, image_owner='allenh1', image_name='ros_gentoo_base'
+    ):
+        # the ebuilds have to be on disk for repoman, and the packages
+        # whose files couldn't be written are left out
+        failed_dirs = set(os.path.dirname(f) for f in flush_output())
+        self._regenerate_manifests(
+            regen_dict, image_owner, image_name, failed_dirs)
+
+    @timed('manifests')
+    def _regenerate_manifests(
+        self, regen_dict, image_owner, image_name, failed_dirs
     ):
         info(
             "Pulling docker image '%s/%s:latest'..." % (
@@ -78,6 +182,12 @@ class RosOverlay(object):
         dock.map_directory(self.repo.repo_dir, '/tmp/ros-overlay')
         for key in regen_dict.keys():
             for pkg in regen_dict[key]:
+                if '{0}/ros-{1}/{2}'.format(
+                    self.repo.repo_dir, key, pkg
+                ) in failed_dirs:
+                    warn("Not generating the Manifest of package '{0}'"
+                         .format(pkg))
+                    continue
                 pkg_dir = '/tmp/ros-overlay/ros-{0}/{1}'.format(key, pkg)
                 dock.add_bash_command('cd {0}'.format(pkg_dir))
                 dock.add_bash_command('repoman manifest')
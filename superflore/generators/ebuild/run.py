@@ -12,17 +12,30 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import atexit
 import os
 import sys
 
 from rosinstall_generator.distro import get_distro
+from superflore.checkpoint import Checkpoint
 from superflore.exceptions import NoGitHubAuthToken
+from superflore.fingerprint import FingerprintStore
 from superflore.generate_installers import generate_installers
+from superflore.generators.ebuild.gen_packages import get_fingerprint_inputs
+from superflore.generators.ebuild.gen_packages import preresolve_dependencies
 from superflore.generators.ebuild.gen_packages import regenerate_pkg
+from superflore.generators.ebuild.gen_packages import regenerate_pkg_stages
 from superflore.generators.ebuild.overlay_instance import RosOverlay
+from superflore.package_xml import PackageXmlStore
+from superflore.package_xml import prefetch_package_xmls
+from superflore.package_xml import set_package_xml_store
 from superflore.parser import get_parser
 from superflore.repo_instance import RepoInstance
+from superflore.repo_instance import RepoMirror
+from superflore.snapshot import use_snapshot
 from superflore.TempfileManager import TempfileManager
+from superflore.timing import enable_timing
+from superflore.timing import write_timing_report
 from superflore.utils import clean_up
 from superflore.utils import err
 from superflore.utils import file_pr
@@ -31,6 +44,9 @@ from superflore.utils import gen_missing_deps_msg
 from superflore.utils import get_distros_by_status
 from superflore.utils import info
 from superflore.utils import load_pr
+from superflore.utils import log_license_aliases
+from superflore.utils import log_resolution_stats
+from superflore.utils import make_dir
 from superflore.utils import ok
 from superflore.utils import save_pr
 from superflore.utils import url_to_repo_org
@@ -45,6 +61,19 @@ def main():
     pr_comment = args.pr_comment
     skip_keys = args.skip_keys or []
     selected_targets = None
+    if args.incremental and not args.cache_dir:
+        parser.error('Invalid args! --incremental requires --cache-dir')
+    if args.resume and not args.output_repository_path:
+        parser.error(
+            'Invalid args! --resume requires --output-repository-path')
+    if args.timing_report:
+        enable_timing()
+        atexit.register(write_timing_report, args.timing_report)
+    atexit.register(log_resolution_stats)
+    atexit.register(log_license_aliases)
+    if args.snapshot:
+        # before anything loads the rosdistro index
+        use_snapshot(args.snapshot)
     if not args.dry_run:
         if 'SUPERFLORE_GITHUB_TOKEN' not in os.environ:
             raise NoGitHubAuthToken()
@@ -74,10 +103,18 @@ def main():
         parser.error('Invalid args! --only requires specifying --ros-distro')
     if not selected_targets:
         selected_targets = get_distros_by_status('active')
+    if args.cache_dir and not args.snapshot:
+        set_package_xml_store(
+            PackageXmlStore(os.path.join(args.cache_dir, 'package-xml')))
     repo_org = 'ros'
     repo_name = 'ros-overlay'
     if args.upstream_repo:
         repo_org, repo_name = url_to_repo_org(args.upstream_repo)
+    mirror = None
+    if args.cache_dir and not args.output_repository_path:
+        # check the repository out of a mirror kept between runs
+        mirror = RepoMirror(os.path.join(
+            args.cache_dir, 'mirrors', repo_org, '{0}.git'.format(repo_name)))
     with TempfileManager(args.output_repository_path) as _repo:
         if not args.output_repository_path:
             # give our group write permissions to the temp dir
@@ -90,6 +127,11 @@ def main():
             repo=repo_name,
             from_branch=args.upstream_branch,
             new_branch=(not args.no_branch),
+            clone_depth=args.clone_depth,
+            clone_filter=args.clone_filter,
+            sparse_distros=(selected_targets if args.sparse_checkout
+                            else None),
+            mirror=mirror,
         )
         if not preserve_existing and not args.only:
             pr_comment = pr_comment or (
@@ -119,6 +161,11 @@ def main():
             missing_depends = set()
             to_commit = set()
             will_file_pr = False
+            prefetch_package_xmls(
+                get_distro(args.ros_distro),
+                [pkg for pkg in args.only if pkg not in skip_keys],
+                args.fetch_jobs
+            )
             for pkg in args.only:
                 if pkg in skip_keys:
                     warn("Package '%s' is in skip-keys list, skipping..."
@@ -138,8 +185,14 @@ def main():
                 except KeyError:
                     err("No package to satisfy key '%s'" % pkg)
                     continue
-                if ebuild:
-                    to_commit.add(pkg)
+                if ebuild and any(
+                    written.exception() for written in ebuild.written
+                ):
+                    err("Failed to write the ebuild of package '%s'" % pkg)
+                elif ebuild:
+                    # the Manifest of an unchanged ebuild is left alone
+                    if ebuild.changed:
+                        to_commit.add(pkg)
                     will_file_pr = True
             # if no packages succeeded, exit with error
             if not will_file_pr:
@@ -168,21 +221,50 @@ def main():
             ok('Successfully synchronized repositories!')
             sys.exit(0)
 
-        for distro in selected_targets:
-            distro_installers, distro_broken, distro_changes =\
-                generate_installers(
-                    get_distro(distro),
-                    overlay=overlay,
-                    gen_pkg_func=regenerate_pkg,
-                    preserve_existing=preserve_existing,
-                    skip_keys=skip_keys,
-                )
-            for key in distro_broken.keys():
-                for pkg in distro_broken[key]:
-                    total_broken.add(pkg)
+        fingerprint_file = None
+        if args.cache_dir:
+            make_dir(args.cache_dir)
+            fingerprint_file = os.path.join(
+                args.cache_dir, 'gentoo-fingerprints.json')
+        checkpoint_file = os.path.join(
+            overlay.repo.repo.git_dir, 'superflore-checkpoint.jsonl')
+        with FingerprintStore(
+            fingerprint_file,
+            'gentoo',
+            incremental=args.incremental,
+            get_extra_inputs=lambda distro, pkg: get_fingerprint_inputs(
+                overlay, distro, pkg),
+        ) as fingerprints, \
+                Checkpoint(checkpoint_file, args.resume) as checkpoint:
+            for distro in selected_targets:
+                ros_distro = get_distro(distro)
+                # scan the overlay once; packages which dropped out of the
+                # distro are left alone, but reported
+                stale = overlay.get_inventory(ros_distro).stale
+                if stale:
+                    warn('Packages no longer in ros-{0}: {1}'.format(
+                        distro, ', '.join(stale)))
+                distro_installers, distro_broken, distro_changes =\
+                    generate_installers(
+                        ros_distro,
+                        overlay=overlay,
+                        gen_pkg_func=regenerate_pkg,
+                        preserve_existing=preserve_existing,
+                        skip_keys=skip_keys,
+                        jobs=args.jobs,
+                        stages=regenerate_pkg_stages,
+                        fetch_jobs=args.fetch_jobs,
+                        fingerprints=(
+                            fingerprints if fingerprint_file else None),
+                        checkpoint=checkpoint,
+                        preresolve=preresolve_dependencies,
+                    )
+                for key in distro_broken.keys():
+                    for pkg in distro_broken[key]:
+                        total_broken.add(pkg)
 
-            total_changes[distro] = distro_changes
-            total_installers[distro] = distro_installers
+                total_changes[distro] = distro_changes
+                total_installers[distro] = distro_installers
 
         num_changes = 0
         for distro_name in total_changes:
@@ -0,0 +1,176 @@
+# Copyright 2020 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import atexit
+from concurrent.futures import Future
+import hashlib
+import os
+import queue
+import stat
+import tempfile
+import threading
+
+from superflore.timing import timed
+from superflore.utils import err
+
+# the OutputWriter shared by the generators (see get_output_writer())
+output_writer = None
+output_writer_lock = threading.Lock()
+
+
+def _get_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _get_file_digest(filename):
+    try:
+        with open(filename, 'rb') as existing_file:
+            return _get_digest(existing_file.read())
+    except FileNotFoundError:
+        return None
+
+
+def _get_umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+class OutputWriter(object):
+    """
+    Writes the generated files from a background thread, in the order they
+    are handed over, so that generating packages never waits for the disk.
+
+    Each file is written to a temporary file next to it, which is then
+    renamed over it: a file is either left as it was or fully written,
+    even if the run dies. New files get the permissions open() would give
+    them; existing files keep theirs. Files which already hold the text
+    are left alone.
+    """
+    def __init__(self, queue_depth=64):
+        self.queue = queue.Queue(maxsize=max(queue_depth, 1))
+        self.umask = _get_umask()
+        self.thread = None
+        self.thread_lock = threading.Lock()
+        self.failed = list()
+        # the digest of the text handed over for each file not written yet
+        self.pending = dict()
+        self.lock = threading.Lock()
+
+    def write(self, filename, text):
+        """
+        Hand text over to be written to filename. Return a Future which
+        is done once it is written, holding whether the file changed, or
+        the exception if it failed.
+        """
+        data = text.encode()
+        future = Future()
+        with self.thread_lock:
+            if not self.thread:
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+            with self.lock:
+                self.pending[filename] = _get_digest(data)
+            self.queue.put((filename, data, future))
+        return future
+
+    def is_unchanged(self, filename, text):
+        """
+        Return True if filename holds text, or will once what was handed
+        over for it is written.
+        """
+        with self.lock:
+            digest = self.pending.get(filename)
+        if digest is None:
+            digest = _get_file_digest(filename)
+        return digest == _get_digest(text.encode())
+
+    def _run(self):
+        while True:
+            filename, data, future = self.queue.get()
+            try:
+                future.set_result(self._write(filename, data))
+            except Exception as e:
+                err('Failed to write {0} to disk! {1}'.format(filename, e))
+                with self.lock:
+                    self.failed.append(filename)
+                future.set_exception(e)
+            finally:
+                with self.lock:
+                    if self.pending.get(filename) == _get_digest(data):
+                        del self.pending[filename]
+                self.queue.task_done()
+
+    def _write(self, filename, data):
+        if _get_file_digest(filename) == _get_digest(data):
+            return False
+        fd, tmp_filename = tempfile.mkstemp(
+            dir=os.path.dirname(filename) or '.',
+            prefix='.{0}.'.format(os.path.basename(filename)),
+            suffix='.tmp'
+        )
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                tmp_file.write(data)
+            try:
+                mode = stat.S_IMODE(os.stat(filename).st_mode)
+            except FileNotFoundError:
+                mode = 0o666 & ~self.umask
+            os.chmod(tmp_filename, mode)
+            os.replace(tmp_filename, filename)
+        except BaseException:
+            try:
+                os.remove(tmp_filename)
+            except OSError:
+                pass
+            raise
+        return True
+
+    def flush(self):
+        """
+        Wait for every file handed over to be written. Return the sorted
+        list of the files which failed since the last flush.
+        """
+        self.queue.join()
+        with self.lock:
+            failed, self.failed = self.failed, list()
+        return sorted(failed)
+
+
+def get_output_writer():
+    """
+    Return the OutputWriter shared by the generators. Whatever it holds is
+    written out when superflore exits, at the latest.
+    """
+    global output_writer
+    with output_writer_lock:
+        if output_writer is None:
+            output_writer = OutputWriter()
+            atexit.register(output_writer.flush)
+        return output_writer
+
+
+def flush_output():
+    """
+    Wait for the shared OutputWriter to write everything handed over, and
+    report the files which failed since the last flush. Return their
+    sorted list. The wait is timed as writing.
+    """
+    with timed('write'):
+        failed = get_output_writer().flush()
+    if failed:
+        err('Failed to write {0} files to disk:'.format(len(failed)))
+        for filename in failed:
+            err('  {0}'.format(filename))
+    return failed
@@ -0,0 +1,187 @@
+# Copyright 2020 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from concurrent.futures import ThreadPoolExecutor
+import gzip
+import hashlib
+import json
+import os
+import threading
+
+from rosdistro.manifest_provider import get_release_tag
+from rosdistro.rosdistro import RosPackage
+from superflore.timing import timed
+from superflore.utils import info
+from superflore.utils import make_dir
+from superflore.utils import retry_on_exception
+from superflore.utils import warn
+
+# package.xml contents, keyed by (distro name, package name)
+package_xml_cache = {}
+package_xml_lock = threading.Lock()
+# on-disk store consulted before fetching, see set_package_xml_store()
+package_xml_store = None
+
+
+class PackageXmlStore(object):
+    """
+    On-disk store of package.xml files, keyed by release repository URL
+    and release tag. The package.xml at a given tag never changes, so it
+    only ever needs to be downloaded once.
+
+    The files are kept gzipped and named after the sha256 of their
+    contents. The index maps each URL and tag to a file; it is only ever
+    appended to, one JSON object per line, so an interrupted run loses
+    nothing it already stored.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.index_file = os.path.join(path, 'index.jsonl')
+        self.index = dict()
+        self.lock = threading.Lock()
+        make_dir(path)
+        if os.path.isfile(self.index_file):
+            with open(self.index_file, 'r') as index_file:
+                for line in index_file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # a partly written last line
+                        continue
+                    self.index[entry['key']] = entry['sha256']
+
+    @staticmethod
+    def _key(url, tag):
+        return '{0}#{1}'.format(url, tag)
+
+    def _blob_path(self, digest):
+        return os.path.join(self.path, digest[:2], digest + '.xml.gz')
+
+    def has(self, url, tag):
+        with self.lock:
+            return self._key(url, tag) in self.index
+
+    def get(self, url, tag):
+        """Return the stored package.xml, or None"""
+        with self.lock:
+            digest = self.index.get(self._key(url, tag))
+        if not digest:
+            return None
+        try:
+            with gzip.open(self._blob_path(digest), 'rb') as blob:
+                pkg_xml = blob.read()
+        except (OSError, EOFError):
+            return None
+        if hashlib.sha256(pkg_xml).hexdigest() != digest:
+            return None
+        return pkg_xml
+
+    def put(self, url, tag, pkg_xml):
+        if isinstance(pkg_xml, str):
+            pkg_xml = pkg_xml.encode()
+        digest = hashlib.sha256(pkg_xml).hexdigest()
+        blob_path = self._blob_path(digest)
+        if not os.path.isfile(blob_path):
+            make_dir(os.path.dirname(blob_path))
+            tmp_path = '{0}.{1}.tmp'.format(blob_path, threading.get_ident())
+            with gzip.open(tmp_path, 'wb') as blob:
+                blob.write(pkg_xml)
+            os.replace(tmp_path, blob_path)
+        key = self._key(url, tag)
+        with self.lock:
+            if self.index.get(key) == digest:
+                return
+            self.index[key] = digest
+            with open(self.index_file, 'a') as index_file:
+                index_file.write(
+                    json.dumps({'key': key, 'sha256': digest}) + '\n')
+
+
+def set_package_xml_store(store):
+    """Read package.xml files from (and add them to) store from now on"""
+    global package_xml_store
+    package_xml_store = store
+
+
+def _get_stored_package_xml(repo, pkg_name):
+    if not package_xml_store:
+        return None
+    return package_xml_store.get(repo.url, get_release_tag(repo, pkg_name))
+
+
+def get_package_xml(distro, pkg_name, retry_msg='', error_msg=''):
+    """
+    Return the package.xml of the released package pkg_name.
+
+    The package.xml is served from memory when it was prefetched, then
+    from the package.xml store if there is one, and fetched from the
+    release repository otherwise.
+    """
+    key = (distro.name, pkg_name)
+    with package_xml_lock:
+        if key in package_xml_cache:
+            return package_xml_cache[key]
+    pkg = distro.release_packages[pkg_name]
+    repo = distro.repositories[pkg.repository_name].release_repository
+    pkg_xml = _get_stored_package_xml(repo, pkg_name)
+    if pkg_xml is None:
+        ros_pkg = RosPackage(pkg_name, repo)
+        with timed('package_xml', pkg_name):
+            pkg_xml = retry_on_exception(
+                ros_pkg.get_package_xml, distro.name,
+                retry_msg=retry_msg, error_msg=error_msg
+            )
+        if package_xml_store:
+            package_xml_store.put(
+                repo.url, get_release_tag(repo, pkg_name), pkg_xml)
+    with package_xml_lock:
+        package_xml_cache[key] = pkg_xml
+    return pkg_xml
+
+
+def prefetch_package_xmls(distro, pkg_names, jobs=8):
+    """
+    Fetch the package.xml of every package in pkg_names ahead of time,
+    with at most jobs requests in flight.
+
+    Packages that fail to fetch are left out of the cache, so that the
+    generators retry them (and report the failure) as before. Packages
+    already in the package.xml store aren't fetched at all.
+    """
+    def _is_pending(pkg_name):
+        if (distro.name, pkg_name) in package_xml_cache:
+            return False
+        if not package_xml_store or pkg_name not in distro.release_packages:
+            return True
+        pkg = distro.release_packages[pkg_name]
+        repo = distro.repositories[pkg.repository_name].release_repository
+        return not package_xml_store.has(
+            repo.url, get_release_tag(repo, pkg_name))
+
+    pending = [pkg for pkg in pkg_names if _is_pending(pkg)]
+    if not pending or jobs < 1:
+        return
+    info("Prefetching %d package.xml files for distro '%s'..." % (
+        len(pending), distro.name))
+
+    def _fetch(pkg_name):
+        try:
+            get_package_xml(distro, pkg_name)
+        except Exception as e:
+            warn("Failed to prefetch package.xml for package '%s': %s" % (
+                pkg_name, e))
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        # consume the results so that the pool is drained before returning
+        list(executor.map(_fetch, pending))
@@ -82,4 +82,63 @@ def get_parser(
             nargs='+',
             help='packages to skip during regeneration'
         )
+        parser.add_argument(
+            '--jobs',
+            help='number of packages to generate in parallel',
+            type=int,
+            default=1
+        )
+        parser.add_argument(
+            '--fetch-jobs',
+            help='number of package.xml files to fetch in parallel',
+            type=int,
+            default=8
+        )
+        parser.add_argument(
+            '--cache-dir',
+            help='location to keep caches between runs',
+            type=str
+        )
+        parser.add_argument(
+            '--incremental',
+            help='only regenerate packages whose inputs changed since the '
+                 + 'last run (requires --cache-dir)',
+            action='store_true'
+        )
+        parser.add_argument(
+            '--resume',
+            help='continue an interrupted run from its checkpoint '
+                 + '(requires --output-repository-path)',
+            action='store_true'
+        )
+        parser.add_argument(
+            '--timing-report',
+            help='write a JSON report of the time spent in each phase '
+                 + 'of the run to this file',
+            type=str
+        )
+        parser.add_argument(
+            '--snapshot',
+            help='take the rosdistro and rosdep data from this snapshot '
+                 + '(see superflore-snapshot) instead of the network',
+            type=str
+        )
+        parser.add_argument(
+            '--clone-depth',
+            help='clone only this many commits of the history of the '
+                 + 'repository',
+            type=int
+        )
+        parser.add_argument(
+            '--clone-filter',
+            help='make a partial clone of the repository with this filter '
+                 + '(such as blob:none)',
+            type=str
+        )
+        parser.add_argument(
+            '--sparse-checkout',
+            help='check out only the directories of the distro(s) being '
+                 + 'regenerated when cloning',
+            action='store_true'
+        )
     return parser
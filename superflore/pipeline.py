@@ -0,0 +1,148 @@
+# Copyright 2020 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import queue
+import threading
+
+
+class Done(object):
+    """
+    Returned by a stage to finish an item early, skipping the remaining
+    stages. The pipeline result for the item is Done.result.
+    """
+    def __init__(self, result):
+        self.result = result
+
+
+class _Failed(object):
+    """An exception raised by a stage, forwarded to the consumer"""
+    def __init__(self, exception):
+        self.exception = exception
+
+
+_END = object()
+
+
+def _unwrap(value):
+    if isinstance(value, _Failed):
+        raise value.exception
+    if isinstance(value, Done):
+        return value.result
+    return value
+
+
+def run_stages(funcs, *args):
+    """
+    Run an item through each of the stage functions in turn, in the
+    calling thread. The first stage is called with args, every other
+    stage with the return value of the one before it.
+    """
+    value = funcs[0](*args)
+    for func in funcs[1:]:
+        if isinstance(value, Done):
+            break
+        value = func(value)
+    return _unwrap(value)
+
+
+class Pipeline(object):
+    """
+    Run items through a chain of stages, each served by its own worker
+    threads and connected to the next by a bounded queue, so that e.g.
+    network-bound and disk-bound stages of different items overlap.
+
+    At most queue_depth items are in the pipeline at any time, which
+    bounds the memory used no matter how many items are fed to it.
+    """
+    def __init__(self, stages, queue_depth=16):
+        # stages is a list of (function, number of worker threads)
+        self.stages = [(func, max(workers, 1)) for func, workers in stages]
+        self.queue_depth = max(queue_depth, 1)
+
+    @staticmethod
+    def _run_stage(func, is_first, in_queue, out_queue, remaining):
+        while True:
+            item = in_queue.get()
+            if item is _END:
+                break
+            seq, value = item
+            if not isinstance(value, (Done, _Failed)):
+                try:
+                    value = func(*value) if is_first else func(value)
+                except Exception as e:
+                    value = _Failed(e)
+            out_queue.put((seq, value))
+        # the last worker of a stage to finish tells every worker of the
+        # next stage that there is nothing more to come
+        with remaining['lock']:
+            remaining['workers'] -= 1
+            if remaining['workers'] == 0:
+                for _ in range(remaining['next_workers']):
+                    out_queue.put(_END)
+
+    def run(self, items):
+        """
+        Feed the argument tuples in items to the first stage, and yield a
+        callable returning (or raising) the result for each item, in the
+        same order as items.
+        """
+        in_flight = threading.BoundedSemaphore(self.queue_depth)
+        queues = [
+            queue.Queue(maxsize=self.queue_depth)
+            for _ in range(len(self.stages) + 1)
+        ]
+
+        def _feed():
+            for seq, args in enumerate(items):
+                in_flight.acquire()
+                queues[0].put((seq, args))
+            for _ in range(self.stages[0][1]):
+                queues[0].put(_END)
+
+        threads = [threading.Thread(target=_feed, daemon=True)]
+        for n, (func, workers) in enumerate(self.stages):
+            next_workers = 1
+            if n + 1 < len(self.stages):
+                next_workers = self.stages[n + 1][1]
+            remaining = {
+                'lock': threading.Lock(),
+                'workers': workers,
+                'next_workers': next_workers,
+            }
+            for _ in range(workers):
+                threads.append(threading.Thread(
+                    target=self._run_stage,
+                    args=(func, n == 0, queues[n], queues[n + 1], remaining),
+                    daemon=True
+                ))
+        for thread in threads:
+            thread.start()
+
+        # results come out of the last stage in any order; hand them back
+        # in the order the items went in
+        pending = dict()
+        next_seq = 0
+        while True:
+            item = queues[-1].get()
+            if item is _END:
+                break
+            seq, value = item
+            pending[seq] = value
+            while next_seq in pending:
+                value = pending.pop(next_seq)
+                next_seq += 1
+                in_flight.release()
+                yield lambda value=value: _unwrap(value)
+        for thread in threads:
+            thread.join()
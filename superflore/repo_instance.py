@@ -12,22 +12,156 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import atexit
 import os
 import shutil
+import tempfile
+import threading
 
 from git import Repo
+from git.cmd import Git
 from git.exc import GitCommandError as GitGotGot
 from github import Github
+from superflore.timing import timed
 from superflore.utils import err
 from superflore.utils import info
 from superflore.utils import ok
 from superflore.utils import retry_on_exception
 
 
+class RepoMirror(object):
+    """
+    A bare mirror of a repository kept between runs. Each run checks out
+    a worktree of it rather than cloning the repository again, and the
+    mirror only has to fetch what changed since the last run.
+    """
+    # the branches add_worktree() makes
+    worktree_branch_prefix = 'superflore-worktree/'
+
+    def __init__(self, path):
+        self.path = path
+        # run in the mirror itself: as core.bare lives in the mirror's own
+        # config.worktree (see update()), Repo would not take it for bare
+        self.git = Git(path)
+
+    @timed('git')
+    def update(self, repo_url, depth=None, clone_filter=None):
+        """
+        Fetch the branches of repo_url into the mirror, creating it (with
+        the given depth and partial clone filter) the first time.
+        """
+        if not os.path.isdir(self.path):
+            info('Creating a mirror of {0} in {1}...'.format(
+                repo_url, self.path))
+            kwargs = {'bare': True}
+            if depth:
+                kwargs['depth'] = depth
+            if clone_filter:
+                kwargs['filter'] = clone_filter
+            # clone next to the mirror, so that an interrupted clone is
+            # never taken for one
+            tmp_path = '{0}.tmp'.format(self.path)
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            git = Repo.clone_from(repo_url, tmp_path, **kwargs).git
+            # keep the branches of the remote apart from the local ones,
+            # which belong to the worktrees (so drop those the clone made)
+            git.config(
+                'remote.origin.fetch', '+refs/heads/*:refs/remotes/origin/*')
+            for ref in git.for_each_ref(
+                '--format=%(refname)', 'refs/heads'
+            ).split():
+                git.update_ref('-d', ref)
+            # the worktrees keep their sparse checkouts in their own config,
+            # and core.bare must only apply to the mirror
+            git.config('core.repositoryformatversion', '1')
+            git.config('extensions.worktreeConfig', 'true')
+            git.config('--unset', 'core.bare')
+            git.config('--worktree', 'core.bare', 'true')
+            os.replace(tmp_path, self.path)
+        else:
+            info('Updating the mirror of {0} in {1}...'.format(
+                repo_url, self.path))
+        self.git.fetch('--prune', 'origin')
+
+    def _get_worktree_branches(self):
+        # the branch checked out by each worktree, by path
+        branches = dict()
+        for entry in self.git.worktree('list', '--porcelain').split('\n\n'):
+            fields = dict(
+                line.split(' ', 1) for line in entry.split('\n')
+                if ' ' in line
+            )
+            if 'worktree' in fields and 'branch' in fields:
+                branches[fields['worktree']] = fields['branch']
+        return branches
+
+    def _prune(self):
+        # forget the worktrees which are gone, and the branches
+        # add_worktree() made for them. The other branches may belong to
+        # runs sharing the mirror, and are left alone.
+        self.git.worktree('prune')
+        checked_out = set(self._get_worktree_branches().values())
+        for ref in self.git.for_each_ref(
+            '--format=%(refname)',
+            'refs/heads/{0}'.format(self.worktree_branch_prefix)
+        ).split():
+            if ref not in checked_out:
+                self.git.branch('-D', ref[len('refs/heads/'):])
+
+    def get_worktree_branch(self, worktree_dir):
+        """
+        The branch add_worktree() checks out in worktree_dir: it is named
+        after the process and the directory, so that runs sharing the
+        mirror never take each other's branches.
+        """
+        return '{0}{1}/{2}'.format(
+            self.worktree_branch_prefix, os.getpid(),
+            os.path.basename(os.path.abspath(worktree_dir)))
+
+    @timed('git')
+    def add_worktree(self, worktree_dir, branch, sparse_paths=None):
+        """
+        Check branch out of the mirror into worktree_dir (which must be
+        missing or empty), limited to sparse_paths unless they're None.
+        Return the Repo of the worktree.
+        """
+        # an earlier worktree in the same place may have been thrown away
+        self._prune()
+        self.git.worktree(
+            'add', '--no-checkout', '-B',
+            self.get_worktree_branch(worktree_dir),
+            os.path.abspath(worktree_dir), 'origin/{0}'.format(branch))
+        worktree = Repo(worktree_dir)
+        if sparse_paths is not None:
+            worktree.git.sparse_checkout('init', '--cone')
+            worktree.git.sparse_checkout('set', *sparse_paths)
+        worktree.git.reset('--hard')
+        return worktree
+
+    @timed('git')
+    def remove_worktree(self, worktree_dir):
+        """
+        Remove worktree_dir from the mirror, along with the branch it has
+        checked out, which the run made in it.
+        """
+        worktree_path = os.path.realpath(worktree_dir)
+        branch = None
+        for path, ref in self._get_worktree_branches().items():
+            if os.path.realpath(path) == worktree_path:
+                branch = ref[len('refs/heads/'):]
+        if os.path.isdir(worktree_dir):
+            self.git.worktree(
+                'remove', '--force', os.path.abspath(worktree_dir))
+        self._prune()
+        if branch and not branch.startswith(self.worktree_branch_prefix):
+            self.git.branch('-D', branch)
+
+
 class RepoInstance(object):
     def __init__(
             self, repo_owner, repo_name, repo_dir=None, do_clone=True,
-            from_branch=''):
+            from_branch='', clone_depth=None, clone_filter=None,
+            sparse_paths=None, mirror=None):
         self.repo_owner = repo_owner
         self.repo_name = repo_name
         repo_url = 'https://github.com/{0}/{1}'
@@ -36,12 +170,25 @@ class RepoInstance(object):
         # by default, start on master.
         self.from_branch = from_branch or 'master'
         self.branch = self.from_branch
+        # how much of the repository to clone: the number of commits of
+        # history, a partial clone filter (such as blob:none) and the
+        # directories to check out (all of them when None)
+        self.clone_depth = clone_depth
+        self.clone_filter = clone_filter
+        self.sparse_paths = sparse_paths
+        # the RepoMirror to check a worktree out of, rather than cloning
+        self.mirror = mirror
         if do_clone:
-            self.repo = Repo.clone_from(
-                self.repo_url, self.repo_dir, branch=self.from_branch)
+            self.repo = self._clone_from(branch=self.from_branch)
         else:
             self.repo = Repo(repo_dir)
         self.git = self.repo.git
+        # git takes the index lock for every change, so changes coming
+        # from parallel generation jobs have to take turns.
+        self.lock = threading.RLock()
+        # the paths (relative to the repository) queued by queue_removal(),
+        # each mapped to its ignore_fail
+        self.pending_removals = dict()
 
     def clone(self, branch=None):
         shutil.rmtree(self.repo_dir)
@@ -50,14 +197,60 @@ class RepoInstance(object):
             msg += (' into directory {0}'.format(self.repo_dir))
         msg += '...'
         info(msg)
-        self.repo = Repo.clone_from(self.repo_url, self.repo_dir)
+        if self.mirror and branch:
+            # the worktree has a branch of its own, made from branch
+            self.repo = self._clone_from(branch=branch)
+        else:
+            self.repo = self._clone_from()
+        self.git = self.repo.git
         if branch:
-            self.git.checkout(branch)
+            if not self.mirror:
+                self.git.checkout(branch)
             self.branch = branch
 
+    def _clone_from(self, **kwargs):
+        if self.mirror:
+            self.mirror.update(
+                self.repo_url, self.clone_depth, self.clone_filter)
+            repo = self.mirror.add_worktree(
+                self.repo_dir, kwargs.get('branch') or self.from_branch,
+                self.sparse_paths)
+            atexit.register(self.mirror.remove_worktree, self.repo_dir)
+            return repo
+        if self.clone_depth:
+            kwargs['depth'] = self.clone_depth
+        if self.clone_filter:
+            kwargs['filter'] = self.clone_filter
+        if self.sparse_paths is not None:
+            kwargs['sparse'] = True
+        repo = Repo.clone_from(self.repo_url, self.repo_dir, **kwargs)
+        if self.sparse_paths is not None:
+            repo.git.sparse_checkout('init', '--cone')
+            repo.git.sparse_checkout('set', *self.sparse_paths)
+        return repo
+
+    def is_shallow(self):
+        return self.git.rev_parse('--is-shallow-repository') == 'true'
+
+    @timed('git')
+    def unshallow(self):
+        """
+        Fetch the history left out by a shallow clone, for the things
+        which need it. A partial clone keeps its filter, so only the
+        commits and trees are fetched, not the files.
+        """
+        with self.lock:
+            if not self.is_shallow():
+                return
+            info('Fetching the history of {0}/{1}...'.format(
+                self.repo_owner, self.repo_name))
+            self.git.fetch('--unshallow', 'origin')
+
+    @timed('git')
     def remove_file(self, filename, ignore_fail=False):
         try:
-            self.git.rm('-f', filename)
+            with self.lock:
+                self.git.rm('-f', filename)
         except GitGotGot as g:
             if ignore_fail:
                 return
@@ -66,6 +259,69 @@ class RepoInstance(object):
             err(fail_msg)
             err(' Exception: {0}'.format(g))
 
+    def _get_repo_path(self, filename):
+        # like git, take relative paths as relative to the repository
+        working_tree_dir = os.path.realpath(self.repo.working_tree_dir)
+        path = os.path.realpath(os.path.join(working_tree_dir, filename))
+        return os.path.relpath(path, working_tree_dir)
+
+    def queue_removal(self, filename, ignore_fail=False):
+        """
+        Remove filename from the working tree now, and from source control
+        with the next flush_removals(), along with the rest of the queue.
+        """
+        path = self._get_repo_path(filename)
+        try:
+            os.remove(os.path.join(self.repo.working_tree_dir, path))
+        except FileNotFoundError:
+            pass
+        with self.lock:
+            self.pending_removals[path] = ignore_fail
+
+    @timed('git')
+    def flush_removals(self):
+        """
+        Remove the files queued by queue_removal() from source control with
+        a single git rm. Each file which wasn't in source control is
+        reported, unless it was queued with ignore_fail. Return the sorted
+        list of the files which failed.
+        """
+        with self.lock:
+            pending, self.pending_removals = self.pending_removals, dict()
+            if not pending:
+                return list()
+            with tempfile.NamedTemporaryFile('wb') as pathspec_file:
+                pathspec_file.write(
+                    b'\0'.join(path.encode() for path in sorted(pending)))
+                pathspec_file.flush()
+                try:
+                    output = self.git.execute([
+                        'git', '--literal-pathspecs', 'rm', '--cached', '-f',
+                        '--ignore-unmatch', '--pathspec-file-nul',
+                        '--pathspec-from-file={0}'.format(pathspec_file.name)
+                    ])
+                except GitGotGot as g:
+                    err('Failed to remove {0} files from source control.'
+                        .format(len(pending)))
+                    err(' Exception: {0}'.format(g))
+                    return sorted(pending)
+        # git rm prints "rm '<path>'" for every file it removed
+        removed = set(
+            line[len("rm '"):-len("'")] for line in output.split('\n')
+            if line.startswith("rm '")
+        )
+        failed = list()
+        for path, ignore_fail in sorted(pending.items()):
+            if path in removed:
+                continue
+            failed.append(path)
+            if not ignore_fail:
+                err('Failed to remove file {0} from source control.'.format(
+                    path))
+        info('Removed {0} files from source control'.format(
+            len(pending) - len(failed)))
+        return failed
+
     def create_branch(self, branch_name):
         """
         @todo: error checking
@@ -104,9 +360,18 @@ class RepoInstance(object):
         # TODO(allenh1): Don't fork if you're authorized for repo
         forked_repo = self.gh_user.create_fork(self.gh_upstream)
         info('Pushing changes to fork...')
-        self.git.remote('add', 'github', forked_repo.html_url)
+        # the remote is left behind by an earlier run in a reused
+        # repository, or in another worktree of the same mirror
+        if 'github' in [remote.name for remote in self.repo.remotes]:
+            self.git.remote('set-url', 'github', forked_repo.html_url)
+        else:
+            self.git.remote('add', 'github', forked_repo.html_url)
+        push_branch = self.branch or branch
+        if self.mirror:
+            # the branch checked out of the mirror has a name of its own
+            push_branch = 'HEAD:{0}'.format(push_branch)
         retry_on_exception(
-            self.git.push, '-u', 'github', self.branch or branch,
+            self.git.push, '-u', 'github', push_branch,
             retry_msg='Could not push', error_msg='Error during push',
             sleep_secs=0.0,
         )
@@ -0,0 +1,86 @@
+# Copyright 2020 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import defaultdict
+import threading
+
+from superflore.distro_index import get_dependency_index
+from superflore.distro_index import get_package_index
+from superflore.exceptions import UnresolvedDependency
+from superflore.timing import timed
+from superflore.utils import info
+from superflore.utils import resolve_dep
+from superflore.utils import warn
+
+# rosdep keys which failed to resolve, keyed by (distro name, os name),
+# mapping each key to the packages depending on it
+unresolvable_keys = dict()
+unresolvable_keys_lock = threading.Lock()
+
+
+def get_external_keys(
+    distro, pkgs, dependency_types, evaluate_condition_context=None
+):
+    """
+    Map each dependency of pkgs which isn't a package of the distro (that
+    is, each rosdep key) to the packages depending on it.
+    """
+    pkg_index = get_package_index(distro)
+    dep_index = get_dependency_index(distro, evaluate_condition_context)
+    keys = defaultdict(set)
+    for pkg in pkgs:
+        for dep_type in dependency_types:
+            for dep in dep_index.get_depends(pkg, dep_type):
+                if dep not in pkg_index:
+                    keys[dep].add(pkg)
+    return keys
+
+
+def preresolve(
+    distro, os_name, pkgs, dependency_types, evaluate_condition_context=None
+):
+    """
+    Resolve the rosdep keys of pkgs for os_name up front, so that the
+    packages only hit the resolution cache later on. Every key which
+    can't be resolved is reported once, along with the packages it
+    blocks, and returned in the same form.
+    """
+    with timed('dependencies'):
+        keys = get_external_keys(
+            distro, pkgs, dependency_types, evaluate_condition_context)
+    unresolvable = dict()
+    for key in sorted(keys):
+        try:
+            resolve_dep(key, os_name, distro.name)
+        except UnresolvedDependency:
+            unresolvable[key] = frozenset(keys[key])
+    with unresolvable_keys_lock:
+        unresolvable_keys[(distro.name, os_name)] = unresolvable
+    info("Resolved {0} / {1} rosdep keys for {2}".format(
+        len(keys) - len(unresolvable), len(keys), os_name))
+    for key, blocked in sorted(unresolvable.items()):
+        warn("Unresolvable rosdep key '{0}' blocks {1}".format(
+            key, ', '.join(sorted(blocked))))
+    return unresolvable
+
+
+def get_unresolvable(distro, os_name, pkg):
+    """
+    Return the sorted rosdep keys of pkg which preresolve() couldn't
+    resolve for os_name, or an empty list if it wasn't run.
+    """
+    with unresolvable_keys_lock:
+        unresolvable = unresolvable_keys.get((distro.name, os_name), dict())
+    return sorted(
+        key for key, blocked in unresolvable.items() if pkg in blocked)
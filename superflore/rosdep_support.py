@@ -30,27 +30,71 @@
 # ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 
+import threading
+
 from rosdep2 import create_default_installer_context
 from rosdep2.catkin_support import get_catkin_view
 from rosdep2.lookup import ResolutionError
 from rosdep2.rosdistrohelper import get_index
+from rosdep2.rosdistrohelper import get_index_url
+import rosdistro
 from superflore.exceptions import UnresolvedDependency
 
 DEFAULT_ROS_DISTRO = 'indigo'
 view_cache = {}
+view_lock = threading.Lock()
+installer_context = None
+# outcome of every resolution, keyed by (key, os_name, os_version, ros_distro)
+resolution_cache = {}
+resolution_lock = threading.Lock()
+resolution_stats = {'hits': 0, 'misses': 0}
+rosdistro_index = None
+# distribution type ('ros1' or 'ros2') of each distro in rosdistro_index
+distro_types = dict()
+index_lock = threading.Lock()
+
+
+def get_cached_index(refresh=False):
+    """
+    Return the rosdistro index, which is only fetched the first time, or
+    again when refresh is set.
+    """
+    global rosdistro_index
+    with index_lock:
+        if rosdistro_index is None or refresh:
+            if refresh:
+                rosdistro_index = rosdistro.get_index(get_index_url())
+            else:
+                rosdistro_index = get_index()
+            distro_types.clear()
+            for name, distro in rosdistro_index.distributions.items():
+                distro_types[name] = distro.get('distribution_type')
+        return rosdistro_index
+
+
+def get_distro_type(distro_name):
+    """Return the distribution type of distro_name, if it is indexed"""
+    get_cached_index()
+    with index_lock:
+        return distro_types.get(distro_name)
 
 
-def get_cached_index():
-    return get_index()
+def get_installer_context():
+    global installer_context
+    with view_lock:
+        if installer_context is None:
+            installer_context = create_default_installer_context()
+        return installer_context
 
 
 def get_view(os_name, os_version, ros_distro):
     global view_cache
     key = os_name + os_version + ros_distro
-    if key not in view_cache:
-        value = get_catkin_view(ros_distro, os_name, os_version, False)
-        view_cache[key] = value
-    return view_cache[key]
+    with view_lock:
+        if key not in view_cache:
+            value = get_catkin_view(ros_distro, os_name, os_version, False)
+            view_cache[key] = value
+        return view_cache[key]
 
 
 def resolve_more_for_os(rosdep_key, view, installer, os_name, os_version):
@@ -64,7 +108,7 @@ def resolve_more_for_os(rosdep_key, view, installer, os_name, os_version):
     :raises: :exc:`rosdep2.ResolutionError`
     """
     d = view.lookup(rosdep_key)
-    ctx = create_default_installer_context()
+    ctx = get_installer_context()
     os_installers = ctx.get_os_installer_keys(os_name)
     default_os_installer = ctx.get_default_os_installer_key(os_name)
     inst_key, rule = d.get_rule_for_platform(os_name, os_version,
@@ -81,8 +125,28 @@ def resolve_rosdep_key(
     ros_distro=None,
     ignored=None
 ):
-    ignored = ignored or []
-    ctx = create_default_installer_context()
+    ros_distro = ros_distro or DEFAULT_ROS_DISTRO
+    cache_key = (key, os_name, os_version, ros_distro)
+    with resolution_lock:
+        outcome = resolution_cache.get(cache_key)
+        resolution_stats['hits' if outcome else 'misses'] += 1
+    if not outcome:
+        try:
+            outcome = (True, _resolve_rosdep_key(
+                key, os_name, os_version, ros_distro))
+        except UnresolvedDependency as e:
+            outcome = (False, str(e))
+        with resolution_lock:
+            resolution_cache[cache_key] = outcome
+    resolved, result = outcome
+    if not resolved:
+        raise UnresolvedDependency(result)
+    # hand out a copy, so that callers can't change the cached list
+    return (list(result[0]),) + tuple(result[1:])
+
+
+def _resolve_rosdep_key(key, os_name, os_version, ros_distro):
+    ctx = get_installer_context()
     try:
         installer_key = ctx.get_default_os_installer_key(os_name)
     except KeyError:
@@ -91,7 +155,6 @@ def resolve_rosdep_key(
             .format(key, os_name)
         )
     installer = ctx.get_installer(installer_key)
-    ros_distro = ros_distro or DEFAULT_ROS_DISTRO
     view = get_view(os_name, os_version, ros_distro)
     try:
         return resolve_more_for_os(key, view, installer, os_name, os_version)
@@ -100,3 +163,14 @@ def resolve_rosdep_key(
             "could not resolve package {} for os {}."
             .format(key, os_name)
         )
+
+
+def get_resolution_stats():
+    """Return the hits and misses of the resolution cache, and the keys
+    that couldn't be resolved"""
+    with resolution_lock:
+        stats = dict(resolution_stats)
+        stats['unresolved'] = sorted(set(
+            cache_key[0] for cache_key, (resolved, _) in
+            resolution_cache.items() if not resolved))
+    return stats
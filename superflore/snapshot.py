@@ -0,0 +1,262 @@
+# Copyright 2020 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import atexit
+from concurrent.futures import ThreadPoolExecutor
+import gzip
+import json
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+
+from rosdep2.sources_list import get_sources_cache_dir
+from rosdep2.sources_list import get_sources_list_dir
+import rosdistro
+from rosdistro.manifest_provider import get_release_tag
+from superflore.package_xml import PackageXmlStore
+from superflore.package_xml import set_package_xml_store
+from superflore.utils import err
+from superflore.utils import get_superflore_version
+from superflore.utils import get_utcnow_timestamp_str
+from superflore.utils import info
+from superflore.utils import ok
+import yaml
+
+SNAPSHOT_VERSION = 1
+# the tags of the release repositories recorded in the snapshot in use,
+# keyed by URL (see _get_tags_key())
+snapshot_tags = dict()
+
+
+def _get_tags_key(repo_url):
+    # github.com/<org>/<repo>, whichever form the URL is given in
+    key = repo_url.split('://', 1)[-1].rstrip('/')
+    return key[:-len('.git')] if key.endswith('.git') else key
+
+
+def get_snapshot_tags(repo_url):
+    """
+    Return the tags of the release repository at repo_url, as recorded in
+    the snapshot in use, or None.
+    """
+    return snapshot_tags.get(_get_tags_key(repo_url))
+
+
+def _write_yaml(path, data, compress=False):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    text = yaml.safe_dump(data, default_flow_style=False).encode()
+    if compress:
+        with gzip.open(path, 'wb') as yaml_file:
+            yaml_file.write(text)
+    else:
+        with open(path, 'wb') as yaml_file:
+            yaml_file.write(text)
+
+
+def _list_release_tags(repo_url, distro_name):
+    from git.cmd import Git
+
+    refs = Git().execute(["git", "ls-remote", "--tags", repo_url])
+    prefix = 'refs/tags/release/{0}/'.format(distro_name)
+    tags = dict()
+    for ref in refs.split('\n'):
+        if ref:
+            srcrev, tag = ref.split('\t')
+            if tag.startswith(prefix):
+                tags[tag] = srcrev
+    return tags
+
+
+def create_snapshot(filename, distro_names, tags=False, jobs=8):
+    """
+    Write the inputs of a run for distro_names to the archive filename:
+    the rosdistro index, the distribution file and cache of each distro,
+    the package.xml of every released package, and the rosdep sources.
+    With tags, the release tags of every release repository are recorded
+    as well, for the OpenEmbedded generator.
+    """
+    index_url = rosdistro.get_index_url()
+    index = rosdistro.get_index(index_url)
+    manifest = {
+        'version': SNAPSHOT_VERSION,
+        'created': get_utcnow_timestamp_str(),
+        'superflore_version': get_superflore_version(),
+        'index_url': index_url,
+        'distros': sorted(distro_names),
+    }
+    index_data = {'type': 'index', 'version': 4, 'distributions': dict()}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = PackageXmlStore(os.path.join(tmp_dir, 'package-xml'))
+        repo_tags = dict()
+        for distro_name in sorted(distro_names):
+            if distro_name not in index.distributions:
+                raise RuntimeError(
+                    "Unknown distro '{0}'".format(distro_name))
+            info("Taking a snapshot of distro '{0}'...".format(distro_name))
+            cache = rosdistro.get_distribution_cache(index, distro_name)
+            cache_data = cache.get_data()
+            entry = {
+                key: value
+                for key, value in index.distributions[distro_name].items()
+                if key in (
+                    'distribution_status', 'distribution_type',
+                    'python_version'
+                )
+            }
+            entry['distribution'] = list()
+            for i, dist_file in enumerate(cache_data['distribution_file']):
+                path = '{0}/distribution-{1}.yaml'.format(distro_name, i)
+                _write_yaml(os.path.join(tmp_dir, path), dist_file)
+                entry['distribution'].append(path)
+            entry['distribution_cache'] = \
+                '{0}/{0}-cache.yaml.gz'.format(distro_name)
+            _write_yaml(
+                os.path.join(tmp_dir, entry['distribution_cache']),
+                cache_data, compress=True)
+            index_data['distributions'][distro_name] = entry
+            distro = rosdistro.get_cached_distribution(
+                index, distro_name, cache=cache)
+            for pkg_name, pkg in distro.release_packages.items():
+                repo = distro.repositories[pkg.repository_name]
+                repo = repo.release_repository
+                pkg_xml = cache.release_package_xmls.get(pkg_name)
+                if pkg_xml:
+                    store.put(
+                        repo.url, get_release_tag(repo, pkg_name), pkg_xml)
+                if tags and repo.url:
+                    repo_tags[(repo.url, distro_name)] = None
+        _write_yaml(os.path.join(tmp_dir, 'index.yaml'), index_data)
+        shutil.copytree(
+            get_sources_list_dir(),
+            os.path.join(tmp_dir, 'rosdep', 'sources.list.d'))
+        shutil.copytree(
+            get_sources_cache_dir(),
+            os.path.join(tmp_dir, 'ros', 'rosdep', 'sources.cache'))
+        if repo_tags:
+            info('Listing the tags of {0} release repositories...'.format(
+                len(repo_tags)))
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                listed = executor.map(
+                    lambda key: _list_release_tags(*key), list(repo_tags))
+                for key, repo_tag_list in zip(list(repo_tags), listed):
+                    repo_tags[key] = repo_tag_list
+            tags_data = dict()
+            for (repo_url, _), repo_tag_list in repo_tags.items():
+                tags_data.setdefault(
+                    _get_tags_key(repo_url), dict()).update(repo_tag_list)
+            with open(os.path.join(tmp_dir, 'tags.json'), 'w') as tags_file:
+                json.dump(tags_data, tags_file, sort_keys=True)
+        with open(os.path.join(tmp_dir, 'snapshot.json'), 'w') as man_file:
+            json.dump(manifest, man_file, indent=2, sort_keys=True)
+        tmp_filename = '{0}.tmp'.format(filename)
+        with tarfile.open(tmp_filename, 'w:gz') as archive:
+            for name in sorted(os.listdir(tmp_dir)):
+                archive.add(os.path.join(tmp_dir, name), arcname=name)
+        os.replace(tmp_filename, filename)
+    return manifest
+
+
+def use_snapshot(filename):
+    """
+    Take the inputs of the run from the snapshot in filename rather than
+    from the network: the snapshot is unpacked to a temporary directory,
+    which rosdistro, rosdep and the package.xml store are pointed at.
+    Must be called before anything loads the rosdistro index.
+    """
+    path = tempfile.mkdtemp(prefix='superflore-snapshot-')
+    atexit.register(shutil.rmtree, path, True)
+    with tarfile.open(filename, 'r:gz') as archive:
+        for member in archive.getmembers():
+            if os.path.isabs(member.name) or \
+                    '..' in member.name.split('/'):
+                raise RuntimeError(
+                    "Invalid path '{0}' in snapshot {1}".format(
+                        member.name, filename))
+            # a link could point outside of the snapshot
+            if member.issym() or member.islnk():
+                raise RuntimeError(
+                    "Invalid link '{0}' in snapshot {1}".format(
+                        member.name, filename))
+        if hasattr(tarfile, 'data_filter'):
+            # also drops devices and setuid bits, where Python has it
+            archive.extractall(path, filter='data')
+        else:
+            archive.extractall(path)
+    with open(os.path.join(path, 'snapshot.json'), 'r') as man_file:
+        manifest = json.load(man_file)
+    if manifest['version'] != SNAPSHOT_VERSION:
+        raise RuntimeError(
+            'Unsupported snapshot version {0}'.format(manifest['version']))
+    os.environ['ROSDISTRO_INDEX_URL'] = \
+        'file://' + os.path.join(path, 'index.yaml')
+    os.environ['ROSDEP_SOURCE_PATH'] = \
+        os.path.join(path, 'rosdep', 'sources.list.d')
+    os.environ['ROS_HOME'] = os.path.join(path, 'ros')
+    set_package_xml_store(PackageXmlStore(os.path.join(path, 'package-xml')))
+    snapshot_tags.clear()
+    tags_path = os.path.join(path, 'tags.json')
+    if os.path.isfile(tags_path):
+        with open(tags_path, 'r') as tags_file:
+            snapshot_tags.update(json.load(tags_file))
+    info('Running from the snapshot of {0} taken at {1}'.format(
+        ', '.join(manifest['distros']), manifest['created']))
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Record the inputs of superflore runs in a snapshot')
+    subparsers = parser.add_subparsers(dest='command')
+    create_parser = subparsers.add_parser(
+        'create',
+        help='write a snapshot of the current rosdistro and rosdep data')
+    create_parser.add_argument(
+        '--ros-distro',
+        help='distro(s) to take a snapshot of',
+        type=str,
+        nargs='+',
+        required=True
+    )
+    create_parser.add_argument(
+        '--output',
+        help='file to write the snapshot to',
+        type=str,
+        required=True
+    )
+    create_parser.add_argument(
+        '--tags',
+        help='also record the tags of the release repositories '
+             + '(needed by superflore-gen-oe-recipes)',
+        action='store_true'
+    )
+    create_parser.add_argument(
+        '--jobs',
+        help='number of release repositories to list tags of in parallel',
+        type=int,
+        default=8
+    )
+    args = parser.parse_args(sys.argv[1:])
+    if args.command != 'create':
+        parser.print_help()
+        sys.exit(1)
+    try:
+        create_snapshot(
+            args.output, args.ros_distro, tags=args.tags, jobs=args.jobs)
+    except Exception as e:
+        err('Failed to take a snapshot: {0}'.format(e))
+        sys.exit(1)
+    ok('Wrote snapshot to {0}'.format(args.output))
@@ -0,0 +1,132 @@
+# Copyright 2020 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import defaultdict
+from contextlib import contextmanager
+import functools
+import json
+import threading
+import time
+
+# (package or None, seconds) measurements, keyed by phase
+timings = defaultdict(list)
+timings_lock = threading.Lock()
+timing_enabled = False
+timing_start = time.monotonic()
+# the package the current thread is working on, and the phases it is in
+_current = threading.local()
+
+
+def enable_timing():
+    global timing_enabled, timing_start
+    timing_enabled = True
+    timing_start = time.monotonic()
+
+
+def record(phase, seconds, pkg=None):
+    if not timing_enabled:
+        return
+    pkg = pkg or getattr(_current, 'pkg', None)
+    with timings_lock:
+        timings[phase].append((pkg, seconds))
+
+
+@contextmanager
+def timed(phase, pkg=None):
+    """
+    Time the block as phase. The time is put down to pkg, or else to the
+    package the thread is working on, as set by an enclosing timed().
+    A block within the same phase is already counted by the outer one.
+    """
+    if not hasattr(_current, 'phases'):
+        _current.phases = set()
+    nested = phase in _current.phases
+    previous = getattr(_current, 'pkg', None)
+    if pkg:
+        _current.pkg = pkg
+    _current.phases.add(phase)
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        if not nested:
+            _current.phases.discard(phase)
+            record(phase, time.monotonic() - start, pkg)
+        _current.pkg = previous
+
+
+def timed_stage(phase):
+    """
+    Decorator timing a stage of regenerate_pkg, for the package in its
+    second argument (first stage), or in the job it is given.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            pkg = args[0]['pkg'] if isinstance(args[0], dict) else args[1]
+            with timed(phase, pkg):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _percentile(values, percent):
+    # nearest-rank percentile of sorted values
+    index = max(int(round(percent / 100.0 * len(values))) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+
+def get_timing_report(slowest=10):
+    """
+    Return the totals, percentiles and slowest packages of every phase.
+    Phases nest (the fetch stage includes the package.xml fetch, for
+    instance), so their totals don't add up to the wall time.
+    """
+    with timings_lock:
+        measurements = {
+            phase: list(values) for phase, values in timings.items()
+        }
+    report = {
+        'wall_seconds': time.monotonic() - timing_start,
+        'phases': dict(),
+    }
+    for phase, values in sorted(measurements.items()):
+        seconds = sorted(value for _, value in values)
+        per_pkg = defaultdict(float)
+        for pkg, value in values:
+            if pkg:
+                per_pkg[pkg] += value
+        report['phases'][phase] = {
+            'count': len(seconds),
+            'total': sum(seconds),
+            'mean': sum(seconds) / len(seconds),
+            'p50': _percentile(seconds, 50),
+            'p90': _percentile(seconds, 90),
+            'p99': _percentile(seconds, 99),
+            'max': seconds[-1],
+            'slowest': [
+                {'package': pkg, 'seconds': value}
+                for pkg, value in sorted(
+                    per_pkg.items(), key=lambda item: (-item[1], item[0])
+                )[:slowest]
+            ],
+        }
+    return report
+
+
+def write_timing_report(filename, slowest=10):
+    with open(filename, 'w') as report_file:
+        json.dump(
+            get_timing_report(slowest), report_file, indent=2, sort_keys=True)
+        report_file.write('\n')
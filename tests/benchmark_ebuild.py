@@ -0,0 +1,85 @@
+# Copyright 2020 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Time rendering ebuilds, with rosdep stubbed out.
+
+Run from the top of the repository with
+    python -m tests.benchmark_ebuild [--count N] [--depends N]
+"""
+
+import argparse
+import timeit
+
+from superflore.generators.ebuild.ebuild import Ebuild
+from unittest import mock
+
+
+def _resolve_dep(dep, os_name, distro_name):
+    return ['dev-libs/' + dep], None, None
+
+
+def _get_ebuild(i, depends):
+    ebuild = Ebuild()
+    ebuild.name = 'pkg_{0}'.format(i)
+    ebuild.distro = 'noetic'
+    ebuild.homepage = 'https://wiki.ros.org/pkg_{0}'.format(i)
+    ebuild.description = (
+        'The "pkg_{0}" package\n  with a `description`'.format(i))
+    ebuild.src_uri = (
+        'https://github.com/ros-gbp/pkg_{0}-release/archive/'
+        'release/noetic/pkg_{0}/1.0.0-1.tar.gz'.format(i))
+    ebuild.upstream_license = ['BSD', 'Apache-2.0']
+    ebuild.add_keyword('amd64', True)
+    for j in range(depends):
+        internal = j % 2 == 0
+        ebuild.add_build_depend('build_{0}'.format(j), internal)
+        ebuild.add_run_depend('run_{0}'.format(j), internal)
+        if j % 3 == 0:
+            ebuild.add_test_depend('test_{0}'.format(j), internal)
+    return ebuild
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument(
+        '--count', type=int, default=3000, help='number of ebuilds')
+    parser.add_argument(
+        '--depends', type=int, default=12,
+        help='build and run dependencies of each ebuild')
+    parser.add_argument(
+        '--repeat', type=int, default=5, help='number of timed runs')
+    args = parser.parse_args()
+    ebuilds = [_get_ebuild(i, args.depends) for i in range(args.count)]
+
+    def render():
+        return [
+            ebuild.get_ebuild_text('Open Source Robotics Foundation', 'BSD')
+            for ebuild in ebuilds
+        ]
+
+    with mock.patch(
+        'superflore.generators.ebuild.ebuild.resolve_dep', _resolve_dep
+    ):
+        texts = render()
+        # rendering leaves the ebuilds as they were
+        if render() != texts:
+            raise RuntimeError('Rendering an ebuild again changed its text')
+        best = min(timeit.repeat(render, number=1, repeat=args.repeat))
+    print('Rendered {0} ebuilds in {1:.3f} s ({2:.1f} us per ebuild)'.format(
+        args.count, best, best / args.count * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+# Copyright 2020 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from types import SimpleNamespace
+
+from superflore.exceptions import UnresolvedDependency
+
+
+def get_fake_distro(name, versions, package_xmls=None):
+    """
+    Build a stand-in for a rosdistro distribution file
+
+    @param versions: dict of release versions by package name, or a list
+    of package names all released at 1.0.0-1
+    @param package_xmls: dict of package.xml texts by package name
+    """
+    if not isinstance(versions, dict):
+        versions = dict.fromkeys(versions, '1.0.0-1')
+    release_packages = dict()
+    repositories = dict()
+    for pkg, version in versions.items():
+        release_packages[pkg] = SimpleNamespace(repository_name=pkg)
+        repositories[pkg] = SimpleNamespace(
+            release_repository=SimpleNamespace(
+                version=version,
+                url='https://github.com/ros2-gbp/%s-release.git' % pkg,
+                get_release_tag=lambda pkg_name, version=version: (
+                    'release/%s/%s/%s' % (name, pkg_name, version))
+            )
+        )
+    return SimpleNamespace(
+        name=name,
+        release_packages=release_packages,
+        repositories=repositories,
+        get_release_package_xml=lambda pkg: package_xmls[pkg]
+    )
+
+
+class FakeDependencyWalker(object):
+    """
+    Stands in for rosdistro's DependencyWalker
+
+    Subclasses set depends, a dict of the dependencies of each package
+    by dependency type; every get_depends call is kept in calls.
+    """
+    depends = dict()
+    calls = list()
+
+    def __init__(self, distro, evaluate_condition_context=None):
+        self.context = evaluate_condition_context
+
+    def get_depends(self, pkg, dep_type):
+        type(self).calls.append((pkg, dep_type))
+        return self.depends.get(pkg, dict()).get(dep_type, set())
+
+
+def resolve_dep(dep, os_name, distro_name):
+    """Resolve every rosdep key to itself, but 'missing'"""
+    if dep == 'missing':
+        raise UnresolvedDependency(dep)
+    return [dep], None, None
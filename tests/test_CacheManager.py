@@ -13,6 +13,7 @@
 # limitations under the License.
 
 import os
+import pickle
 
 from superflore.CacheManager import CacheManager
 from superflore.TempfileManager import TempfileManager
@@ -34,3 +35,34 @@ class TestCacheManager(unittest.TestCase):
                 self.assertEqual(cache['b'], 'B')
                 self.assertEqual(cache['c'], 'C')
             self.assertTrue(os.path.exists(cache_file))
+
+    def test_migrate_pickle(self):
+        """Test opening a cache file written by older versions"""
+        with TempfileManager(None) as tmp:
+            os.chmod(tmp, 17407)
+            cache_file = '%s/srcrev_cache.pickle' % tmp
+            with open(cache_file, 'wb') as f:
+                pickle.dump({'a': 'A', ('b', 1): ['B']}, f)
+            with CacheManager(cache_file) as cache:
+                self.assertEqual(len(cache), 2)
+                self.assertEqual(cache['a'], 'A')
+                self.assertEqual(cache[('b', 1)], ['B'])
+                cache['c'] = 'C'
+            with open(cache_file, 'rb') as f:
+                self.assertEqual(f.read(6), b'SQLite')
+            with CacheManager(cache_file) as cache:
+                self.assertEqual(sorted(cache, key=str), [('b', 1), 'a', 'c'])
+
+    def test_shared(self):
+        """Test that entries are saved as soon as they are set"""
+        with TempfileManager(None) as tmp:
+            os.chmod(tmp, 17407)
+            cache_file = '%s/my_cache.pickle' % tmp
+            with CacheManager(cache_file) as cache:
+                with CacheManager(cache_file) as other_cache:
+                    cache['a'] = 'A'
+                    self.assertEqual(other_cache['a'], 'A')
+                    other_cache['b'] = 'B'
+                    self.assertIn('b', cache)
+                    del cache['a']
+                    self.assertNotIn('a', other_cache)
@@ -0,0 +1,160 @@
+# Copyright 2020 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from concurrent.futures import Future
+import os
+import tempfile
+import threading
+from types import SimpleNamespace
+
+from superflore.checkpoint import Checkpoint
+from superflore.generate_installers import generate_installers
+import unittest
+
+from tests.fakes import get_fake_distro
+
+
+class _Interrupted(Exception):
+    pass
+
+
+def _gen_package(overlay, pkg, distro, preserve_existing, collector):
+    """Generate every package but 'crash', and 'interrupt' at 'crash'"""
+    if pkg == 'crash' and not collector['resumed']:
+        raise _Interrupted()
+    collector['generated'].append(pkg)
+    if pkg == 'broken':
+        return None, ['missing_dep'], None
+    return pkg, None, pkg
+
+
+class TestCheckpoint(unittest.TestCase):
+    def test_journal(self):
+        """Test writing the journal and reading it back"""
+        distro = get_fake_distro('lunar', {})
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'checkpoint.jsonl')
+            with Checkpoint(filename, get_data=lambda c: {'c': c}) as cp:
+                cp.add(distro, 'foo', '1.0.0', 'generated', 'foo',
+                       change='foo 1.0.0')
+                cp.add(distro, 'bar', '2.0.0', 'skipped')
+            with open(filename, 'a') as journal:
+                journal.write('{"distro": "lunar", "pk')
+            restored = list()
+            with Checkpoint(
+                filename, resume=True, restore_data=restored.append
+            ) as cp:
+                entry = cp.get(distro, 'foo', '1.0.0')
+                self.assertEqual(entry['change'], 'foo 1.0.0')
+                cp.restore(entry)
+                self.assertEqual(restored, [{'c': 'foo'}])
+                self.assertIsNone(cp.get(distro, 'bar', '2.0.1'))
+                self.assertIsNone(cp.get(distro, 'baz', '1.0.0'))
+            # not resuming starts over
+            with Checkpoint(filename) as cp:
+                self.assertIsNone(cp.get(distro, 'foo', '1.0.0'))
+            self.assertEqual(os.path.getsize(filename), 0)
+
+    def test_resume(self):
+        """Test resuming generate_installers after an interruption"""
+        distro = get_fake_distro('lunar', {
+            'alpha': '1.0.0-0', 'broken': '1.0.0-0', 'crash': '1.0.0-0',
+            'omega': '1.0.0-0',
+        })
+        collector = {'generated': [], 'resumed': False}
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'checkpoint.jsonl')
+            with self.assertRaises(_Interrupted):
+                with Checkpoint(filename) as checkpoint:
+                    generate_installers(
+                        distro, None, _gen_package, False, collector,
+                        checkpoint=checkpoint
+                    )
+            self.assertEqual(collector['generated'], ['alpha', 'broken'])
+            collector = {'generated': [], 'resumed': True}
+            with Checkpoint(filename, resume=True) as checkpoint:
+                inst, broken, changes = generate_installers(
+                    distro, None, _gen_package, False, collector,
+                    checkpoint=checkpoint
+                )
+            self.assertEqual(collector['generated'], ['crash', 'omega'])
+            self.assertEqual(inst, ['alpha', 'crash', 'omega'])
+            self.assertEqual(broken, {'broken': ['missing_dep']})
+            self.assertEqual(
+                changes, ['alpha 1.0.0', 'crash 1.0.0', 'omega 1.0.0'])
+
+    def test_unchanged(self):
+        """Test leaving out the installers which came out the same"""
+        distro = get_fake_distro('lunar', {
+            'alpha': '1.0.0-0', 'same': '1.0.0-0',
+        })
+
+        def _gen_unchanged(overlay, pkg, distro, preserve_existing):
+            current = SimpleNamespace(changed=pkg != 'same')
+            return current, '1.0.0' if pkg == 'same' else None, pkg
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'checkpoint.jsonl')
+            with Checkpoint(filename) as checkpoint:
+                inst, broken, changes = generate_installers(
+                    distro, None, _gen_unchanged, False,
+                    checkpoint=checkpoint
+                )
+            self.assertEqual(inst, ['alpha'])
+            self.assertEqual(changes, ['alpha 1.0.0'])
+            with Checkpoint(filename, resume=True) as checkpoint:
+                self.assertEqual(
+                    checkpoint.get(distro, 'same', '1.0.0')['result'],
+                    'unchanged')
+                inst, broken, changes = generate_installers(
+                    distro, None, _gen_unchanged, False,
+                    checkpoint=checkpoint
+                )
+            self.assertEqual(inst, ['alpha'])
+
+    def test_failed_write(self):
+        """Test leaving out the packages whose files couldn't be written"""
+        distro = get_fake_distro('lunar', {
+            'alpha': '1.0.0-0', 'full': '1.0.0-0',
+        })
+
+        def _gen_written(overlay, pkg, distro, preserve_existing):
+            written = Future()
+            if pkg == 'full':
+                written.set_exception(OSError('No space left on device'))
+            else:
+                # still being written when generate_installers gets it
+                threading.Timer(0.1, written.set_result, [True]).start()
+            return SimpleNamespace(changed=True, written=[written]), None, pkg
+
+        recorded = list()
+        fingerprints = SimpleNamespace(
+            incremental=False,
+            forget=lambda distro, pkg: None,
+            record=lambda distro, pkg, current: recorded.append(
+                (pkg, current.written[0].done())),
+        )
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'checkpoint.jsonl')
+            with Checkpoint(filename) as checkpoint:
+                inst, broken, changes = generate_installers(
+                    distro, None, _gen_written, False,
+                    checkpoint=checkpoint, fingerprints=fingerprints
+                )
+            self.assertEqual(inst, ['alpha'])
+            self.assertEqual(changes, ['alpha 1.0.0'])
+            self.assertEqual(recorded, [('alpha', True)])
+            with Checkpoint(filename, resume=True) as checkpoint:
+                self.assertIsNotNone(checkpoint.get(distro, 'alpha', '1.0.0'))
+                self.assertIsNone(checkpoint.get(distro, 'full', '1.0.0'))
@@ -0,0 +1,88 @@
+# Copyright 2020 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from types import SimpleNamespace
+
+from superflore.distro_index import dependency_types
+from superflore.distro_index import get_dependency_index
+from superflore.distro_index import get_package_index
+import unittest
+from unittest import mock
+
+from tests.fakes import FakeDependencyWalker
+
+
+class _FakeDependencyWalker(FakeDependencyWalker):
+    """Depends on a package named after the ROS version"""
+    def get_depends(self, pkg, dep_type):
+        _FakeDependencyWalker.calls.append((pkg, dep_type))
+        if dep_type == 'build':
+            return {'%s_%s' % (pkg, self.context['ROS_VERSION'])}
+        return set()
+
+
+@mock.patch(
+    'superflore.distro_index.DependencyWalker', _FakeDependencyWalker)
+class TestDependencyIndex(unittest.TestCase):
+    def setUp(self):
+        _FakeDependencyWalker.calls = list()
+
+    def test_get_depends(self):
+        """Test sharing the dependencies of a distro"""
+        distro = SimpleNamespace(name='lunar')
+        ros1 = {'ROS_VERSION': '1'}
+        index = get_dependency_index(distro, ros1)
+        self.assertEqual(index.get_depends('foo', 'build'), {'foo_1'})
+        self.assertEqual(index.get_depends('foo', 'exec'), set())
+        self.assertIs(get_dependency_index(distro, dict(ros1)), index)
+        get_dependency_index(distro, ros1).get_depends('foo', 'test')
+        # every type was indexed at once
+        self.assertEqual(
+            _FakeDependencyWalker.calls,
+            [('foo', dep_type) for dep_type in dependency_types])
+        # another condition context or distro gets an index of its own
+        index = get_dependency_index(distro, {'ROS_VERSION': '2'})
+        self.assertEqual(index.get_depends('foo', 'build'), {'foo_2'})
+        other_distro = SimpleNamespace(name='lunar')
+        self.assertIsNot(
+            get_dependency_index(other_distro, ros1),
+            get_dependency_index(distro, ros1))
+
+
+class TestPackageIndex(unittest.TestCase):
+    def test_package_index(self):
+        """Test the package names and their repositories and versions"""
+        distro = SimpleNamespace(
+            name='lunar',
+            release_packages={
+                'foo': SimpleNamespace(repository_name='foo_repo'),
+                'bar': SimpleNamespace(repository_name='foo_repo'),
+                'baz': SimpleNamespace(repository_name='baz_repo'),
+            },
+            repositories={
+                'foo_repo': SimpleNamespace(
+                    release_repository=SimpleNamespace(version='1.0.0-1')),
+                'baz_repo': SimpleNamespace(
+                    release_repository=SimpleNamespace(version=None)),
+            }
+        )
+        index = get_package_index(distro)
+        self.assertIs(get_package_index(distro), index)
+        self.assertEqual(index.released, {'foo', 'bar'})
+        self.assertEqual(index.unreleased, {'baz'})
+        self.assertIn('foo', index)
+        self.assertNotIn('baz', index)
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.repositories['bar'], 'foo_repo')
+        self.assertEqual(index.versions['bar'], '1.0.0-1')
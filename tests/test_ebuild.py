@@ -12,13 +12,19 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+import tempfile
 from time import gmtime, strftime
+from types import SimpleNamespace
 import re
 
 from superflore.generators.ebuild.ebuild import Ebuild
 from superflore.generators.ebuild.ebuild import ebuild_keyword
+from superflore.generators.ebuild.gen_packages import _write_pkg
+from superflore.output_writer import OutputWriter
 from superflore.exceptions import UnresolvedDependency
 import unittest
+from unittest import mock
 
 
 class TestEbuildOutput(unittest.TestCase):
@@ -119,8 +125,7 @@ class TestEbuildOutput(unittest.TestCase):
         ebuild = self.get_ebuild()
         ebuild.add_run_depend('pkg-config', False)
         got_text = ebuild.get_ebuild_text('Open Source Robotics Foundation', 'BSD')
-        self.assertTrue('pkg-config' in ebuild.depends_external)
-        self.assertTrue('virtual/pkgconfig' in got_text)
+        self.assertTrue('virtual/pkgconfig' in got_text.split('DEPEND="${RDEPEND}')[1])
 
     def test_ebuild_keyword_unstable(self):
         """Test Unstable Keyword"""
@@ -212,3 +217,82 @@ class TestEbuildOutput(unittest.TestCase):
         # grab the license line
         license_line = [line for line in got_text.split('\n') if "LICENSE" in line][0]
         self.assertEqual(license_line, 'LICENSE="( BSD LGPL Apache-2.0 )"')
+
+    def test_render_twice(self):
+        """Test that rendering leaves the ebuild untouched"""
+        def resolve_dep(dep, os_name, distro=None):
+            if dep == 'fake_package':
+                raise UnresolvedDependency(dep)
+            return {'pkg-config': ['virtual/pkgconfig']}.get(
+                dep, ['dev-libs/' + dep]), None, None
+
+        ebuild = self.get_ebuild()
+        ebuild.description = 'an (ebuild)'
+        ebuild.upstream_license = ['BSD, LGPL']
+        ebuild.add_run_depend('pkg-config', False)
+        ebuild.add_build_depend('boost', False)
+        with mock.patch(
+            'superflore.generators.ebuild.ebuild.resolve_dep', resolve_dep
+        ):
+            got_text = ebuild.get_ebuild_text('Open Source Robotics Foundation', 'BSD')
+            self.assertEqual(
+                got_text,
+                ebuild.get_ebuild_text('Open Source Robotics Foundation', 'BSD'))
+            self.assertEqual(ebuild.description, 'an (ebuild)')
+            self.assertEqual(ebuild.depends_external, ['boost'])
+            self.assertEqual(got_text.count('virtual/pkgconfig'), 1)
+            ebuild.add_test_depend('fake_package', False)
+            for _ in range(2):
+                with self.assertRaises(UnresolvedDependency):
+                    ebuild.get_ebuild_text('Open Source Robotics Foundation', 'BSD')
+                self.assertEqual(ebuild.get_unresolved(), ['fake_package'])
+
+
+class TestWritePkg(unittest.TestCase):
+    def _write_pkg(self, repo_dir, existing):
+        """Write the same foo-1.0.0 over what is in existing"""
+        overlay = SimpleNamespace(repo=SimpleNamespace(
+            repo_dir=repo_dir, queue_removal=mock.Mock()))
+        pkg_dir = os.path.join(repo_dir, 'ros-lunar', 'foo')
+        job = {
+            'overlay': overlay,
+            'distro': SimpleNamespace(name='lunar'),
+            'pkg': 'foo',
+            'version': '1.0.0',
+            'previous_version': None,
+            'existing': [os.path.join(pkg_dir, e) for e in existing],
+            'manifest_file': os.path.join(pkg_dir, 'Manifest'),
+            'current': SimpleNamespace(changed=True, written=[]),
+            'ebuild_text': 'ebuild\n',
+            'metadata_text': 'metadata\n',
+        }
+        writer = OutputWriter()
+        with mock.patch(
+            'superflore.generators.ebuild.gen_packages.get_output_writer',
+            return_value=writer
+        ):
+            current, _, _ = _write_pkg(job)
+        writer.flush()
+        return current, overlay.repo.queue_removal
+
+    def test_unchanged(self):
+        """Test leaving an unchanged ebuild and its Manifest alone"""
+        with tempfile.TemporaryDirectory() as repo_dir:
+            current, queue_removal = self._write_pkg(
+                repo_dir, ['foo-1.0.0.ebuild'])
+            self.assertTrue(current.changed)
+            self.assertEqual(queue_removal.call_count, 1)
+            queue_removal.assert_called_with(
+                os.path.join(repo_dir, 'ros-lunar', 'foo', 'Manifest'))
+            current, queue_removal = self._write_pkg(
+                repo_dir, ['foo-1.0.0.ebuild'])
+            self.assertFalse(current.changed)
+            queue_removal.assert_not_called()
+            # removing the other versions changes the Manifest
+            current, queue_removal = self._write_pkg(
+                repo_dir, ['foo-0.9.0.ebuild', 'foo-1.0.0.ebuild'])
+            self.assertTrue(current.changed)
+            self.assertEqual(
+                [args[0] for args, _ in queue_removal.call_args_list],
+                [os.path.join(repo_dir, 'ros-lunar', 'foo', name)
+                 for name in ['foo-0.9.0.ebuild', 'Manifest']])
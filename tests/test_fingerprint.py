@@ -0,0 +1,103 @@
+# Copyright 2020 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import tempfile
+
+from superflore.fingerprint import FingerprintStore
+import unittest
+from unittest import mock
+
+from tests.fakes import FakeDependencyWalker
+from tests.fakes import get_fake_distro
+from tests.fakes import resolve_dep
+
+
+class _FakeDependencyWalker(FakeDependencyWalker):
+    depends = {
+        'foo': {'build': {'bar', 'boost'}, 'exec': {'bar'}},
+        'bar': {'build': {'missing'}},
+    }
+
+
+@mock.patch(
+    'superflore.distro_index.DependencyWalker', _FakeDependencyWalker)
+@mock.patch('superflore.fingerprint.resolve_dep', resolve_dep)
+class TestFingerprint(unittest.TestCase):
+    def test_get_fingerprint(self):
+        """Test which inputs change the fingerprint of a package"""
+        versions = {'foo': '1.0.0-1', 'bar': '2.0.0-0'}
+        package_xmls = {'foo': '<package/>', 'bar': '<package/>'}
+        distro = get_fake_distro('lunar', versions, package_xmls)
+        store = FingerprintStore(None, 'gentoo')
+        fingerprint = store.get_fingerprint(distro, 'foo')
+        self.assertEqual(fingerprint, store.get_fingerprint(distro, 'foo'))
+        self.assertNotEqual(fingerprint, store.get_fingerprint(distro, 'bar'))
+        # a new release
+        versions['foo'] = '1.0.1-1'
+        distro = get_fake_distro('lunar', versions, package_xmls)
+        new_fingerprint = store.get_fingerprint(distro, 'foo')
+        self.assertNotEqual(fingerprint, new_fingerprint)
+        # the package.xml changed
+        package_xmls['foo'] = '<package format="2"/>'
+        fingerprint = new_fingerprint
+        new_fingerprint = store.get_fingerprint(distro, 'foo')
+        self.assertNotEqual(fingerprint, new_fingerprint)
+        # a rosdep key resolves differently
+        fingerprint = new_fingerprint
+        with mock.patch(
+            'superflore.fingerprint.resolve_dep',
+            lambda dep, os_name, distro_name: (['dev-libs/boost-1'], 0, 0)
+        ):
+            new_fingerprint = store.get_fingerprint(distro, 'foo')
+        self.assertNotEqual(fingerprint, new_fingerprint)
+        # the extra inputs of the generator changed
+        store.get_extra_inputs = lambda distro, pkg: {'patches': []}
+        fingerprint = store.get_fingerprint(distro, 'foo')
+        store.get_extra_inputs = lambda distro, pkg: {'patches': ['a.patch']}
+        self.assertNotEqual(fingerprint, store.get_fingerprint(distro, 'foo'))
+
+    def test_store(self):
+        """Test recording fingerprints and keeping them between runs"""
+        versions = {'foo': '1.0.0-1', 'bar': '2.0.0-0'}
+        package_xmls = {'foo': '<package/>', 'bar': '<package/>'}
+        distro = get_fake_distro('lunar', versions, package_xmls)
+        restored = list()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'fingerprints.json')
+            with FingerprintStore(
+                filename, 'gentoo', incremental=True,
+                get_data=lambda current: {'generated': current},
+                restore_data=restored.append
+            ) as store:
+                self.assertFalse(store.is_current(distro, 'foo'))
+                store.record(distro, 'foo', 'foo-1.0.0-r1')
+                store.record(distro, 'bar', 'bar-2.0.0')
+                self.assertTrue(store.is_current(distro, 'foo'))
+                store.forget(distro, 'bar')
+                self.assertFalse(store.is_current(distro, 'bar'))
+            self.assertTrue(os.path.isfile(filename))
+            restored.clear()
+            versions['bar'] = '2.0.1-0'
+            distro = get_fake_distro('lunar', versions, package_xmls)
+            with FingerprintStore(
+                filename, 'gentoo', restore_data=restored.append
+            ) as store:
+                self.assertEqual(store.get_packages(distro), {'foo'})
+                self.assertTrue(store.is_current(distro, 'foo'))
+                self.assertEqual(restored, [{'generated': 'foo-1.0.0-r1'}])
+                store.record(distro, 'bar', 'bar-2.0.1')
+                self.assertFalse(
+                    store.is_current(get_fake_distro(
+                        'melodic', versions, package_xmls), 'bar'))
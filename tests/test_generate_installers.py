@@ -130,3 +130,19 @@ class TestGenerateInstallers(unittest.TestCase):
                 print(ret.groups())
                 self.assertIn('p2os', ret.group(0))
         self.assertTrue(found)
+
+    def test_parallel_generation(self):
+        """Test that parallel jobs give the same results in the same order"""
+        serial_acc = list()
+        serial = generate_installers(
+            get_distro('lunar'), None, _fail_if_p2os, False, serial_acc
+        )
+        parallel_acc = list()
+        parallel = generate_installers(
+            get_distro('lunar'), None, _fail_if_p2os, False, parallel_acc,
+            jobs=4
+        )
+        self.assertEqual(sorted(serial_acc), sorted(parallel_acc))
+        self.assertEqual(serial[0], parallel[0])
+        self.assertEqual(list(serial[1]), list(parallel[1]))
+        self.assertEqual(serial[2], parallel[2])
@@ -0,0 +1,111 @@
+# Copyright 2020 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import stat
+import tempfile
+import threading
+
+from superflore import timing
+from superflore.output_writer import flush_output
+from superflore.output_writer import OutputWriter
+from superflore.timing import enable_timing
+import unittest
+from unittest import mock
+
+
+class TestOutputWriter(unittest.TestCase):
+    def setUp(self):
+        self.umask = os.umask(0o022)
+
+    def tearDown(self):
+        os.umask(self.umask)
+
+    def test_write(self):
+        """Test writing files in the background"""
+        writer = OutputWriter(queue_depth=2)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            existing = os.path.join(tmp_dir, 'existing.ebuild')
+            with open(existing, 'w') as existing_file:
+                existing_file.write('old')
+            os.chmod(existing, 0o600)
+            written = [
+                writer.write(
+                    os.path.join(tmp_dir, 'foo-{0}.ebuild'.format(i)),
+                    'ebuild {0}\n'.format(i))
+                for i in range(10)
+            ]
+            writer.write(existing, 'new')
+            self.assertEqual(writer.flush(), [])
+            self.assertTrue(written[3].result())
+            with open(os.path.join(tmp_dir, 'foo-3.ebuild'), 'r') as f:
+                self.assertEqual(f.read(), 'ebuild 3\n')
+            with open(existing, 'r') as existing_file:
+                self.assertEqual(existing_file.read(), 'new')
+            # no temporary file is left behind
+            self.assertEqual(len(os.listdir(tmp_dir)), 11)
+            # new files honour the umask, existing ones keep their mode
+            self.assertEqual(stat.S_IMODE(os.stat(
+                os.path.join(tmp_dir, 'foo-0.ebuild')).st_mode), 0o644)
+            self.assertEqual(stat.S_IMODE(os.stat(existing).st_mode), 0o600)
+
+    @mock.patch('superflore.output_writer.err')
+    def test_failure(self, err):
+        """Test reporting the files which couldn't be written"""
+        writer = OutputWriter()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            missing = os.path.join(tmp_dir, 'missing', 'foo.bb')
+            written = writer.write(missing, 'recipe')
+            writer.write(os.path.join(tmp_dir, 'bar.bb'), 'recipe')
+            self.assertEqual(writer.flush(), [missing])
+            self.assertIsInstance(written.exception(), FileNotFoundError)
+            self.assertEqual(err.call_count, 1)
+            self.assertEqual(os.listdir(tmp_dir), ['bar.bb'])
+        self.assertEqual(writer.flush(), [])
+
+    def test_unchanged(self):
+        """Test leaving the files which hold the text already alone"""
+        writer = OutputWriter()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            recipe = os.path.join(tmp_dir, 'foo_1.0.0-1.bb')
+            self.assertFalse(writer.is_unchanged(recipe, 'recipe\n'))
+            # what is handed over counts before it's written
+            release = threading.Event()
+            write = writer._write
+            writer._write = lambda *args: release.wait() and write(*args)
+            written = writer.write(recipe, 'recipe\n')
+            self.assertTrue(writer.is_unchanged(recipe, 'recipe\n'))
+            self.assertFalse(os.path.exists(recipe))
+            release.set()
+            self.assertTrue(written.result())
+            self.assertTrue(writer.is_unchanged(recipe, 'recipe\n'))
+            mtime = os.stat(recipe).st_mtime_ns
+            self.assertFalse(writer.write(recipe, 'recipe\n').result())
+            self.assertEqual(os.stat(recipe).st_mtime_ns, mtime)
+            self.assertFalse(writer.is_unchanged(recipe, 'recipe 2\n'))
+            self.assertTrue(writer.write(recipe, 'recipe 2\n').result())
+            with open(recipe, 'r') as recipe_file:
+                self.assertEqual(recipe_file.read(), 'recipe 2\n')
+
+    @mock.patch('superflore.output_writer.get_output_writer')
+    def test_flush_timed(self, get_output_writer):
+        """Test timing the wait for the files as writing"""
+        get_output_writer.return_value.flush.return_value = list()
+        enable_timing()
+        try:
+            flush_output()
+            self.assertEqual(len(timing.timings['write']), 1)
+        finally:
+            timing.timings.clear()
+            timing.timing_enabled = False
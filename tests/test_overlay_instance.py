@@ -0,0 +1,74 @@
+# Copyright 2020 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import tempfile
+from types import SimpleNamespace
+
+from superflore.generators.ebuild.overlay_instance import OverlayInventory
+import unittest
+from unittest import mock
+
+
+def _touch(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w'):
+        pass
+
+
+@mock.patch(
+    'superflore.generators.ebuild.overlay_instance.get_package_index',
+    lambda distro: {'catkin', 'roscpp', 'rviz'})
+class TestOverlayInventory(unittest.TestCase):
+    def test_inventory(self):
+        """Test indexing the packages of the overlay in one scan"""
+        distro = SimpleNamespace(name='melodic')
+        with tempfile.TemporaryDirectory() as repo_dir:
+            distro_dir = os.path.join(repo_dir, 'ros-melodic')
+            for path in [
+                'catkin/catkin-0.7.20.ebuild',
+                'catkin/Manifest',
+                'catkin/metadata.xml',
+                'catkin/files/0001-fix.patch',
+                'catkin/files/0002-fix.patch',
+                'catkin/files/README',
+                'roscpp/roscpp-1.14.3.ebuild',
+                'roscpp/roscpp-1.14.4.ebuild',
+                'p2os/p2os-2.1.1.ebuild',
+            ]:
+                _touch(os.path.join(distro_dir, path))
+            inventory = OverlayInventory(repo_dir, distro)
+        catkin = inventory.get('catkin')
+        self.assertEqual(
+            catkin.ebuilds, [distro_dir + '/catkin/catkin-0.7.20.ebuild'])
+        self.assertTrue(catkin.manifest)
+        self.assertTrue(catkin.has_patches)
+        self.assertEqual(catkin.patches, [
+            distro_dir + '/catkin/files/0001-fix.patch',
+            distro_dir + '/catkin/files/0002-fix.patch',
+        ])
+        roscpp = inventory.get('roscpp')
+        self.assertEqual(len(roscpp.ebuilds), 2)
+        self.assertFalse(roscpp.manifest)
+        self.assertFalse(roscpp.has_patches)
+        self.assertEqual(inventory.get('rviz').ebuilds, [])
+        self.assertEqual(inventory.stale, ['p2os'])
+
+    def test_missing_distro(self):
+        """Test the inventory of a distro which isn't in the overlay yet"""
+        with tempfile.TemporaryDirectory() as repo_dir:
+            inventory = OverlayInventory(
+                repo_dir, SimpleNamespace(name='noetic'))
+        self.assertEqual(inventory.packages, dict())
+        self.assertEqual(inventory.stale, [])
@@ -0,0 +1,104 @@
+# Copyright 2020 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import tempfile
+import threading
+import time
+
+from superflore import package_xml
+from superflore.package_xml import get_package_xml
+from superflore.package_xml import PackageXmlStore
+from superflore.package_xml import prefetch_package_xmls
+from superflore.package_xml import set_package_xml_store
+import unittest
+from unittest import mock
+
+from tests.fakes import get_fake_distro
+
+
+class _FakeRosPackage(object):
+    """Counts the package.xml fetches in flight"""
+    lock = threading.Lock()
+    in_flight = 0
+    max_in_flight = 0
+    fetched = list()
+
+    def __init__(self, name, repository):
+        self.name = name
+
+    def get_package_xml(self, distro_name):
+        with _FakeRosPackage.lock:
+            _FakeRosPackage.in_flight += 1
+            _FakeRosPackage.max_in_flight = max(
+                _FakeRosPackage.max_in_flight, _FakeRosPackage.in_flight)
+            _FakeRosPackage.fetched.append(self.name)
+        time.sleep(0.01)
+        with _FakeRosPackage.lock:
+            _FakeRosPackage.in_flight -= 1
+        return '<package>%s</package>' % self.name
+
+
+class TestPackageXml(unittest.TestCase):
+    def setUp(self):
+        package_xml.package_xml_cache.clear()
+        set_package_xml_store(None)
+        _FakeRosPackage.max_in_flight = 0
+        _FakeRosPackage.fetched = list()
+
+    @mock.patch('superflore.package_xml.RosPackage', _FakeRosPackage)
+    def test_prefetch(self):
+        """Test prefetching package.xml files with bounded concurrency"""
+        pkgs = ['pkg_%d' % i for i in range(20)]
+        distro = get_fake_distro('lunar', pkgs)
+        prefetch_package_xmls(distro, pkgs, jobs=3)
+        self.assertEqual(sorted(_FakeRosPackage.fetched), sorted(pkgs))
+        self.assertLessEqual(_FakeRosPackage.max_in_flight, 3)
+        # served from memory from now on
+        self.assertEqual(
+            get_package_xml(distro, 'pkg_7'), '<package>pkg_7</package>')
+        prefetch_package_xmls(distro, pkgs, jobs=3)
+        self.assertEqual(len(_FakeRosPackage.fetched), len(pkgs))
+
+    @mock.patch('superflore.package_xml.RosPackage', _FakeRosPackage)
+    def test_store(self):
+        """Test keeping package.xml files on disk between runs"""
+        pkgs = ['pkg_%d' % i for i in range(5)]
+        distro = get_fake_distro('lunar', pkgs)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'package-xml')
+            set_package_xml_store(PackageXmlStore(path))
+            prefetch_package_xmls(distro, pkgs, jobs=2)
+            self.assertEqual(len(_FakeRosPackage.fetched), len(pkgs))
+            # a new run: nothing in memory, but everything on disk
+            package_xml.package_xml_cache.clear()
+            store = PackageXmlStore(path)
+            set_package_xml_store(store)
+            prefetch_package_xmls(distro, pkgs, jobs=2)
+            self.assertEqual(
+                get_package_xml(distro, 'pkg_3'), b'<package>pkg_3</package>')
+            self.assertEqual(len(_FakeRosPackage.fetched), len(pkgs))
+            # the same content is only stored once
+            url = 'https://github.com/ros2-gbp/pkg_3-release.git'
+            store.put(url, 'release/lunar/pkg_3/1.0.0-2',
+                      '<package>pkg_3</package>')
+            self.assertEqual(
+                store.get(url, 'release/lunar/pkg_3/1.0.0-2'),
+                b'<package>pkg_3</package>')
+            blobs = [
+                f for _, _, files in os.walk(path) for f in files
+                if f.endswith('.xml.gz')
+            ]
+            self.assertEqual(len(blobs), len(pkgs))
+            self.assertIsNone(store.get(url, 'release/lunar/pkg_3/0.9.0-1'))
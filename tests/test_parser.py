@@ -35,3 +35,12 @@ class TestParserSetup(unittest.TestCase):
         self.assertIn('upstream_repo', ret)
         self.assertIn('upstream_branch', ret)
         self.assertIn('skip_keys', ret)
+        self.assertIn('jobs', ret)
+        self.assertIn('cache_dir', ret)
+        self.assertIn('incremental', ret)
+        self.assertIn('resume', ret)
+        self.assertIn('timing_report', ret)
+        self.assertIn('snapshot', ret)
+        self.assertIn('clone_depth', ret)
+        self.assertIn('clone_filter', ret)
+        self.assertIn('sparse_checkout', ret)
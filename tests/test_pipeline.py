@@ -0,0 +1,95 @@
+# Copyright 2020 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+import threading
+import time
+
+from superflore.pipeline import Done
+from superflore.pipeline import Pipeline
+from superflore.pipeline import run_stages
+import unittest
+
+
+def _fetch(n, offset):
+    time.sleep(random.random() / 100)
+    if n % 7 == 0:
+        return Done('skipped %d' % n)
+    if n % 5 == 0:
+        raise KeyError(n)
+    return n + offset
+
+
+def _render(n):
+    return n * 2
+
+
+def _write(n):
+    return 'wrote %d' % n
+
+
+_stages = [(_fetch, 4), (_render, 1), (_write, 1)]
+
+
+def _get_results(results):
+    ret = list()
+    for get_result in results:
+        try:
+            ret.append(get_result())
+        except KeyError as e:
+            ret.append('failed %s' % e)
+    return ret
+
+
+class TestPipeline(unittest.TestCase):
+    def test_run_stages(self):
+        """Test running the stages serially"""
+        funcs = [func for func, _ in _stages]
+        self.assertEqual(run_stages(funcs, 1, 10), 'wrote 22')
+        self.assertEqual(run_stages(funcs, 7, 10), 'skipped 7')
+        with self.assertRaises(KeyError):
+            run_stages(funcs, 5, 10)
+
+    def test_pipeline(self):
+        """Test the pipeline gives the serial results in the same order"""
+        funcs = [func for func, _ in _stages]
+        items = [(n, 10) for n in range(50)]
+        expected = _get_results(
+            [lambda args=args: run_stages(funcs, *args) for args in items])
+        got = _get_results(Pipeline(_stages, queue_depth=5).run(items))
+        self.assertEqual(expected, got)
+
+    def test_queue_depth(self):
+        """Test that no more than queue_depth items are in flight"""
+        lock = threading.Lock()
+        state = {'in_flight': 0, 'max_in_flight': 0}
+
+        def _start(n):
+            with lock:
+                state['in_flight'] += 1
+                state['max_in_flight'] = max(
+                    state['max_in_flight'], state['in_flight'])
+            time.sleep(0.001)
+            return n
+
+        def _finish(n):
+            with lock:
+                state['in_flight'] -= 1
+            return n
+
+        pipeline = Pipeline([(_start, 8), (_finish, 1)], queue_depth=3)
+        got = [get_result() for get_result in
+               pipeline.run((n,) for n in range(40))]
+        self.assertEqual(got, list(range(40)))
+        self.assertLessEqual(state['max_in_flight'], 3)
@@ -0,0 +1,164 @@
+# Copyright 2020 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+
+from git import Repo
+from git.cmd import Git
+from superflore.repo_instance import RepoInstance
+from superflore.repo_instance import RepoMirror
+import unittest
+from unittest import mock
+
+
+def _commit_files(repo, paths, message):
+    for path in paths:
+        path = os.path.join(repo.working_tree_dir, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(message)
+    repo.git.add('.')
+    repo.git.execute([
+        'git', '-c', 'user.name=A', '-c', 'user.email=a@example.com',
+        'commit', '-q', '-m', message
+    ])
+
+
+class TestRepoInstance(unittest.TestCase):
+    @mock.patch('superflore.repo_instance.err')
+    def test_removals(self, err):
+        """Test removing queued files with a single git rm"""
+        with tempfile.TemporaryDirectory() as repo_dir:
+            repo = Repo.init(repo_dir)
+            for name in ['foo-1.0.ebuild', 'Manifest', 'bar[1].bb', 'keep']:
+                with open(os.path.join(repo_dir, name), 'w') as f:
+                    f.write(name)
+            repo.git.add('.')
+            repo.git.execute([
+                'git', '-c', 'user.name=A', '-c', 'user.email=a@example.com',
+                'commit', '-q', '-m', 'files'
+            ])
+            overlay = RepoInstance('ros', 'ros-overlay', repo_dir, False)
+            overlay.queue_removal(os.path.join(repo_dir, 'foo-1.0.ebuild'))
+            overlay.queue_removal('Manifest')
+            overlay.queue_removal('bar[1].bb', True)
+            overlay.queue_removal('missing.ebuild', True)
+            overlay.queue_removal('missing-too.ebuild')
+            # removed from the working tree right away
+            self.assertFalse(
+                os.path.exists(os.path.join(repo_dir, 'foo-1.0.ebuild')))
+            with mock.patch.object(
+                Git, 'execute', autospec=True, side_effect=Git.execute
+            ) as execute:
+                failed = overlay.flush_removals()
+                self.assertEqual(execute.call_count, 1)
+            self.assertEqual(failed, ['missing-too.ebuild', 'missing.ebuild'])
+            err.assert_called_once_with(
+                'Failed to remove file missing-too.ebuild from source '
+                'control.')
+            self.assertEqual(sorted(repo.git.status('--porcelain').split(
+                '\n')), ['D  Manifest', 'D  bar[1].bb', 'D  foo-1.0.ebuild'])
+            # nothing is left to flush
+            self.assertEqual(overlay.flush_removals(), [])
+
+    def test_shallow_sparse_clone(self):
+        """Test a shallow, partial and sparse clone, deepened on demand"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            upstream_dir = os.path.join(tmp_dir, 'upstream')
+            upstream = Repo.init(upstream_dir)
+            upstream.git.config('uploadpack.allowFilter', 'true')
+            for i in range(3):
+                _commit_files(
+                    upstream, ['ros-noetic/foo/foo.ebuild', 'ros-lunar/bar'],
+                    str(i))
+            branch = upstream.active_branch.name
+            repo_dir = os.path.join(tmp_dir, 'ros-overlay')
+            Repo.init(repo_dir)
+            overlay = RepoInstance(
+                'ros', 'ros-overlay', repo_dir, False, clone_depth=1,
+                clone_filter='blob:none', sparse_paths=['ros-noetic'])
+            overlay.repo_url = 'file://' + upstream_dir
+            with mock.patch('superflore.repo_instance.info'):
+                overlay.clone(branch)
+            self.assertTrue(os.path.isfile(
+                os.path.join(repo_dir, 'ros-noetic/foo/foo.ebuild')))
+            self.assertFalse(
+                os.path.exists(os.path.join(repo_dir, 'ros-lunar')))
+            self.assertTrue(overlay.is_shallow())
+            self.assertEqual(
+                overlay.git.config('remote.origin.promisor'), 'true')
+            self.assertEqual(len(overlay.git.log(
+                '--oneline', '--', 'ros-noetic').split('\n')), 1)
+            with mock.patch('superflore.repo_instance.info'):
+                overlay.unshallow()
+            self.assertFalse(overlay.is_shallow())
+            self.assertEqual(len(overlay.git.log(
+                '--oneline', '--', 'ros-noetic').split('\n')), 3)
+
+    @mock.patch('superflore.repo_instance.info')
+    def test_mirror(self, info):
+        """Test checking worktrees out of a mirror kept between runs"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            upstream = Repo.init(os.path.join(tmp_dir, 'upstream'))
+            _commit_files(
+                upstream, ['ros-noetic/foo/foo.ebuild', 'ros-lunar/bar'], '0')
+            branch = upstream.active_branch.name
+            upstream_url = 'file://' + upstream.working_tree_dir
+            mirror = RepoMirror(os.path.join(tmp_dir, 'mirrors', 'ros.git'))
+            mirror.update(upstream_url)
+            worktree_dir = os.path.join(tmp_dir, 'run-1')
+            os.mkdir(worktree_dir)
+            worktree = mirror.add_worktree(worktree_dir, branch)
+            self.assertTrue(os.path.isfile(
+                os.path.join(worktree_dir, 'ros-lunar/bar')))
+            self.assertEqual(
+                worktree.active_branch.name,
+                mirror.get_worktree_branch(worktree_dir))
+            # another run sharing the mirror keeps its branches
+            other_dir = os.path.join(tmp_dir, 'other-run')
+            other_worktree = mirror.add_worktree(other_dir, branch)
+            other_worktree.git.checkout('HEAD', b='gentoo-bot-0')
+            worktree.git.checkout('HEAD', b='gentoo-bot-1')
+            _commit_files(worktree, ['ros-noetic/foo/foo.ebuild'], 'run')
+            mirror.remove_worktree(worktree_dir)
+            self.assertFalse(os.path.exists(worktree_dir))
+            self.assertEqual(
+                mirror.git.for_each_ref('--format=%(refname)', 'refs/heads'),
+                'refs/heads/gentoo-bot-0')
+            mirror.remove_worktree(other_dir)
+            self.assertEqual(mirror.git.for_each_ref('refs/heads'), '')
+            # the next run only fetches the new commit
+            _commit_files(upstream, ['ros-noetic/foo/foo.ebuild'], '1')
+            mirror.update(upstream_url)
+            Repo.init(worktree_dir)
+            overlay = RepoInstance(
+                'ros', 'ros-overlay', worktree_dir, False,
+                sparse_paths=['ros-noetic'], mirror=mirror)
+            overlay.repo_url = upstream_url
+            with mock.patch('superflore.repo_instance.atexit') as at_exit:
+                overlay.clone()
+            at_exit.register.assert_called_once_with(
+                mirror.remove_worktree, worktree_dir)
+            self.assertEqual(
+                overlay.get_last_hash(), upstream.head.object.hexsha)
+            self.assertFalse(
+                os.path.exists(os.path.join(worktree_dir, 'ros-lunar')))
+            # a worktree thrown away without being removed is pruned
+            shutil.rmtree(worktree_dir)
+            worktree_dir = os.path.join(tmp_dir, 'run-2')
+            mirror.add_worktree(worktree_dir, branch)
+            self.assertEqual(len(mirror.git.worktree(
+                'list', '--porcelain').split('\n\n')), 2)
@@ -0,0 +1,58 @@
+# Copyright 2020 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from superflore.resolvability import get_external_keys
+from superflore.resolvability import get_unresolvable
+from superflore.resolvability import preresolve
+import unittest
+from unittest import mock
+
+from tests.fakes import FakeDependencyWalker
+from tests.fakes import get_fake_distro
+from tests.fakes import resolve_dep
+
+
+class _FakeDependencyWalker(FakeDependencyWalker):
+    depends = {
+        'foo': {'build': {'bar', 'boost'}, 'run': {'missing'}},
+        'bar': {'build': {'boost', 'missing'}, 'test': {'gtest'}},
+        'baz': {'run': {'bar'}},
+    }
+
+
+@mock.patch(
+    'superflore.distro_index.DependencyWalker', _FakeDependencyWalker)
+@mock.patch('superflore.resolvability.resolve_dep', resolve_dep)
+class TestResolvability(unittest.TestCase):
+    def test_external_keys(self):
+        """Test collecting the rosdep keys of packages"""
+        distro = get_fake_distro('lunar', ['foo', 'bar', 'baz'])
+        keys = get_external_keys(distro, ['foo', 'bar', 'baz'], ['build'])
+        self.assertEqual(keys, {
+            'boost': {'foo', 'bar'},
+            'missing': {'bar'},
+        })
+
+    def test_preresolve(self):
+        """Test reporting the unresolvable keys and what they block"""
+        distro = get_fake_distro('melodic', ['foo', 'bar', 'baz'])
+        self.assertEqual(get_unresolvable(distro, 'gentoo', 'foo'), [])
+        unresolvable = preresolve(
+            distro, 'gentoo', ['foo', 'bar', 'baz'], ['build', 'run', 'test'])
+        self.assertEqual(unresolvable, {'missing': {'foo', 'bar'}})
+        self.assertEqual(
+            get_unresolvable(distro, 'gentoo', 'foo'), ['missing'])
+        self.assertEqual(get_unresolvable(distro, 'gentoo', 'baz'), [])
+        self.assertEqual(
+            get_unresolvable(distro, 'openembedded', 'foo'), [])
@@ -0,0 +1,80 @@
+# Copyright 2020 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import tempfile
+from types import SimpleNamespace
+
+from git import Repo
+from superflore.generators.bitbake.ros_meta import RecipeInventory
+import unittest
+from unittest import mock
+
+_recipes_dir = 'meta-ros2-foxy/generated-recipes'
+
+
+def _write(repo_dir, path):
+    path = os.path.join(repo_dir, path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as recipe_file:
+        recipe_file.write('# recipe\n')
+
+
+@mock.patch(
+    'superflore.generators.bitbake.yocto_recipe.get_distro_type',
+    lambda distro: 'ros2')
+class TestRecipeInventory(unittest.TestCase):
+    def test_inventory(self):
+        """Test listing the recipes and their status at once"""
+        with tempfile.TemporaryDirectory() as repo_dir:
+            repo = Repo.init(repo_dir)
+            for path in [
+                'ament-lint/ament-cmake-copyright_0.9.1-1.bb',
+                'ament-lint/ament-lint_0.9.1-1.bb',
+                'rclcpp/rclcpp_2.0.0-1.bb',
+                'rclcpp/rclcpp-action_2.0.0-1.bb',
+            ]:
+                _write(repo_dir, os.path.join(_recipes_dir, path))
+            repo.git.add('.')
+            repo.git.execute([
+                'git', '-c', 'user.name=A', '-c', 'user.email=a@example.com',
+                'commit', '-q', '-m', 'recipes'
+            ])
+            repo.git.rm(os.path.join(_recipes_dir, 'rclcpp'), r=True)
+            _write(repo_dir, os.path.join(
+                _recipes_dir, 'ament-lint/ament-lint_0.9.2-1.bb'))
+            _write(repo_dir, os.path.join(
+                _recipes_dir, 'rviz/rviz-common_8.2.0-1.bb'))
+            inventory = RecipeInventory(
+                SimpleNamespace(repo_dir=repo_dir, git=repo.git), 'foxy')
+        self.assertEqual(inventory.get('rclcpp'), [(
+            os.path.join(_recipes_dir, 'rclcpp/rclcpp_2.0.0-1.bb'),
+            'deleted')])
+        self.assertEqual(inventory.get('rclcpp-action'), [(
+            os.path.join(_recipes_dir, 'rclcpp/rclcpp-action_2.0.0-1.bb'),
+            'deleted')])
+        self.assertEqual(inventory.get('ament-cmake-copyright'), [(
+            os.path.join(
+                _recipes_dir, 'ament-lint/ament-cmake-copyright_0.9.1-1.bb'),
+            'unchanged')])
+        self.assertEqual(inventory.get('ament-lint'), [
+            (os.path.join(_recipes_dir, 'ament-lint/ament-lint_0.9.2-1.bb'),
+             'modified'),
+            (os.path.join(_recipes_dir, 'ament-lint/ament-lint_0.9.1-1.bb'),
+             'unchanged'),
+        ])
+        self.assertEqual(inventory.get('rviz-common'), [(
+            os.path.join(_recipes_dir, 'rviz/rviz-common_8.2.0-1.bb'),
+            'modified')])
+        self.assertEqual(inventory.get('rviz'), [])
@@ -0,0 +1,106 @@
+# Copyright 2020 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from types import SimpleNamespace
+
+from superflore import rosdep_support
+from superflore.exceptions import UnresolvedDependency
+from superflore.rosdep_support import get_cached_index
+from superflore.rosdep_support import get_distro_type
+from superflore.rosdep_support import get_resolution_stats
+from superflore.rosdep_support import resolve_rosdep_key
+import unittest
+from unittest import mock
+
+
+class TestResolutionCache(unittest.TestCase):
+    def setUp(self):
+        rosdep_support.resolution_cache.clear()
+        rosdep_support.resolution_stats.update(hits=0, misses=0)
+        self.lookups = list()
+
+    def tearDown(self):
+        rosdep_support.resolution_cache.clear()
+        rosdep_support.resolution_stats.update(hits=0, misses=0)
+
+    def _resolve(self, key, os_name, os_version, ros_distro):
+        self.lookups.append((key, os_name, os_version, ros_distro))
+        if key == 'unknown':
+            raise UnresolvedDependency('could not resolve ' + key)
+        return ['dev-libs/' + key], 'portage', None
+
+    def test_cache(self):
+        """Test that each resolution is looked up only once"""
+        with mock.patch(
+            'superflore.rosdep_support._resolve_rosdep_key', self._resolve
+        ):
+            for _ in range(3):
+                self.assertEqual(
+                    resolve_rosdep_key('boost', 'gentoo', '2.4.0'),
+                    (['dev-libs/boost'], 'portage', None))
+                with self.assertRaises(UnresolvedDependency):
+                    resolve_rosdep_key('unknown', 'gentoo', '2.4.0')
+            # the cached list is not handed out
+            resolve_rosdep_key('boost', 'gentoo', '2.4.0')[0].append('x')
+            self.assertEqual(
+                resolve_rosdep_key('boost', 'gentoo', '2.4.0')[0],
+                ['dev-libs/boost'])
+            # the distro is part of the key
+            resolve_rosdep_key('boost', 'gentoo', '2.4.0', 'lunar')
+        self.assertEqual(self.lookups, [
+            ('boost', 'gentoo', '2.4.0', 'indigo'),
+            ('unknown', 'gentoo', '2.4.0', 'indigo'),
+            ('boost', 'gentoo', '2.4.0', 'lunar'),
+        ])
+        stats = get_resolution_stats()
+        self.assertEqual(stats['misses'], 3)
+        self.assertEqual(stats['hits'], 6)
+        self.assertEqual(stats['unresolved'], ['unknown'])
+
+
+def _get_fake_index(**distro_types):
+    return SimpleNamespace(distributions={
+        name: {'distribution_type': distro_type}
+        for name, distro_type in distro_types.items()
+    })
+
+
+class TestIndexCache(unittest.TestCase):
+    def setUp(self):
+        rosdep_support.rosdistro_index = None
+
+    def tearDown(self):
+        rosdep_support.rosdistro_index = None
+        rosdep_support.distro_types.clear()
+
+    def test_cache(self):
+        """Test fetching the index once, and again on refresh"""
+        fetched = list()
+
+        def get_index():
+            fetched.append(_get_fake_index(melodic='ros1'))
+            return fetched[-1]
+
+        with mock.patch('superflore.rosdep_support.get_index', get_index):
+            index = get_cached_index()
+            self.assertIs(get_cached_index(), index)
+            self.assertEqual(get_distro_type('melodic'), 'ros1')
+            self.assertIsNone(get_distro_type('lunar'))
+        self.assertEqual(len(fetched), 1)
+        with mock.patch(
+            'superflore.rosdep_support.rosdistro.get_index',
+            lambda url: _get_fake_index(melodic='ros1', foxy='ros2')
+        ):
+            self.assertIsNot(get_cached_index(refresh=True), index)
+        self.assertEqual(get_distro_type('foxy'), 'ros2')
@@ -0,0 +1,144 @@
+# Copyright 2020 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gzip
+import os
+import tarfile
+import tempfile
+
+from rosinstall_generator.distro import get_distro
+from superflore import package_xml
+from superflore import snapshot
+from superflore.snapshot import create_snapshot
+from superflore.snapshot import get_snapshot_tags
+from superflore.snapshot import use_snapshot
+import unittest
+from unittest import mock
+import yaml
+
+_distribution = {
+    'type': 'distribution',
+    'version': 2,
+    'release_platforms': {'ubuntu': ['focal']},
+    'repositories': {
+        'foo': {
+            'release': {
+                'packages': ['foo'],
+                'tags': {'release': 'release/noetic/{package}/{version}'},
+                'url': 'https://github.com/ros-gbp/foo-release.git',
+                'version': '1.0.0-1',
+            },
+        },
+    },
+}
+_package_xml = \
+    '<?xml version="1.0" ?><package format="2"><name>foo</name></package>'
+
+
+def _write_index(path):
+    """Write a rosdistro index with a single distro to path"""
+    with open(os.path.join(path, 'distribution.yaml'), 'w') as dist_file:
+        yaml.safe_dump(_distribution, dist_file)
+    cache = {
+        'type': 'cache',
+        'version': 2,
+        'name': 'noetic',
+        'distribution_file': [_distribution],
+        'release_package_xmls': {'foo': _package_xml},
+        'source_repo_package_xmls': {},
+    }
+    with gzip.open(os.path.join(path, 'noetic-cache.yaml.gz'), 'wb') as f:
+        f.write(yaml.safe_dump(cache).encode())
+    index = {
+        'type': 'index',
+        'version': 4,
+        'distributions': {
+            'noetic': {
+                'distribution': ['distribution.yaml'],
+                'distribution_cache': 'noetic-cache.yaml.gz',
+                'distribution_status': 'active',
+                'distribution_type': 'ros1',
+                'python_version': 3,
+            },
+        },
+    }
+    with open(os.path.join(path, 'index.yaml'), 'w') as index_file:
+        yaml.safe_dump(index, index_file)
+    return 'file://' + os.path.join(path, 'index.yaml')
+
+
+def _list_release_tags(repo_url, distro_name):
+    return {'refs/tags/release/noetic/foo/1.0.0-1': 'abc123'}
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.environ = mock.patch.dict(os.environ)
+        self.environ.start()
+
+    def tearDown(self):
+        self.environ.stop()
+        package_xml.set_package_xml_store(None)
+        snapshot.snapshot_tags.clear()
+
+    def test_round_trip(self):
+        """Test taking a snapshot and running from it"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            index_dir = os.path.join(tmp_dir, 'index')
+            sources_list_dir = os.path.join(tmp_dir, 'sources.list.d')
+            sources_cache_dir = os.path.join(tmp_dir, 'sources.cache')
+            for path in (index_dir, sources_list_dir, sources_cache_dir):
+                os.mkdir(path)
+            with open(os.path.join(sources_list_dir, '20-default.list'),
+                      'w') as sources_list:
+                sources_list.write('yaml file:///base.yaml\n')
+            os.environ['ROSDISTRO_INDEX_URL'] = _write_index(index_dir)
+            filename = os.path.join(tmp_dir, 'snapshot.tar.gz')
+            with mock.patch.multiple(
+                'superflore.snapshot',
+                get_sources_list_dir=lambda: sources_list_dir,
+                get_sources_cache_dir=lambda: sources_cache_dir,
+                _list_release_tags=_list_release_tags,
+            ):
+                create_snapshot(filename, ['noetic'], tags=True)
+            # the original inputs are gone
+            os.environ['ROSDISTRO_INDEX_URL'] = 'file:///nonexistent.yaml'
+            manifest = use_snapshot(filename)
+            self.assertEqual(manifest['distros'], ['noetic'])
+            distro = get_distro('noetic')
+            self.assertIn('foo', distro.release_packages)
+            self.assertEqual(
+                distro.get_release_package_xml('foo'), _package_xml)
+            repo = distro.repositories['foo'].release_repository
+            self.assertEqual(
+                package_xml._get_stored_package_xml(repo, 'foo').decode(),
+                _package_xml)
+            self.assertTrue(os.path.isfile(os.path.join(
+                os.environ['ROSDEP_SOURCE_PATH'], '20-default.list')))
+            self.assertEqual(
+                get_snapshot_tags('https://github.com/ros-gbp/foo-release'),
+                {'refs/tags/release/noetic/foo/1.0.0-1': 'abc123'})
+
+    def test_links(self):
+        """Test refusing snapshots with links in them"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'snapshot.tar.gz')
+            for link_type in (tarfile.SYMTYPE, tarfile.LNKTYPE):
+                with tarfile.open(filename, 'w:gz') as archive:
+                    member = tarfile.TarInfo('index.yaml')
+                    member.type = link_type
+                    member.linkname = '/etc/passwd'
+                    archive.addfile(member)
+                with self.assertRaisesRegex(RuntimeError, 'Invalid link'):
+                    use_snapshot(filename)
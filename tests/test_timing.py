@@ -0,0 +1,101 @@
+# Copyright 2020 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import tempfile
+import time
+
+from superflore import timing
+from superflore.timing import enable_timing
+from superflore.timing import get_timing_report
+from superflore.timing import record
+from superflore.timing import timed
+from superflore.timing import timed_stage
+from superflore.timing import write_timing_report
+import unittest
+
+
+@timed_stage('fetch')
+def _fetch(overlay, pkg):
+    # nested phases are put down to the package of the stage
+    with timed('package_xml'):
+        pass
+    return {'pkg': pkg}
+
+
+@timed_stage('render')
+def _render(job):
+    return job
+
+
+class TestTiming(unittest.TestCase):
+    def setUp(self):
+        timing.timings.clear()
+        enable_timing()
+
+    def tearDown(self):
+        timing.timings.clear()
+        timing.timing_enabled = False
+
+    def test_timed(self):
+        """Test which package the time is put down to"""
+        _render(_fetch(None, 'foo'))
+        with timed('git'):
+            pass
+        self.assertEqual(
+            [pkg for pkg, _ in timing.timings['package_xml']], ['foo'])
+        self.assertEqual([pkg for pkg, _ in timing.timings['render']], ['foo'])
+        self.assertEqual([pkg for pkg, _ in timing.timings['git']], [None])
+
+    def test_nested(self):
+        """Test timing a phase within the same phase only once"""
+        @timed('git')
+        def inner():
+            time.sleep(0.1)
+
+        @timed('git')
+        def outer():
+            inner()
+
+        outer()
+        report = get_timing_report()
+        self.assertEqual(report['phases']['git']['count'], 1)
+        self.assertLessEqual(
+            report['phases']['git']['total'], report['wall_seconds'])
+        # the phase can be timed again once it is over
+        inner()
+        self.assertEqual(len(timing.timings['git']), 2)
+
+    def test_report(self):
+        """Test the totals, percentiles and slowest packages"""
+        for i in range(1, 101):
+            record('rosdep', float(i), 'pkg_%d' % (i % 10))
+        record('git', 2.5)
+        report = get_timing_report(slowest=3)
+        rosdep = report['phases']['rosdep']
+        self.assertEqual(rosdep['count'], 100)
+        self.assertEqual(rosdep['total'], 5050.0)
+        self.assertEqual(rosdep['p50'], 50.0)
+        self.assertEqual(rosdep['p90'], 90.0)
+        self.assertEqual(rosdep['max'], 100.0)
+        self.assertEqual(
+            [slow['package'] for slow in rosdep['slowest']],
+            ['pkg_0', 'pkg_9', 'pkg_8'])
+        self.assertEqual(report['phases']['git']['slowest'], [])
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'timing.json')
+            write_timing_report(filename)
+            with open(filename) as report_file:
+                self.assertIn('rosdep', json.load(report_file)['phases'])
@@ -19,12 +19,15 @@ import time
 
 from pkg_resources import parse_version
 from superflore import __version__
+from superflore import utils
 from superflore.exceptions import UnknownPlatform
 from superflore.exceptions import UnresolvedDependency
 from superflore.TempfileManager import TempfileManager
 from superflore.utils import clean_up
 from superflore.utils import gen_delta_msg
 from superflore.utils import get_license
+from superflore.utils import get_license_alias_counts
+from superflore.utils import get_licenses
 from superflore.utils import gen_missing_deps_msg
 from superflore.utils import get_pr_text
 from superflore.utils import get_superflore_version
@@ -127,6 +130,18 @@ class TestUtils(unittest.TestCase):
         ret = get_license('United States Government Purpose')
         self.assertEqual(ret, 'United-States-Government-Purpose')
 
+    def test_get_licenses(self):
+        """Test normalizing a list of licenses and counting the aliases"""
+        utils.license_alias_counts.clear()
+        ret = get_licenses(['BSD', 'Apache 2.0', 'LGPLv3', 'Apache 2.0'])
+        self.assertEqual(
+            ret, ['BSD', 'Apache-2.0', 'LGPL-3.0-only', 'Apache-2.0'])
+        self.assertEqual(get_license('Public Domain'), 'PD')
+        self.assertEqual(
+            get_license_alias_counts(),
+            [('Apache 2.0', 2), ('LGPLv3', 1), ('Public Domain', 1)])
+        utils.license_alias_counts.clear()
+
     def test_delta_msg(self):
         """Test the delta message generated for the PR"""
         self.set_lang_env()
@@ -0,0 +1,122 @@
+# Copyright 2020 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from superflore.generators.bitbake.yocto_recipe import yoctoRecipe
+import unittest
+from unittest import mock
+
+from tests.fakes import resolve_dep as fake_resolve_dep
+
+_ls_remote_output = '\n'.join([
+    '48bf1aa1cb083a884fbc8520ced00523255aeaed\t'
+    'refs/tags/release/bouncy/ament_cmake_copyright/0.5.2-0',
+    '1b2c3d4e5f60718293a4b5c6d7e8f90123456789\t'
+    'refs/tags/release/bouncy/ament_cmake_copyright/0.5.2-0^{}',
+    '5e6f7a8b9c0d1e2f3a4b5c6d7e8f9a0b1c2d3e4f\t'
+    'refs/tags/release/bouncy/ament_lint/0.5.2-0',
+])
+
+
+def _get_recipe(pkg_name, version='0.5.2-0'):
+    recipe = yoctoRecipe.__new__(yoctoRecipe)
+    recipe.src_uri = \
+        'https://github.com/ros2-gbp/ament_lint-release/archive/' \
+        'release/bouncy/{0}/{1}.tar.gz'.format(pkg_name, version)
+    return recipe
+
+
+def _get_full_recipe():
+    recipe = _get_recipe('ament_cmake_copyright')
+    recipe.component = 'ament_lint'
+    recipe.oe_component = 'ament-lint'
+    recipe.name = 'ament_cmake_copyright'
+    recipe.distro = 'bouncy'
+    recipe.version = '0.5.2-0'
+    recipe.pkg_xml = b'<package>\n  <license>Apache 2.0</license>\n</package>'
+    recipe.description = 'The ament_cmake_copyright\npackage'
+    recipe.maintainer = 'OSRF <foo@example.com>'
+    recipe.author = None
+    recipe.homepage = None
+    recipe.license = 'Apache 2.0'
+    recipe.build_type = 'ament_cmake'
+    recipe.srcrev = '48bf1aa1cb083a884fbc8520ced00523255aeaed'
+    recipe.skip_keys = set()
+    recipe.contribution = dict()
+    for depends in [
+        'depends', 'buildtool_depends', 'export_depends',
+        'buildtool_export_depends', 'rdepends', 'tdepends'
+    ]:
+        setattr(recipe, depends, set())
+        setattr(recipe, depends + '_external', set())
+    recipe.depends = {'ament_cmake_core'}
+    recipe.buildtool_depends_external = {'cmake'}
+    recipe.rdepends_external = {'python3', 'missing'}
+    return recipe
+
+
+class TestYoctoRecipe(unittest.TestCase):
+    def setUp(self):
+        yoctoRecipe.tag_index.clear()
+        yoctoRecipe.reset()
+
+    def tearDown(self):
+        yoctoRecipe.reset()
+
+    @mock.patch('git.cmd.Git.execute', return_value=_ls_remote_output)
+    def test_get_srcrev(self, execute):
+        """Test resolving the SRCREVs of a repository from one tag list"""
+        self.assertEqual(
+            _get_recipe('ament_cmake_copyright').get_srcrev(),
+            '48bf1aa1cb083a884fbc8520ced00523255aeaed')
+        self.assertEqual(
+            _get_recipe('ament_lint').get_srcrev(),
+            '5e6f7a8b9c0d1e2f3a4b5c6d7e8f9a0b1c2d3e4f')
+        self.assertEqual(
+            _get_recipe('ament_lint', '0.6.0-0').get_srcrev(), 'INVALID')
+        execute.assert_called_once_with([
+            'git', 'ls-remote', '--tags',
+            'https://github.com/ros2-gbp/ament_lint-release'
+        ])
+
+    @mock.patch('superflore.generators.bitbake.yocto_recipe.resolve_dep')
+    def test_render(self, resolve_dep):
+        """Test that rendering changes neither the recipe nor the class"""
+        resolve_dep.side_effect = fake_resolve_dep
+        recipe = _get_full_recipe()
+        text, contribution = recipe.render('Open Source Robotics Foundation')
+        self.assertIn(
+            'DESCRIPTION = "The ament_cmake_copyright package"', text)
+        self.assertIn('${ROS_UNRESOLVED_DEP-missing}', text)
+        self.assertEqual(
+            recipe.description, 'The ament_cmake_copyright\npackage')
+        self.assertEqual(yoctoRecipe.platform_deps, set())
+        self.assertEqual(yoctoRecipe.rosdep_cache, dict())
+        self.assertEqual(recipe.contribution, dict())
+        self.assertEqual(
+            contribution['platform_deps'],
+            {'cmake-native', 'python3', '${ROS_UNRESOLVED_DEP-missing}'})
+        self.assertEqual(
+            contribution['generated_native_recipes'], {'cmake-native'})
+        # rendering again gives the same result
+        self.assertEqual(
+            recipe.render('Open Source Robotics Foundation'),
+            (text, contribution))
+        # the caller adds the contribution
+        recipe.add_contribution(contribution)
+        self.assertEqual(
+            yoctoRecipe.platform_deps, contribution['platform_deps'])
+        self.assertEqual(yoctoRecipe.rosdep_cache['python3'], {'python3'})
+        self.assertEqual(
+            recipe.get_contribution()['platform_deps'],
+            sorted(contribution['platform_deps']))